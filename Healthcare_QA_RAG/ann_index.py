@@ -0,0 +1,273 @@
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_direct_map_lock = threading.Lock()
+
+INDEX_CONFIG_FILE = "index_config.json"
+# 압축 인덱스일 때 재계산용 원본(float32) 벡터 (np.load(mmap_mode="r")로 열어서 필요한 행만 읽음)
+FULL_VECTORS_FILE = "full_vectors.npy"
+
+# 인덱스 종류별 기본 파라미터 (nlist=None이면 벡터 개수에 맞춰 자동 결정)
+DEFAULT_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": None, "nprobe": 8},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivfpq": {"nlist": None, "nprobe": 16, "m": 64, "nbits": 8},
+}
+
+
+# 벡터 압축 (인덱스 종류와 같이 씀, ivfpq는 이미 압축이라 quantizer 없음)
+#   quantizer: "fp16"(1/2) / "int8"(1/4) 스칼라 양자화, dim: 앞쪽 dim개 차원만 쓰고 다시 정규화
+#   (text-embedding-3 모델은 앞쪽 차원만 잘라 써도 되도록 학습됨)
+QUANTIZERS = {"fp16": "QT_fp16", "int8": "QT_8bit"}
+# 압축 인덱스에서 k * RESCORE개를 찾은 뒤 원본 벡터로 거리를 다시 계산해서 상위 k개 (1이면 재계산 안 함)
+DEFAULT_RESCORE = int(os.environ.get("FAISS_RESCORE", 4))
+
+
+# 인덱스 설정 만들기: index_config("hnsw", efSearch=128), index_config("flat", quantizer="int8", dim=512)
+# index_type을 안 주면 환경변수 FAISS_INDEX_TYPE (기본 flat), quantizer/dim은 FAISS_QUANTIZER/FAISS_DIM
+def index_config(index_type=None, quantizer=None, dim=None, **params):
+    index_type = (index_type or os.environ.get("FAISS_INDEX_TYPE", "flat")).lower()
+    if index_type not in DEFAULT_PARAMS:
+        raise ValueError(f"unknown index type {index_type!r}, expected one of {list(DEFAULT_PARAMS)}")
+    quantizer = (quantizer or os.environ.get("FAISS_QUANTIZER") or "").lower() or None
+    if quantizer is not None and (quantizer not in QUANTIZERS or index_type == "ivfpq"):
+        raise ValueError(f"unknown quantizer {quantizer!r} for {index_type}, expected one of {list(QUANTIZERS)}")
+    config = {"type": index_type}
+    config.update(DEFAULT_PARAMS[index_type])
+    config.update(params)
+    config["quantizer"] = quantizer
+    config["dim"] = dim or int(os.environ.get("FAISS_DIM", 0)) or None
+    return config
+
+
+def is_compressed(config):
+    return bool(config.get("quantizer") or config.get("dim"))
+
+
+# 원래 차원(full_dim) 이상으로 자르는 설정은 자르지 않는 것과 같음
+# -> dim=None으로 저장해서 압축 인덱스로 보지 않음 (원본 벡터를 따로 저장하지 않음)
+def fit_dim(config, full_dim):
+    config = dict(config, full_dim=full_dim)
+    if config.get("dim") and config["dim"] >= full_dim:
+        config["dim"] = None
+    return config
+
+
+def _auto_nlist(count):
+    # faiss 권장: 클러스터당 학습 벡터 39개 이상, 대략 4*sqrt(n)
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+# flat 인덱스의 벡터로 설정에 맞는 ANN 인덱스를 학습/생성
+# 반환값: (인덱스, 실제 사용한 파라미터가 채워진 설정)
+def build_index(vectors, config):
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, full_dim = vectors.shape
+    config = fit_dim(config, full_dim)
+    kind = config["type"]
+    # 원래 차원보다 작을 때만 자름
+    dim = config["dim"] or full_dim
+    qtype = getattr(faiss.ScalarQuantizer, QUANTIZERS[config["quantizer"]]) if config.get("quantizer") else None
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim) if qtype is None else faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config["M"]) if qtype is None else faiss.IndexHNSWSQ(dim, qtype, config["M"])
+        index.hnsw.efConstruction = config["efConstruction"]
+    elif kind in ("ivf", "ivfpq"):
+        config["nlist"] = config["nlist"] or _auto_nlist(count)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf" and qtype is not None:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, config["nlist"], qtype)
+        elif kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, config["nlist"])
+        else:
+            # m은 차원의 약수여야 하고, 코드북 학습에는 2^nbits개 이상의 벡터가 필요
+            while dim % config["m"]:
+                config["m"] -= 1
+            while config["nbits"] > 4 and count < 2 ** config["nbits"]:
+                config["nbits"] -= 1
+            index = faiss.IndexIVFPQ(quantizer, dim, config["nlist"], config["m"], config["nbits"])
+        config["trained_on"] = count
+    else:
+        raise ValueError(f"unknown index type {kind!r}")
+
+    if dim < full_dim:
+        # 질문/문서 벡터 모두 앞쪽 dim개 차원 -> 다시 길이 1로 (인덱스가 처리하므로 검색하는 쪽은 그대로)
+        index = faiss.IndexPreTransform(index)
+        index.prepend_transform(faiss.NormalizationTransform(dim, 2.0))
+        index.prepend_transform(faiss.RemapDimensionsTransform(full_dim, dim, False))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index, config
+
+
+# 차원 자르기(IndexPreTransform) 안쪽의 실제 인덱스
+def base_index(index):
+    import faiss
+
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index, config):
+    import faiss
+
+    if config["type"] in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = config["nprobe"]
+    elif config["type"] == "hnsw":
+        base_index(index).hnsw.efSearch = config["efSearch"]
+
+
+def index_vectors(index):
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# 후보(candidates, -1은 없음)를 원본 벡터와의 L2 제곱 거리로 다시 정렬해서 상위 k개
+# 반환값은 index.search와 같은 모양 (distances, indices), 모자란 자리는 inf / -1
+def rescore(full_vectors, queries, candidates, k):
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        ids = ids[ids != -1]
+        if not len(ids):
+            continue
+        # memmap에서는 정렬된 위치로 읽는 것이 빠름
+        ids = np.sort(ids)
+        exact = ((np.asarray(full_vectors[ids]) - query) ** 2).sum(axis=1)
+        best = np.argsort(exact)[:k]
+        distances[row, :len(best)] = exact[best]
+        indices[row, :len(best)] = ids[best]
+    return distances, indices
+
+
+# 벡터스토어 검색 (FAISS.similarity_search_with_score_by_vector 대신 쓰는 공통 경로)
+# 압축 인덱스(vectorstore.full_vectors가 있으면)는 k * rescore개를 찾아 원본 벡터로 다시 계산
+def search_vectors(vectorstore, vectors, k, rescore_factor=DEFAULT_RESCORE):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    if vectorstore._normalize_L2:
+        import faiss
+
+        faiss.normalize_L2(vectors)
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    if full_vectors is None or rescore_factor <= 1:
+        return vectorstore.index.search(vectors, k)
+    _, candidates = vectorstore.index.search(vectors, k * rescore_factor)
+    return rescore(full_vectors, vectors, candidates, k)
+
+
+# 인덱스에 저장된 벡터 복원 (IVF 인덱스는 처음 한 번 id -> 위치 맵을 만듦, IVFPQ/양자화 인덱스는 근사 벡터)
+def reconstruct_vectors(index, ids):
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        with _direct_map_lock:
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.make_direct_map()
+    return index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+
+# 저장된 벡터 (압축 인덱스면 원본 벡터, 아니면 인덱스에서 복원)
+def stored_vectors(vectorstore, ids):
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    if full_vectors is not None:
+        return np.asarray(full_vectors[np.asarray(ids, dtype=np.int64)], dtype=np.float32)
+    return reconstruct_vectors(vectorstore.index, ids)
+
+
+def is_flat(index):
+    import faiss
+
+    return isinstance(index, faiss.IndexFlat)
+
+
+# 벡터를 지우고 추가하는 증분 업데이트가 되는 인덱스: flat과 압축 flat(fp16/int8, 차원 자르기)
+# HNSW는 삭제를 지원하지 않고 IVF는 클러스터가 처음 학습한 벡터 기준이라 다시 빌드
+def supports_update(index):
+    import faiss
+
+    return isinstance(base_index(index), (faiss.IndexFlat, faiss.IndexScalarQuantizer))
+
+
+# 인덱스 메모리 추정: 벡터 수 × 벡터당 코드 크기 (serialize_index처럼 인덱스 전체를 복사하지 않음)
+# HNSW는 저장 벡터 + 이웃 링크, IVF는 리스트에 벡터마다 id(8바이트)가 더 붙음
+def index_memory_bytes(index):
+    import faiss
+
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        links = index.hnsw.neighbors.size() * 4 + index.hnsw.levels.size() * 4
+        return index_memory_bytes(faiss.downcast_index(index.storage)) + links
+    if isinstance(index, faiss.IndexIVF):
+        return index.ntotal * (index.code_size + 8) + index_memory_bytes(faiss.downcast_index(index.quantizer))
+    return index.ntotal * index.sa_code_size()
+
+
+def save_index_config(index_dir, config):
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, INDEX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=1)
+
+
+def load_index_config(index_dir):
+    path = os.path.join(index_dir, INDEX_CONFIG_FILE)
+    if not os.path.exists(path):
+        return {"type": "flat"}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 학습/생성에 영향을 주는 값 (nprobe, efSearch 같은 검색 파라미터는 로드할 때 바꿀 수 있음)
+BUILD_KEYS = ("type", "nlist", "M", "efConstruction", "m", "nbits")
+# 압축 설정은 None(압축 안 함)도 하나의 값
+COMPRESSION_KEYS = ("quantizer", "dim")
+
+
+# 요청한 설정으로 저장된 인덱스를 그대로 쓸 수 있는지
+def same_build_config(saved, requested):
+    if saved.get("full_dim"):
+        requested = fit_dim(requested, saved["full_dim"])
+    for key in BUILD_KEYS:
+        if requested.get(key) is not None and saved.get(key) != requested.get(key):
+            return False
+    for key in COMPRESSION_KEYS:
+        if saved.get(key) != requested.get(key):
+            return False
+    return True
+
+
+# 저장된 설정에 요청한 검색 파라미터를 덮어씀
+def merge_search_params(saved, requested):
+    merged = dict(saved)
+    for key, value in requested.items():
+        if key not in BUILD_KEYS + COMPRESSION_KEYS and value is not None:
+            merged[key] = value
+    return merged
+
+
+# langchain FAISS 벡터스토어의 flat 인덱스를 ANN/압축 인덱스로 교체 (docstore 위치는 그대로)
+# 압축하면 원본 벡터는 vectorstore.full_vectors로 남김 (save_vector_store가 full_vectors.npy로 저장)
+def convert_vector_store(vectorstore, config):
+    config = fit_dim(config, vectorstore.index.d)
+    if config["type"] == "flat" and not is_compressed(config):
+        return config
+    vectors = index_vectors(vectorstore.index)
+    index, config = build_index(vectors, config)
+    vectorstore.index = index
+    vectorstore.full_vectors = vectors if is_compressed(config) else None
+    logger.info("built %s index: %s", config["type"], config)
+    return config
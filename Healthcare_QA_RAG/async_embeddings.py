@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# OpenAI 임베딩 API 한 요청당 제한: 입력 2048개, 전체 30만 토큰
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+# 입력 하나의 토큰 제한 (text-embedding-3-*: 8191), 넘는 텍스트는 이 길이로 나눠서 임베딩한 뒤 평균
+MAX_INPUT_TOKENS = 8191
+
+
+class _AdaptiveLimiter:
+    # 동시에 보내는 요청 수를 owner.concurrency 이하로 유지 (값은 실행 중에 바뀔 수 있음)
+    def __init__(self, owner):
+        self.owner = owner
+        self.in_flight = 0
+        self.cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.owner.concurrency)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+
+class AsyncBatchEmbeddings(Embeddings):
+    # 토큰 수 기준 배치 + 동시 요청 수 제한 + 429 발생 시 적응형 백오프를 하는 임베딩 클라이언트
+    # base_url을 바꾸면 로컬 stub 서버(stub_embedding_server.py)로 오프라인 벤치마크 가능
+    def __init__(
+        self,
+        model="text-embedding-3-small",
+        batch_size=int(os.environ.get("EMBEDDING_BATCH_SIZE", 256)),
+        max_concurrency=int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 8)),
+        max_batch_tokens=MAX_TOKENS_PER_REQUEST // 2,
+        max_retries=8,
+        base_url=None,
+        api_key=None,
+    ):
+        self.model = model
+        self.batch_size = min(batch_size, MAX_INPUTS_PER_REQUEST)
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = min(max_batch_tokens, MAX_TOKENS_PER_REQUEST)
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.api_key = api_key
+        # 현재 허용 동시성: 429가 나면 절반으로, 성공이 이어지면 1씩 다시 늘림 (AIMD)
+        self.concurrency = max_concurrency
+        self._successes = 0
+        self._encoding = None
+        # 이벤트 루프마다 클라이언트/리미터를 따로 둠 (asyncio 객체는 루프에 묶임)
+        self._per_loop = weakref.WeakKeyDictionary()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "texts": 0, "tokens": 0, "seconds": 0.0}
+
+    def _encode(self, text):
+        if self._encoding is None:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return self._encoding.encode(text, disallowed_special=())
+
+    def _count_tokens(self, text):
+        return len(self._encode(text))
+
+    # 입력 하나의 토큰 제한을 넘는 텍스트는 MAX_INPUT_TOKENS 토큰씩 나눔 (OpenAIEmbeddings와 같은 방식)
+    # 반환값: [(조각 텍스트, 토큰 수)]
+    def split_input(self, text):
+        tokens = self._encode(text)
+        if len(tokens) <= MAX_INPUT_TOKENS:
+            return [(text, len(tokens))]
+        return [
+            (self._encoding.decode(tokens[start:start + MAX_INPUT_TOKENS]),
+             len(tokens[start:start + MAX_INPUT_TOKENS]))
+            for start in range(0, len(tokens), MAX_INPUT_TOKENS)
+        ]
+
+    # 입력 개수(batch_size)와 토큰 합(max_batch_tokens)을 모두 넘지 않게 인덱스 묶음 생성
+    # token_counts를 주면 토큰 수를 다시 세지 않음
+    def make_batches(self, texts, token_counts=None):
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = token_counts[i] if token_counts is not None else self._count_tokens(text)
+            if current and (len(current) >= self.batch_size or current_tokens + tokens > self.max_batch_tokens):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._per_loop:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0)
+            self._per_loop[loop] = (client, _AdaptiveLimiter(self))
+        return self._per_loop[loop]
+
+    def _on_success(self):
+        self._successes += 1
+        if self._successes >= 10 and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._successes = 0
+
+    def _on_rate_limit(self):
+        self.stats["rate_limited"] += 1
+        self._successes = 0
+        self.concurrency = max(1, self.concurrency // 2)
+
+    async def _embed_batch(self, texts, tokens):
+        import openai
+
+        client, limiter = self._loop_state()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with limiter:
+                    response = await client.embeddings.create(model=self.model, input=texts)
+                self.stats["requests"] += 1
+                self.stats["texts"] += len(texts)
+                self.stats["tokens"] += tokens
+                self._on_success()
+                return [item.embedding for item in response.data]
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                if isinstance(e, openai.RateLimitError):
+                    self._on_rate_limit()
+                    retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                    if retry_after:
+                        delay = max(delay, float(retry_after))
+                self.stats["retries"] += 1
+                logger.warning("embedding request failed (%s), retry in %.1fs, concurrency=%d",
+                               type(e).__name__, delay, self.concurrency)
+                await asyncio.sleep(delay)
+
+    async def aembed_documents(self, texts):
+        started = time.perf_counter()
+        # 긴 텍스트는 여러 조각으로 나눠 보내고, 조각 벡터를 토큰 수로 가중 평균해서 다시 정규화
+        pieces, spans = [], []
+        for text in texts:
+            start = len(pieces)
+            pieces.extend(self.split_input(text))
+            spans.append((start, len(pieces)))
+        piece_texts = [text for text, _ in pieces]
+        piece_vectors = [None] * len(pieces)
+
+        async def run(indices, tokens):
+            result = await self._embed_batch([piece_texts[i] for i in indices], tokens)
+            for i, vector in zip(indices, result):
+                piece_vectors[i] = vector
+
+        batches = self.make_batches(piece_texts, [tokens for _, tokens in pieces])
+        await asyncio.gather(*(run(indices, tokens) for indices, tokens in batches))
+        self.stats["seconds"] += time.perf_counter() - started
+        if len(pieces) == len(texts):
+            return piece_vectors
+
+        vectors = []
+        for start, end in spans:
+            if end - start == 1:
+                vectors.append(piece_vectors[start])
+                continue
+            weights = [tokens for _, tokens in pieces[start:end]]
+            average = np.average(piece_vectors[start:end], axis=0, weights=weights)
+            vectors.append((average / np.linalg.norm(average)).tolist())
+        return vectors
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts):
+        return run_sync(self.aembed_documents(texts))
+
+    def embed_query(self, text):
+        return run_sync(self.aembed_query(text))
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+# 동기 호출(embed_query 등)이 같이 쓰는 이벤트 루프 (데몬 스레드에서 계속 실행)
+# 호출마다 asyncio.run으로 새 루프를 만들면 루프마다 AsyncOpenAI 클라이언트와 TLS 연결을 새로 만들게 되므로
+# 루프 하나를 계속 써서 클라이언트/연결을 재사용
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-embeddings", daemon=True).start()
+        return _loop
+
+
+# 동기 코드에서 코루틴 실행 (백그라운드 루프에 넘기고 결과를 기다림)
+def run_sync(coro):
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # 백그라운드 루프 안에서 다시 동기 호출하면 자기 자신을 기다리며 멈추므로 별도 스레드의 새 루프에서 실행
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coro).result()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+# (청크, ID) 배치 스트림을 받아 max_pending개까지 동시에 임베딩하고, 끝나는 순서대로 (청크, ID, 벡터) 반환
+# 다음 배치를 꺼내는 동안(PDF 추출 대기) 이벤트 루프가 막히지 않도록 별도 스레드에서 next() 호출
+async def aembed_batches(batches, embeddings, max_pending=4):
+    iterator = iter(batches)
+    pending = set()
+    exhausted = False
+
+    async def embed(docs, ids):
+        vectors = await embeddings.aembed_documents([doc.page_content for doc in docs])
+        return docs, ids, vectors
+
+    while pending or not exhausted:
+        while not exhausted and len(pending) < max_pending:
+            batch = await asyncio.to_thread(next, iterator, None)
+            if batch is None:
+                exhausted = True
+            else:
+                pending.add(asyncio.ensure_future(embed(*batch)))
+        if not pending:
+            break
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+
+
+# 오프라인 처리량 측정: python stub_embedding_server.py 실행 후
+# python async_embeddings.py --base-url http://127.0.0.1:8765/v1 --texts 5000
+def main():
+    parser = argparse.ArgumentParser(description="async embedding throughput benchmark")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8765/v1")
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--chars", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["insulin", "dose", "renal", "hepatic", "adverse", "effect", "tablet", "infusion", "mg", "daily"]
+    texts = [
+        " ".join(rng.choice(words) for _ in range(args.chars // 7))[:args.chars] + f" #{i}"
+        for i in range(args.texts)
+    ]
+    for concurrency in args.concurrency:
+        embedder = AsyncBatchEmbeddings(
+            batch_size=args.batch_size, max_concurrency=concurrency, base_url=args.base_url, api_key="stub"
+        )
+        started = time.perf_counter()
+        embedder.embed_documents(texts)
+        elapsed = time.perf_counter() - started
+        print(
+            f"concurrency={concurrency:>3} batch={args.batch_size} "
+            f"{args.texts / elapsed:8.1f} texts/s  {embedder.stats['tokens'] / elapsed:10.0f} tokens/s  "
+            f"requests={embedder.stats['requests']} retries={embedder.stats['retries']} "
+            f"rate_limited={embedder.stats['rate_limited']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+from ann_index import search_vectors, stored_vectors
+from relevance import ScoredRetriever, scored_documents
+from tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+# 0이면 묶지 않고 요청마다 바로 검색
+DEFAULT_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", 5.0))
+DEFAULT_MAX_BATCH = int(os.environ.get("QUERY_BATCH_MAX", 32))
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("QUERY_BATCH_IN_FLIGHT", 4))
+
+
+class QueryBatcher:
+    # 동시에 들어온 질문들을 window_ms 동안(또는 max_batch개까지) 모아서
+    # 임베딩 API 한 번 + FAISS search 한 번(행렬)으로 처리하고 결과를 각 요청에 돌려줌
+    # 백그라운드 스레드 하나가 묶음을 모으고, 묶음 처리는 max_in_flight개까지 동시에
+    # (모두 처리 중이면 다음 질문들은 큐에 쌓여서 더 큰 묶음이 됨)
+    # Streamlit 세션 스레드/서버 executor 어디서 불러도 됨
+    # vectorstore 자리에 index_versions.IndexHandle을 넘기면 묶음마다 그 시점의 버전으로 검색
+    # reranker(rerank.MMRReranker)를 주면 묶음 검색은 fetch_k개로 하고 질문마다 MMR로 reranker.k개
+    def __init__(self, vectorstore, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, reranker=None):
+        self.vectorstore = vectorstore
+        self.reranker = reranker
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_in_flight, thread_name_prefix="query-batch")
+        self._worker = None
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "batches": 0, "max_batch_size": 0}
+
+    def _embed(self, vectorstore, texts):
+        embeddings = vectorstore.embedding_function
+        # CachedEmbeddings.embed_queries: 질문 벡터는 디스크 캐시에 넣지 않음
+        embed = getattr(embeddings, "embed_queries", None) or embeddings.embed_documents
+        return embed(texts)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_ms / 1000
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, batch):
+        # 묶음 하나는 한 버전으로만 검색 (처리 중에 인덱스가 교체되어도 섞이지 않게)
+        vectorstore = getattr(self.vectorstore, "vectorstore", self.vectorstore)
+        try:
+            started = time.perf_counter()
+            vectors = np.asarray(self._embed(vectorstore, [query for query, _, _ in batch]), dtype=np.float32)
+            embed_ms = (time.perf_counter() - started) * 1000
+            logger.debug("query batch: %d queries, embedded in %.1f ms", len(batch), embed_ms)
+            fetch_k = max(k for _, k, _ in batch)
+            if self.reranker is not None:
+                fetch_k = max(fetch_k, self.reranker.fetch_k)
+            # 압축 인덱스면 원본 벡터로 다시 계산한 거리 (ann_index.search_vectors)
+            distances, indices = search_vectors(vectorstore, vectors, fetch_k)
+            for vector, distance_row, row, (_, k, future) in zip(vectors, distances, indices, batch):
+                candidates = [(i, distance) for i, distance in zip(row, distance_row) if i != -1]
+                if self.reranker is not None and candidates:
+                    selected = self.reranker.select(
+                        vector, stored_vectors(vectorstore, [i for i, _ in candidates])
+                    )
+                    candidates = [candidates[p] for p in selected]
+                else:
+                    candidates = candidates[:k]
+                # 문서마다 관련도(metadata["relevance_score"])를 붙여서 반환 (relevance.RelevanceGate)
+                docs = scored_documents(vectorstore, [
+                    (vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]), distance)
+                    for i, distance in candidates
+                ])
+                future.set_result((docs, embed_ms, len(batch)))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.stats["queries"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+
+    def _loop(self):
+        while True:
+            self._slots.acquire()
+            self._pool.submit(self._run, self._collect())
+
+    def submit(self, query, k=4):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, name="query-batcher", daemon=True)
+                self._worker.start()
+        future = Future()
+        self._queue.put((query, k, future))
+        return future
+
+    # 쿼리 임베딩 시간은 현재 요청 trace에 embed_query로 기록 (batch: 같이 처리된 질문 수)
+    def _finish(self, result):
+        docs, embed_ms, batch_size = result
+        trace = current_trace()
+        if trace is not None:
+            trace.record("embed_query", embed_ms, batch=batch_size)
+        return docs
+
+    def search(self, query, k=4):
+        return self._finish(self.submit(query, k).result())
+
+    async def asearch(self, query, k=4):
+        return self._finish(await asyncio.wrap_future(self.submit(query, k)))
+
+
+class BatchedRetriever(BaseRetriever):
+    # vectorstore.as_retriever() 대신 쓰는 검색기 (similarity 검색, 상위 k개)
+    batcher: QueryBatcher
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.batcher.search(query, self.k)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return await self.batcher.asearch(query, self.k)
+
+
+# window_ms가 0이면 요청마다 바로 검색 (IndexHandle이면 그 검색기)
+def batched_retriever(vectorstore, k=4, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH,
+                      max_in_flight=DEFAULT_MAX_IN_FLIGHT, reranker=None):
+    if window_ms <= 0:
+        if hasattr(vectorstore, "similarity_search_with_score"):
+            return ScoredRetriever(vectorstore=vectorstore, k=k, reranker=reranker)
+        return vectorstore.as_retriever(search_kwargs={"k": k}, reranker=reranker)
+    return BatchedRetriever(
+        batcher=QueryBatcher(vectorstore, window_ms, max_batch, max_in_flight, reranker=reranker), k=k
+    )
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ann_index import (
+    DEFAULT_RESCORE, FULL_VECTORS_FILE, apply_search_params, build_index, index_config, index_memory_bytes, rescore,
+)
+
+# 비교할 설정 목록: (인덱스 종류, 검색 파라미터)
+CONFIGS = [
+    ("flat", {}),
+    ("ivf", {"nprobe": 4}),
+    ("ivf", {"nprobe": 8}),
+    ("ivf", {"nprobe": 16}),
+    ("hnsw", {"efSearch": 32}),
+    ("hnsw", {"efSearch": 64}),
+    ("hnsw", {"efSearch": 128}),
+    ("ivfpq", {"nprobe": 8}),
+    ("ivfpq", {"nprobe": 16}),
+]
+
+# 압축 설정 비교 (flat 기준): (이름, index_config 인자)
+COMPRESSION_CONFIGS = [
+    ("fp16", {"quantizer": "fp16"}),
+    ("int8", {"quantizer": "int8"}),
+    ("dim512", {"dim": 512}),
+    ("fp16+dim512", {"quantizer": "fp16", "dim": 512}),
+    ("int8+dim512", {"quantizer": "int8", "dim": 512}),
+    ("int8+dim256", {"quantizer": "int8", "dim": 256}),
+]
+
+
+def load_vectors(index_dir):
+    import faiss
+
+    # 압축 인덱스면 저장된 원본 벡터
+    if os.path.exists(os.path.join(index_dir, FULL_VECTORS_FILE)):
+        return np.load(os.path.join(index_dir, FULL_VECTORS_FILE))
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(count, dim, seed=0):
+    # 실제 임베딩처럼 몇 개의 주제 군집 주변에 모인 단위 벡터
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 200), dim))
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+# 저장된 벡터에 약간의 잡음을 섞어 "비슷한 질문" 쿼리를 만듦
+def make_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(len(vectors), size=count)]
+    queries = picked + 0.05 * rng.normal(size=picked.shape).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def run(vectors, queries, k):
+    flat, _ = build_index(vectors, index_config("flat"))
+    _, truth = flat.search(queries, k)
+
+    built = {}
+    rows = []
+    for kind, search_params in CONFIGS:
+        if kind not in built:
+            started = time.perf_counter()
+            built[kind] = build_index(vectors, index_config(kind)) + (time.perf_counter() - started,)
+        index, config, build_seconds = built[kind]
+        config = dict(config, **search_params)
+        apply_search_params(index, config)
+
+        # 질문 하나씩 검색하는 실제 서빙 경로 기준으로 지연 측정
+        latencies, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append(ids[0])
+        rows.append({
+            "type": kind,
+            "params": search_params,
+            "recall": recall_at_k(found, truth, k),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "memory_mb": index_memory_bytes(index) / 1024 / 1024,
+            "build_s": build_seconds,
+        })
+    return rows
+
+
+# 압축 인덱스의 메모리/recall: 압축 인덱스만으로 찾은 상위 k개와, k * rescore_factor개를 원본 벡터로 다시 계산한 상위 k개
+def run_compression(vectors, queries, k, rescore_factor):
+    flat, _ = build_index(vectors, index_config("flat"))
+    _, truth = flat.search(queries, k)
+    flat_bytes = index_memory_bytes(flat)
+
+    rows = []
+    for name, params in COMPRESSION_CONFIGS:
+        dim = params.get("dim")
+        if dim is not None and dim >= vectors.shape[1]:
+            continue
+        index, _ = build_index(vectors, index_config("flat", **params))
+        found, rescored, latencies, rescored_latencies = [], [], [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append(ids[0])
+
+            started = time.perf_counter()
+            _, candidates = index.search(query[None, :], k * rescore_factor)
+            _, ids = rescore(vectors, query[None, :], candidates, k)
+            rescored_latencies.append((time.perf_counter() - started) * 1000)
+            rescored.append(ids[0])
+        memory = index_memory_bytes(index)
+        rows.append({
+            "name": name,
+            "memory_mb": memory / 1024 / 1024,
+            "saved": 1 - memory / flat_bytes,
+            "recall": recall_at_k(found, truth, k),
+            "rescored_recall": recall_at_k(rescored, truth, k),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "rescored_p50_ms": float(np.percentile(rescored_latencies, 50)),
+        })
+    return flat_bytes, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS index type recall/latency benchmark")
+    parser.add_argument("index_dir", nargs="?", help="저장된 인덱스 폴더 (없으면 합성 벡터 사용)")
+    parser.add_argument("--synthetic", type=int, default=20000, help="합성 벡터 개수")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--compression", action="store_true",
+                        help="fp16/int8 양자화, 차원 자르기의 메모리/recall 비교 (원본 벡터 재계산 포함)")
+    parser.add_argument("--rescore", type=int, default=DEFAULT_RESCORE, help="--compression: k * rescore개를 재계산")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.index_dir) if args.index_dir else synthetic_vectors(args.synthetic, args.dim)
+    queries = make_queries(vectors, args.queries)
+    print(f"{len(vectors)} vectors, dim={vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    if args.compression:
+        flat_bytes, rows = run_compression(vectors, queries, args.k, args.rescore)
+        print(f"flat: {flat_bytes / 1024 / 1024:.1f} MB, 원본 벡터 재계산: 상위 {args.k * args.rescore}개")
+        print(f"{'config':<13}{'mem MB':>8}{'saved':>8}{'recall@k':>10}{'p50 ms':>8}{'rescored':>10}{'p50 ms':>8}")
+        for row in rows:
+            print(
+                f"{row['name']:<13}{row['memory_mb']:>8.1f}{row['saved']:>8.0%}{row['recall']:>10.3f}"
+                f"{row['p50_ms']:>8.3f}{row['rescored_recall']:>10.3f}{row['rescored_p50_ms']:>8.3f}"
+            )
+        return
+    print(f"{'type':<7}{'params':<18}{'recall@k':>9}{'p50 ms':>9}{'p99 ms':>9}{'mem MB':>9}{'build s':>9}")
+    for row in run(vectors, queries, args.k):
+        params = ",".join(f"{k}={v}" for k, v in row["params"].items()) or "-"
+        print(
+            f"{row['type']:<7}{params:<18}{row['recall']:>9.3f}{row['p50_ms']:>9.3f}"
+            f"{row['p99_ms']:>9.3f}{row['memory_mb']:>9.1f}{row['build_s']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from ann_index import index_memory_bytes
+from batching import batched_retriever
+from context_packer import ContextPacker
+from ingest import iter_cached_pdf_pages, peak_rss_mb
+from query_prep import QueryPreparer
+from rerank import MMRReranker
+from streaming import AnswerStream
+from structure_splitter import StructureTextSplitter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+
+# 벤치마크 대상: (이름, PDF 경로, splitter, 질문 목록) - 청크 설정은 각 앱과 같게
+DATASETS = [
+    ("who", os.path.join(BASE_DIR, "who.pdf"), StructureTextSplitter("monograph", 1000), [
+        "What are the adverse effects of morphine?",
+        "What is the recommended dose of amoxicillin for children?",
+        "Which drugs are used for chronic obstructive pulmonary disease (COPD)?",
+        "What are the contraindications of aspirin?",
+    ]),
+    ("vocab", os.path.join(BASE_DIR, "Healthcare_Vocab.pdf"), StructureTextSplitter("monograph", 1000), [
+        "간경화의 영어 의학 용어는?",
+        "What is the Korean term for myocardial infarction?",
+        "상기도 감염",
+        "hypertension",
+    ]),
+    ("constitution", os.path.join(BASE_DIR, "..", "data", "대한민국헌법(헌법)(제00010호)(19880225).pdf"),
+     StructureTextSplitter("constitution", 1000), [
+        "제10조의 내용은?",
+        "대통령의 임기는 몇 년인가요?",
+        "국회의원의 불체포특권에 대해 알려줘",
+        "헌법 개정 절차는?",
+    ]),
+]
+
+
+class StubEmbeddings(Embeddings):
+    # 텍스트 해시로 만든 결정적인 단위 벡터 (OpenAI 호출 없음)
+    # latency_ms: API 요청 한 번의 지연, batch_size개씩 한 요청으로 묶인다고 가정
+    def __init__(self, dim=1536, latency_ms=0.0, batch_size=256):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.batch_size = batch_size
+        self.requests = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _wait(self, count):
+        requests = math.ceil(count / self.batch_size)
+        self.requests += requests
+        if self.latency_ms:
+            time.sleep(requests * self.latency_ms / 1000)
+
+    def embed_documents(self, texts):
+        self._wait(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self._wait(1)
+        return self._vector(text)
+
+
+class HashingEmbeddings(Embeddings):
+    # 단어 해시 bag-of-words 단위 벡터 (OpenAI 호출 없음)
+    # StubEmbeddings와 달리 내용이 겹치는 청크끼리 실제로 비슷해서 중복/다양성 비교에 씀
+    def __init__(self, dim=1536):
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class StubChatModel(BaseChatModel):
+    # 질문과 컨텍스트 앞부분으로 만든 결정적인 답변 (OpenAI 호출 없음)
+    # latency_ms: 첫 토큰까지 지연, ms_per_token: 이후 토큰(단어)당 지연
+    latency_ms: float = 0.0
+    ms_per_token: float = 0.0
+    answer_tokens: int = 64
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def _tokens(self, messages):
+        words = " ".join(str(message.content) for message in messages).split()
+        return words[-self.answer_tokens:]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens(messages)
+        time.sleep((self.latency_ms + self.ms_per_token * len(tokens)) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(self.ms_per_token / 1000)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=(" " if i else "") + token))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+# 앱과 같은 구성: 히스토리 반영 검색기 + stuff 문서 체인 + retrieval 체인
+def build_chain(llm, retriever):
+    contextualize_q_prompt = ChatPromptTemplate.from_messages([
+        ("system", "Given a chat history and the latest user question, formulate a standalone question."),
+        MessagesPlaceholder("history"),
+        ("human", "{input}"),
+    ])
+    qa_prompt = ChatPromptTemplate.from_messages([
+        ("system", "Use the following pieces of retrieved context to answer the question.\n\n{context}"),
+        MessagesPlaceholder("history"),
+        ("human", "{input}"),
+    ])
+    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    return create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+
+def run_dataset(name, pdf_path, text_splitter, questions, embeddings, llm, rounds):
+    started = time.perf_counter()
+    pages = list(iter_cached_pdf_pages([pdf_path]))
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunks = text_splitter.split_documents(pages)
+    split_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorstore = FAISS.from_documents(chunks, embeddings)
+    index_s = time.perf_counter() - started
+    ingest_s = load_s + split_s + index_s
+
+    chain = build_chain(llm, vectorstore.as_retriever())
+    latencies, ttfts, context_chars = [], [], []
+    for _ in range(rounds):
+        for question in questions:
+            response = AnswerStream(chain, {"input": question, "history": []})
+            for _ in response:
+                pass
+            latencies.append(response.total_ms)
+            ttfts.append(response.ttft_ms or response.total_ms)
+            context_chars.append(sum(len(doc.page_content) for doc in response.context))
+
+    return {
+        "pages": len(pages),
+        "chunks": len(chunks),
+        "load_s": load_s,
+        "split_s": split_s,
+        "index_s": index_s,
+        "pages_per_sec": len(pages) / ingest_s,
+        "chunks_per_sec": len(chunks) / ingest_s,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "ttft_p50_ms": float(np.percentile(ttfts, 50)),
+        "avg_context_chars": float(np.mean(context_chars)),
+        "index_mb": index_memory_bytes(vectorstore.index) / 1024 / 1024,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# 검색 전 질문 준비 비교 (첫 질문 / 이전 대화에 기대는 후속 질문)
+# 기존: 번역 호출 -> 대화 재작성 호출 (create_history_aware_retriever, 대화가 있을 때)
+# query_prep: 번역 + 재작성을 한 번에, 대화가 없으면 재작성 없이 번역만
+def query_prep_report(llm, rounds):
+    translation_chain = ChatPromptTemplate.from_messages([
+        ("human", "Translate this medical question into English:\n{input}"),
+    ]) | llm | StrOutputParser()
+    rewrite_chain = ChatPromptTemplate.from_messages([
+        ("system", "Given a chat history and the latest user question, formulate a standalone question."),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]) | llm | StrOutputParser()
+    preparer = QueryPreparer(llm)
+    question = "그 약의 부작용은?"
+    history = [HumanMessage("모르핀은 어떤 약인가요?"), AIMessage("모르핀(morphine)은 중등도~중증 통증에 쓰는 진통제입니다.")]
+
+    report = {}
+    for label, turn_history in (("first_turn", []), ("follow_up", history)):
+        before, after = [], []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            query = translation_chain.invoke({"input": question})
+            if turn_history:
+                rewrite_chain.invoke({"input": query, "chat_history": turn_history})
+            before.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            preparer.prepare(question, turn_history)
+            after.append((time.perf_counter() - started) * 1000)
+        report[label] = {
+            "before_llm_calls": 1 + bool(turn_history),
+            "before_p50_ms": float(np.percentile(before, 50)),
+            "after_llm_calls": 1,
+            "after_p50_ms": float(np.percentile(after, 50)),
+        }
+    return report
+
+
+# StubEmbeddings / AsyncBatchEmbeddings(stub 서버) 요청 수 (429 재시도 포함)
+def _embedding_requests(embeddings):
+    if hasattr(embeddings, "stats"):
+        return embeddings.stats["requests"] + embeddings.stats["retries"]
+    return embeddings.requests
+
+
+# 동시 요청 처리량 비교: 요청마다 임베딩/검색 vs QueryBatcher로 묶어서 (clients개 스레드가 각자 queries번 검색)
+def batching_report(vectorstore, questions, clients, queries, window_ms):
+    report = {}
+    for label, window in (("per_request", 0), ("batched", window_ms)):
+        retriever = batched_retriever(vectorstore, window_ms=window)
+        requests_before = _embedding_requests(vectorstore.embedding_function)
+        latencies = []
+        lock = threading.Lock()
+
+        def client(offset):
+            for i in range(queries):
+                started = time.perf_counter()
+                # 같은 질문이 몰리지 않도록 번호를 붙임
+                retriever.invoke(f"{questions[(offset + i) % len(questions)]} #{offset}-{i}")
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        report[label] = {
+            "queries_per_sec": len(latencies) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "embed_requests": _embedding_requests(vectorstore.embedding_function) - requests_before,
+        }
+    return report
+
+
+# 상위 k개 vs fetch_k개에서 MMR로 고른 문서 비교 (질문 임베딩은 미리 해두고 검색 시간만)
+# prompt_tokens: ContextPacker로 합친 뒤 프롬프트에 들어가는 문서 토큰 수
+# redundancy: 고른 문서끼리의 평균 코사인 유사도 (높을수록 비슷한 청크가 중복)
+def mmr_report(vectorstore, questions, rounds, fetch_k, k=4):
+    packer = ContextPacker()
+    embeddings = vectorstore.embedding_function
+    vectors = [embeddings.embed_query(question) for question in questions]
+    variants = [("top_k", None)] + [(f"mmr_k{n}", MMRReranker(n, fetch_k)) for n in (k, k - 1)]
+
+    def search(reranker, vector):
+        if reranker is None:
+            return [doc for doc, _ in vectorstore.similarity_search_with_score_by_vector(vector, k)]
+        return [doc for doc, _ in reranker.search(vectorstore, vector)]
+
+    report = {}
+    for label, reranker in variants:
+        latencies, tokens, redundancy = [], [], []
+        for _ in range(rounds):
+            for vector in vectors:
+                started = time.perf_counter()
+                search(reranker, vector)
+                latencies.append((time.perf_counter() - started) * 1000)
+        for vector in vectors:
+            docs = search(reranker, vector)
+            tokens.append(sum(packer.count_tokens(doc.page_content) for doc in packer.pack(docs)))
+            doc_vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]))
+            similarity = doc_vectors @ doc_vectors.T
+            pairs = len(docs) * (len(docs) - 1)
+            redundancy.append((similarity.sum() - np.trace(similarity)) / pairs if pairs else 0.0)
+        report[label] = {
+            "search_p50_ms": float(np.percentile(latencies, 50)),
+            "prompt_tokens": float(np.mean(tokens)),
+            "redundancy": float(np.mean(redundancy)),
+        }
+    return report
+
+
+# 값이 클수록 좋은 지표 (나머지는 작을수록 좋음)
+HIGHER_IS_BETTER = ("pages_per_sec", "chunks_per_sec")
+# 비교에서 빼는 지표 (데이터 크기 자체)
+NOT_COMPARED = ("pages", "chunks")
+# 이보다 작은 절대 차이는 측정 잡음으로 보고 무시 (지표 이름 끝부분 기준)
+MIN_DELTA = {"_s": 0.05, "_ms": 2.0, "_mb": 1.0}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            old = baseline.get(name, {}).get(key)
+            if key in NOT_COMPARED or not old:
+                continue
+            min_delta = next((d for suffix, d in MIN_DELTA.items() if key.endswith(suffix)), 0.0)
+            if abs(value - old) < min_delta:
+                continue
+            change = (value - old) / old
+            worse = -change if key in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append((name, key, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline RAG benchmark (stub embeddings/LLM, no OpenAI calls)")
+    parser.add_argument("--datasets", nargs="*", default=[d[0] for d in DATASETS])
+    parser.add_argument("--rounds", type=int, default=3, help="질문 목록 반복 횟수")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="이번 결과를 기준값으로 저장")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="이 비율 이상 나빠지면 회귀로 표시")
+    parser.add_argument("--query-prep", action="store_true",
+                        help="검색 전 LLM 호출(번역/대화 재작성) 비교만 실행 (--llm-latency-ms와 함께)")
+    parser.add_argument("--batching", action="store_true",
+                        help="동시 검색 처리량 비교만 실행 (요청별 vs 묶음, --embed-latency-ms와 함께)")
+    parser.add_argument("--clients", type=int, default=32, help="--batching: 동시 요청 스레드 수")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="--batching: 묶는 시간")
+    parser.add_argument("--mmr", action="store_true",
+                        help="상위 k개 vs MMR 재정렬 비교만 실행 (검색 시간, 프롬프트 토큰, 중복도)")
+    parser.add_argument("--fetch-k", type=int, default=20, help="--mmr: MMR 후보 수")
+    parser.add_argument("--embedding-base-url", default=None,
+                        help="--batching: 질문 임베딩을 이 주소의 stub 서버(stub_embedding_server.py)로 보냄")
+    args = parser.parse_args()
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+
+    settings = {
+        "embed_latency_ms": args.embed_latency_ms,
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_ms_per_token": args.llm_ms_per_token,
+        "rounds": args.rounds,
+    }
+    embeddings = StubEmbeddings(latency_ms=args.embed_latency_ms)
+    llm = StubChatModel(latency_ms=args.llm_latency_ms, ms_per_token=args.llm_ms_per_token)
+
+    if args.query_prep:
+        for label, row in query_prep_report(llm, args.rounds).items():
+            print(
+                f"{label:<11} before {row['before_p50_ms']:7.1f} ms ({row['before_llm_calls']} LLM calls)"
+                f"  after {row['after_p50_ms']:7.1f} ms ({row['after_llm_calls']} LLM call)"
+                f"  saved {row['before_p50_ms'] - row['after_p50_ms']:7.1f} ms"
+            )
+        return
+
+    if args.mmr:
+        for name, pdf_path, text_splitter, questions in DATASETS:
+            if name not in args.datasets:
+                continue
+            vectorstore = FAISS.from_documents(text_splitter.split_documents(list(iter_cached_pdf_pages([pdf_path]))), HashingEmbeddings())
+            report = mmr_report(vectorstore, questions, args.rounds, args.fetch_k)
+            for label, row in report.items():
+                print(
+                    f"{name:<13} {label:<7} search p50 {row['search_p50_ms']:6.2f} ms"
+                    f" (+{row['search_p50_ms'] - report['top_k']['search_p50_ms']:5.2f})"
+                    f"  prompt {row['prompt_tokens']:7.1f} tokens"
+                    f" (saved {report['top_k']['prompt_tokens'] - row['prompt_tokens']:6.1f})"
+                    f"  redundancy {row['redundancy']:.3f}"
+                )
+        return
+
+    if args.batching:
+        for name, pdf_path, text_splitter, questions in DATASETS:
+            if name not in args.datasets:
+                continue
+            vectorstore = FAISS.from_documents(text_splitter.split_documents(list(iter_cached_pdf_pages([pdf_path]))), embeddings)
+            if args.embedding_base_url:
+                from async_embeddings import AsyncBatchEmbeddings
+
+                # 앱과 같은 질문 임베딩 경로 (HTTP 요청, 동시 요청 제한, 429 백오프)
+                vectorstore.embedding_function = AsyncBatchEmbeddings(base_url=args.embedding_base_url, api_key="stub")
+            for label, row in batching_report(vectorstore, questions, args.clients, 10 * args.rounds,
+                                              args.batch_window_ms).items():
+                print(
+                    f"{name:<13} {label:<12} {row['queries_per_sec']:8.1f} queries/s"
+                    f"  p50 {row['p50_ms']:7.1f} ms p95 {row['p95_ms']:7.1f} ms"
+                    f"  {row['embed_requests']:>5} embedding requests"
+                )
+        return
+
+    # faiss/체인 첫 실행 비용이 처음 측정하는 데이터셋에만 들어가지 않도록 한 번 미리 실행
+    warmup = FAISS.from_texts(["warmup"], embeddings)
+    for _ in AnswerStream(build_chain(llm, warmup.as_retriever()), {"input": "warmup", "history": []}):
+        pass
+
+    results = {}
+    for name, pdf_path, text_splitter, questions in DATASETS:
+        if name not in args.datasets:
+            continue
+        results[name] = run_dataset(name, pdf_path, text_splitter, questions, embeddings, llm, args.rounds)
+        metrics = results[name]
+        rss = f"{metrics['peak_rss_mb']:7.1f} MB" if metrics["peak_rss_mb"] is not None else "    n/a"
+        print(
+            f"{name:<13} {metrics['pages']:>5} pages {metrics['chunks']:>6} chunks"
+            f"  ingest {metrics['pages_per_sec']:8.1f} pages/s {metrics['chunks_per_sec']:8.1f} chunks/s"
+            f"  query p50 {metrics['query_p50_ms']:7.1f} ms p95 {metrics['query_p95_ms']:7.1f} ms"
+            f"  index {metrics['index_mb']:6.1f} MB  peak RSS {rss}"
+        )
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=1, ensure_ascii=False)
+        print(f"saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("no baseline yet (run with --save-baseline)")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["settings"] != settings:
+        print(f"warning: baseline settings differ: {baseline['settings']}")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for name, key, old, value, change in regressions:
+        print(f"REGRESSION {name}.{key}: {old:.2f} -> {value:.2f} ({change:+.0%})")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage, messages_from_dict, message_to_dict
+from langchain_core.output_parsers import StrOutputParser
+
+from tracing import trace_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.environ.get("CHAT_STORE_PATH", ".cache/chats.sqlite")
+# 프롬프트에 넣는 최근 대화의 토큰 수 상한 (넘으면 오래된 대화를 요약으로 바꿈)
+DEFAULT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", 1500))
+SUMMARY_PREFIX = "이전 대화 요약: "
+# 요약에 남길 내용 (챗봇마다 다름: 헌법 챗봇은 조문 번호/주제)
+MEDICAL_SUMMARY_FOCUS = "언급된 약품/질병 이름, 사용자가 궁금해한 점"
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_encoding.encode(text))
+
+
+class ChatStore:
+    # 채팅 목록/메시지/요약을 sqlite에 저장 (브라우저 localStorage, st.session_state 대신 서버 쪽에 보관)
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chats ("
+            " id TEXT PRIMARY KEY, title TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '', summarized_upto INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, message TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL, created REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS messages_chat ON messages (chat_id, id);"
+            "CREATE INDEX IF NOT EXISTS chats_updated ON chats (updated);"
+        )
+        self._conn.commit()
+
+    def create_chat(self, title="새 채팅", chat_id=None):
+        chat_id = chat_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO chats (id, title, created, updated) VALUES (?, ?, ?, ?)",
+                (chat_id, title, now, now),
+            )
+            self._conn.commit()
+        return chat_id
+
+    def count_chats(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    # 최근에 대화한 max_chats개만 남기고 나머지 채팅은 메시지까지 삭제, 반환값: 삭제한 채팅 수
+    def prune(self, max_chats):
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT id FROM chats ORDER BY updated DESC LIMIT -1 OFFSET ?", (max_chats,)
+            ).fetchall()]
+            for chat_id in stale:
+                self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            self._conn.commit()
+        return len(stale)
+
+    def has_chat(self, chat_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone() is not None
+
+    # 최근에 대화한 순서로 한 페이지 (page는 0부터), 반환값: (채팅 목록, 전체 채팅 수)
+    def list_chats(self, page=0, page_size=10):
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT id, title, updated FROM chats ORDER BY updated DESC LIMIT ? OFFSET ?",
+                (page_size, page * page_size),
+            ).fetchall()
+        return [{"id": row[0], "title": row[1], "updated": row[2]} for row in rows], total
+
+    def rename_chat(self, chat_id, title):
+        with self._lock:
+            self._conn.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
+            self._conn.commit()
+
+    def delete_chat(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            self._conn.commit()
+
+    def add_message(self, chat_id, message):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (chat_id, message, tokens, created) VALUES (?, ?, ?, ?)",
+                (chat_id, json.dumps(message_to_dict(message), ensure_ascii=False), count_tokens(str(message.content)), now),
+            )
+            self._conn.execute("UPDATE chats SET updated = ? WHERE id = ?", (now, chat_id))
+            self._conn.commit()
+
+    # [(id, message, tokens)] (after_id보다 뒤의 메시지만)
+    def messages(self, chat_id, after_id=0):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, message, tokens FROM messages WHERE chat_id = ? AND id > ? ORDER BY id",
+                (chat_id, after_id),
+            ).fetchall()
+        return [(row[0], messages_from_dict([json.loads(row[1])])[0], row[2]) for row in rows]
+
+    def summary(self, chat_id):
+        with self._lock:
+            row = self._conn.execute("SELECT summary, summarized_upto FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return row if row else ("", 0)
+
+    def set_summary(self, chat_id, summary, upto_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chats SET summary = ?, summarized_upto = ? WHERE id = ?", (summary, upto_id, chat_id)
+            )
+            self._conn.commit()
+
+    def clear(self, chat_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("UPDATE chats SET summary = '', summarized_upto = 0 WHERE id = ?", (chat_id,))
+            self._conn.commit()
+
+
+# topic: 챗봇 설명, focus: 요약에 남길 내용
+def create_summarizer(llm, topic="의료 Q&A 챗봇", focus=MEDICAL_SUMMARY_FOCUS):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", f"다음은 {topic}과 사용자의 이전 대화입니다. 기존 요약과 새 대화를 합쳐 "
+                   f"이후 질문을 이해하는 데 필요한 내용({focus})만 "
+                   "5문장 이내의 한국어로 요약하세요.\n\n기존 요약:\n{summary}"),
+        MessagesPlaceholder("messages"),
+    ])
+    chain = (prompt | llm | StrOutputParser()).with_config(run_name="summarize_history")
+    return lambda summary, messages: chain.invoke(
+        {"summary": summary or "(없음)", "messages": messages}, config=trace_config()
+    ).strip()
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    # RunnableWithMessageHistory / 프롬프트용 대화 기록
+    # messages: 최근 max_tokens 안의 메시지 + 그보다 오래된 대화의 요약(SystemMessage 하나)
+    #   대화가 max_tokens를 넘으면 최근 max_tokens/2만 남기고 나머지를 summarizer(기존 요약, 메시지들)로 요약에 합침
+    #   (매 턴이 아니라 대화가 다시 max_tokens까지 차면 요약하므로 요약 LLM 호출은 몇 턴에 한 번)
+    #   summarizer가 없으면 오래된 대화는 그냥 버림
+    # all_messages(): 화면 표시용 전체 기록
+    def __init__(self, store, chat_id, max_tokens=DEFAULT_HISTORY_TOKENS, summarizer=None):
+        self.store = store
+        self.chat_id = chat_id
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+
+    def all_messages(self):
+        return [message for _, message, _ in self.store.messages(self.chat_id)]
+
+    @property
+    def messages(self):
+        summary, summarized_upto = self.store.summary(self.chat_id)
+        rows = self.store.messages(self.chat_id, after_id=summarized_upto)
+        if len(rows) > 1 and sum(tokens for _, _, tokens in rows) > self.max_tokens:
+            # 마지막 메시지는 길어도 항상 남김
+            keep, used = len(rows) - 1, rows[-1][2]
+            while keep > 0 and used + rows[keep - 1][2] <= self.max_tokens // 2:
+                keep -= 1
+                used += rows[keep][2]
+            old, rows = rows[:keep], rows[keep:]
+            if self.summarizer is not None:
+                started = time.perf_counter()
+                summary = self.summarizer(summary, [message for _, message, _ in old])
+                logger.info("summarized %d messages of chat %s in %.0f ms", len(old), self.chat_id,
+                            (time.perf_counter() - started) * 1000)
+            self.store.set_summary(self.chat_id, summary, old[-1][0])
+        window = [message for _, message, _ in rows]
+        return ([SystemMessage(SUMMARY_PREFIX + summary)] if summary else []) + window
+
+    def add_messages(self, messages):
+        if not self.store.has_chat(self.chat_id):
+            self.store.create_chat(chat_id=self.chat_id)
+        for message in messages:
+            self.store.add_message(self.chat_id, message)
+
+    def clear(self):
+        self.store.clear(self.chat_id)
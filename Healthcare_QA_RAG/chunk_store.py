@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections.abc import Mapping
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from ann_index import FULL_VECTORS_FILE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_DIR = "chunks"
+COLUMNS_FILE = "columns.json"
+FORMAT_VERSION = 1
+
+
+# 청크 저장 형식 (인덱스 폴더/chunks/)
+#   text.bin + text_offsets.npy : 청크 본문 UTF-8 blob과 시작 위치 (n+1개)
+#   ids.bin  + id_offsets.npy   : 청크 ID
+#   meta_<k>.npy                : 메타데이터 컬럼 (정수 컬럼 또는 사전 인코딩 코드, -1은 값 없음)
+#   columns.json                : 컬럼 이름/타입/사전 값
+# i번째 청크 = FAISS 인덱스의 i번째 벡터
+def _write_blob(path, offsets_path, values):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, value in enumerate(values):
+            data = value.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(offsets_path, offsets)
+
+
+def write_chunk_store(path, docs, ids):
+    os.makedirs(path, exist_ok=True)
+    _write_blob(os.path.join(path, "text.bin"), os.path.join(path, "text_offsets.npy"), [d.page_content for d in docs])
+    _write_blob(os.path.join(path, "ids.bin"), os.path.join(path, "id_offsets.npy"), [str(i) for i in ids])
+
+    columns = []
+    keys = sorted({key for doc in docs for key in doc.metadata})
+    for n, key in enumerate(keys):
+        values = [doc.metadata.get(key) for doc in docs]
+        file_name = f"meta_{n}.npy"
+        if all(type(v) is int for v in values):
+            np.save(os.path.join(path, file_name), np.array(values, dtype=np.int64))
+            columns.append({"name": key, "type": "int", "file": file_name})
+        else:
+            # 문자열 등은 사전 인코딩 (같은 값은 한 번만 저장)
+            dictionary, codes = {}, np.full(len(values), -1, dtype=np.int32)
+            for i, (doc, value) in enumerate(zip(docs, values)):
+                if key in doc.metadata:
+                    codes[i] = dictionary.setdefault(json.dumps(value, ensure_ascii=False), len(dictionary))
+            np.save(os.path.join(path, file_name), codes)
+            columns.append({"name": key, "type": "dict", "file": file_name, "values": list(dictionary)})
+
+    with open(os.path.join(path, COLUMNS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": FORMAT_VERSION, "count": len(docs), "columns": columns}, f, ensure_ascii=False)
+
+
+def _mmap_file(path):
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    # 파일을 메모리 매핑만 해두고, 요청된 청크만 그때그때 Document로 만듦
+    def __init__(self, path):
+        with open(os.path.join(path, COLUMNS_FILE), encoding="utf-8") as f:
+            info = json.load(f)
+        self.count = info["count"]
+        self._text = _mmap_file(os.path.join(path, "text.bin"))
+        self._text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+        self._ids = _mmap_file(os.path.join(path, "ids.bin"))
+        self._id_offsets = np.load(os.path.join(path, "id_offsets.npy"), mmap_mode="r")
+        self._columns = []
+        for column in info["columns"]:
+            data = np.load(os.path.join(path, column["file"]), mmap_mode="r")
+            self._columns.append((column["name"], column["type"], data, column.get("values")))
+        self._id_to_position = None
+
+    def __len__(self):
+        return self.count
+
+    def text(self, i):
+        return self._text[self._text_offsets[i]:self._text_offsets[i + 1]].decode("utf-8")
+
+    def chunk_id(self, i):
+        return self._ids[self._id_offsets[i]:self._id_offsets[i + 1]].decode("utf-8")
+
+    def metadata(self, i):
+        metadata = {}
+        for name, kind, data, values in self._columns:
+            if kind == "int":
+                metadata[name] = int(data[i])
+            elif data[i] >= 0:
+                metadata[name] = json.loads(values[data[i]])
+        return metadata
+
+    def document(self, i):
+        return Document(id=self.chunk_id(i), page_content=self.text(i), metadata=self.metadata(i))
+
+    def position(self, chunk_id):
+        # ID로 찾는 경우에만 ID -> 위치 표를 만듦
+        if self._id_to_position is None:
+            self._id_to_position = {self.chunk_id(i): i for i in range(self.count)}
+        return self._id_to_position.get(chunk_id)
+
+
+class ChunkStoreDocstore(Docstore):
+    # FAISS 검색 결과(위치)로 청크를 찾는 읽기 전용 docstore
+    def __init__(self, store):
+        self.store = store
+
+    def search(self, search):
+        position = search if isinstance(search, (int, np.integer)) else self.store.position(search)
+        if position is None or not 0 <= position < len(self.store):
+            return f"ID {search} not found."
+        return self.store.document(int(position))
+
+    def delete(self, ids):
+        raise NotImplementedError("chunk store is read-only; call to_mutable() first")
+
+
+class _PositionMap(Mapping):
+    # FAISS 위치 i -> docstore 키 i (ID 문자열 dict를 메모리에 만들지 않음)
+    def __init__(self, count):
+        self.count = count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise KeyError(i)
+        return int(i)
+
+    def __iter__(self):
+        return iter(range(self.count))
+
+    def __len__(self):
+        return self.count
+
+
+def has_chunk_store(index_dir):
+    return os.path.exists(os.path.join(index_dir, CHUNK_DIR, COLUMNS_FILE))
+
+
+def chunk_store_bytes(index_dir):
+    chunk_dir = os.path.join(index_dir, CHUNK_DIR)
+    if not os.path.isdir(chunk_dir):
+        return 0
+    return sum(os.path.getsize(os.path.join(chunk_dir, name)) for name in os.listdir(chunk_dir))
+
+
+# index.faiss + chunks/ 저장 (pickle 사용 안 함)
+# 압축 인덱스면 원본 벡터(vectorstore.full_vectors)도 full_vectors.npy로 저장하고 메모리 매핑으로 바꿈
+def save_vector_store(vectorstore, index_dir):
+    import faiss
+
+    os.makedirs(index_dir, exist_ok=True)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    docs = [vectorstore.docstore.search(_id) for _id in ids]
+    if isinstance(vectorstore.docstore, ChunkStoreDocstore):
+        ids = [doc.id for doc in docs]
+
+    tmp_dir = os.path.join(index_dir, CHUNK_DIR + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    write_chunk_store(tmp_dir, docs, ids)
+    faiss.write_index(vectorstore.index, os.path.join(index_dir, "index.faiss.tmp"))
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    full_path = os.path.join(index_dir, FULL_VECTORS_FILE)
+    if full_vectors is not None:
+        with open(full_path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(full_vectors, dtype=np.float32))
+
+    chunk_dir = os.path.join(index_dir, CHUNK_DIR)
+    old_dir = chunk_dir + ".old"
+    if os.path.exists(chunk_dir):
+        os.replace(chunk_dir, old_dir)
+    os.replace(tmp_dir, chunk_dir)
+    os.replace(os.path.join(index_dir, "index.faiss.tmp"), os.path.join(index_dir, "index.faiss"))
+    if full_vectors is not None:
+        os.replace(full_path + ".tmp", full_path)
+        vectorstore.full_vectors = np.load(full_path, mmap_mode="r")
+    elif os.path.exists(full_path):
+        os.remove(full_path)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+# 저장된 인덱스 로드: chunks/를 메모리 매핑
+# 예전 index.pkl만 있으면 요청 경로에서 pickle.load를 하지 않도록 에러 (변환은 CLI의 convert로 따로 실행)
+def load_vector_store(index_dir, embeddings):
+    import faiss
+
+    if not has_chunk_store(index_dir):
+        hint = " (run `python chunk_store.py convert` or rebuild)" if os.path.exists(
+            os.path.join(index_dir, "index.pkl")) else ""
+        raise FileNotFoundError(f"no {CHUNK_DIR}/ chunk store in {index_dir}{hint}")
+    store = ChunkStore(os.path.join(index_dir, CHUNK_DIR))
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    vectorstore = FAISS(embeddings, index, ChunkStoreDocstore(store), _PositionMap(len(store)))
+    # 압축 인덱스: 검색 후보를 다시 계산할 원본 벡터 (디스크에서 필요한 행만 읽음)
+    full_path = os.path.join(index_dir, FULL_VECTORS_FILE)
+    if os.path.exists(full_path):
+        vectorstore.full_vectors = np.load(full_path, mmap_mode="r")
+    return vectorstore
+
+
+# 증분 업데이트(삭제/추가)를 위해 읽기 전용 저장소를 일반 InMemoryDocstore로 변환
+def to_mutable(vectorstore):
+    if not isinstance(vectorstore.docstore, ChunkStoreDocstore):
+        return vectorstore
+    store = vectorstore.docstore.store
+    docs = [store.document(i) for i in range(len(store))]
+    mutable = FAISS(
+        vectorstore.embedding_function,
+        vectorstore.index,
+        InMemoryDocstore({doc.id: doc for doc in docs}),
+        {i: doc.id for i, doc in enumerate(docs)},
+    )
+    mutable.full_vectors = getattr(vectorstore, "full_vectors", None)
+    return mutable
+
+
+# 기존 FAISS.save_local 결과(index.pkl)를 chunks/ 형식으로 변환 (CLI 전용, 신뢰하는 index.pkl에만 사용)
+def convert_pickle_index(index_dir):
+    import pickle
+
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    positions = sorted(index_to_docstore_id)
+    ids = [index_to_docstore_id[i] for i in positions]
+    docs = [docstore.search(_id) for _id in ids]
+    write_chunk_store(os.path.join(index_dir, CHUNK_DIR), docs, ids)
+    logger.info("converted %s/index.pkl -> %s/ (%d chunks)", index_dir, CHUNK_DIR, len(docs))
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def _measure_load(mode, index_dir):
+    from langchain_core.embeddings import FakeEmbeddings
+
+    import faiss  # noqa: F401  (라이브러리 로딩 시간은 제외)
+
+    before = _rss_mb()
+    started = time.perf_counter()
+    if mode == "pickle":
+        vectorstore = FAISS.load_local(index_dir, FakeEmbeddings(size=1), allow_dangerous_deserialization=True)
+    else:
+        vectorstore = load_vector_store(index_dir, FakeEmbeddings(size=1))
+    elapsed = time.perf_counter() - started
+    # 검색 결과 top-4 정도를 꺼냈을 때까지 포함
+    for i in range(min(4, vectorstore.index.ntotal)):
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+    print(json.dumps({"mode": mode, "seconds": elapsed, "rss_mb": _rss_mb() - before}))
+
+
+# 각 방식을 새 프로세스에서 로드해서 시작 시간과 RSS 증가량 비교
+def compare_startup(index_dir, repeat=3):
+    if not has_chunk_store(index_dir):
+        convert_pickle_index(index_dir)
+    results = {}
+    for mode in ("pickle", "mmap"):
+        runs = []
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "_measure", mode, index_dir],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        results[mode] = {
+            "seconds": min(r["seconds"] for r in runs),
+            "rss_mb": min(r["rss_mb"] for r in runs),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="memory-mapped chunk store tools")
+    parser.add_argument("command", choices=["convert", "compare", "_measure"])
+    parser.add_argument("args", nargs="+")
+    args = parser.parse_args()
+    if args.command == "convert":
+        for index_dir in args.args:
+            convert_pickle_index(index_dir)
+    elif args.command == "compare":
+        for index_dir in args.args:
+            for mode, result in compare_startup(index_dir).items():
+                print(f"{index_dir} {mode:>6}: {result['seconds'] * 1000:8.1f} ms  +{result['rss_mb']:.1f} MB RSS")
+    else:
+        _measure_load(*args.args)
@@ -0,0 +1,136 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+_CHUNK_INDEX = re.compile(r":(\d+)$")
+
+
+def _chunk_index(doc):
+    # 청크 ID "{source}#{page}:{hash}:{i}" 의 i (ID가 없으면 None)
+    match = _CHUNK_INDEX.search(doc.id or "")
+    return int(match.group(1)) if match else None
+
+
+def _overlap(left, right, min_overlap):
+    # left의 끝부분과 right의 앞부분이 겹치는 길이 (chunk_overlap으로 생긴 중복)
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class _Group:
+    # 같은 페이지에서 이어지는 청크들을 하나로 합친 것 (rank: 가장 관련도 높은 청크의 순위)
+    def __init__(self, doc, rank):
+        self.rank = rank
+        self.metadata = dict(doc.metadata)
+        self.parts = [(_chunk_index(doc), doc.page_content)]
+
+    # doc이 이 그룹에 포함되거나 합쳐지면 True
+    def add(self, doc, min_overlap):
+        content, index = doc.page_content, _chunk_index(doc)
+        for i, (_, part) in enumerate(self.parts):
+            if content in part:
+                return True
+            if part in content:
+                self.parts[i] = (index, content)
+                return True
+        for i, (part_index, part) in enumerate(self.parts):
+            if _overlap(content, part, min_overlap):
+                self.parts.insert(i, (index, content))
+                return True
+            adjacent = index is not None and part_index is not None and abs(index - part_index) == 1
+            if adjacent or _overlap(part, content, min_overlap):
+                self.parts.append((index, content))
+                return True
+        return False
+
+    def text(self, min_overlap):
+        parts = self.parts
+        if all(index is not None for index, _ in parts):
+            parts = sorted(parts)
+        text = parts[0][1]
+        for _, content in parts[1:]:
+            size = _overlap(text, content, min_overlap)
+            text += content[size:] if size else "\n" + content
+        return text
+
+
+class ContextPacker:
+    # 검색된 문서를 프롬프트에 넣기 전에 정리
+    # 1. 같은 페이지의 겹치거나 이어지는 청크는 하나로 합치고, 똑같거나 포함되는 청크는 버림
+    # 2. 관련도(검색 순위) 순서대로 max_tokens까지만 채움 (tiktoken 기준)
+    def __init__(self, max_tokens=DEFAULT_TOKEN_BUDGET, model="gpt-4o-mini", min_overlap=20):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.min_overlap = min_overlap
+        self._encoding = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "docs_in": 0, "docs_out": 0, "tokens_in": 0, "tokens_out": 0}
+
+    def count_tokens(self, text):
+        if self._encoding is None:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        return len(self._encoding.encode(text))
+
+    def _truncate(self, text, max_tokens):
+        return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+
+    def pack(self, docs):
+        started = time.perf_counter()
+        groups = []
+        by_page = {}
+        for rank, doc in enumerate(docs):
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            for group in by_page.get(key, []):
+                if group.add(doc, self.min_overlap):
+                    break
+            else:
+                group = _Group(doc, rank)
+                groups.append(group)
+                by_page.setdefault(key, []).append(group)
+
+        packed = []
+        used = 0
+        tokens_in = sum(self.count_tokens(doc.page_content) for doc in docs)
+        for group in sorted(groups, key=lambda g: g.rank):
+            text = group.text(self.min_overlap)
+            tokens = self.count_tokens(text)
+            if used + tokens > self.max_tokens:
+                # 가장 관련도 높은 문서가 예산보다 길면 잘라서라도 넣음, 나머지는 건너뜀
+                if packed:
+                    continue
+                text, tokens = self._truncate(text, self.max_tokens), self.max_tokens
+            packed.append(Document(page_content=text, metadata=group.metadata))
+            used += tokens
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["docs_in"] += len(docs)
+            self.stats["docs_out"] += len(packed)
+            self.stats["tokens_in"] += tokens_in
+            self.stats["tokens_out"] += used
+        trace = current_trace()
+        if trace is not None:
+            trace.record("pack", (time.perf_counter() - started) * 1000, tokens_in=tokens_in, tokens_out=used)
+        logger.info("packed context: %d docs/%d tokens -> %d docs/%d tokens", len(docs), tokens_in, len(packed), used)
+        return packed
+
+    # 검색기 뒤에 붙이는 Runnable: history_aware_retriever | packer.as_runnable()
+    def as_runnable(self):
+        return RunnableLambda(self.pack).with_config(run_name="context_packer")
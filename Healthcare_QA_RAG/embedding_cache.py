@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+DEFAULT_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+# 청크 텍스트 + 임베딩 모델 이름으로 캐시 키 생성 (내용이 같으면 파일이 달라도 같은 키)
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _to_blob(vector):
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    # sqlite 파일 하나에 key -> float32 벡터 저장
+    # max_bytes를 넘으면 가장 오래 사용하지 않은 벡터부터 삭제 (LRU)
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # streamlit은 세션마다 다른 스레드에서 실행되므로 같은 연결을 lock으로 공유
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self._lock:
+            # sqlite 변수 개수 제한 때문에 나눠서 조회
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                found.update(rows)
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *part]
+                )
+            self._conn.commit()
+        result = [_from_blob(found[k]) if k in found else None for k in keys]
+        hits = sum(1 for v in result if v is not None)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return result
+
+    def put_many(self, items):
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = _to_blob(vector)
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        self.evict()
+
+    def bytes_stored(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def evict(self):
+        total = self.bytes_stored()
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        with self._lock:
+            rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+            self._conn.commit()
+            removed = len(stale)
+        logger.info("embedding cache evicted %d entries (now %d bytes)", removed, total)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": self.bytes_stored(),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    # 인덱스 빌드 시 캐시를 먼저 보고, 새로 생기거나 바뀐 청크만 실제 임베딩 모델로 보냄
+    def __init__(self, embeddings, model, cache=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    # 캐시 조회 후 캐시에 없는 텍스트만 모아서 (중복은 한 번만) 반환
+    def _lookup(self, texts):
+        keys = [cache_key(text, self.model) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+        return keys, vectors, missing
+
+    def _merge(self, keys, vectors, missing, new_vectors):
+        # 캐시에서 읽은 값과 똑같도록 float32로 맞춤
+        fresh = {k: array("f", v).tolist() for k, v in zip(missing.keys(), new_vectors)}
+        self.cache.put_many(fresh.items())
+        logger.info("embedding cache: %d cached, %d embedded", len(keys) - len(missing), len(missing))
+        return [fresh[k] if v is None else v for k, v in zip(keys, vectors)]
+
+    def embed_documents(self, texts):
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        new_vectors = self.embeddings.embed_documents(list(missing.values()))
+        return self._merge(keys, vectors, missing, new_vectors)
+
+    async def aembed_documents(self, texts):
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        new_vectors = await self.embeddings.aembed_documents(list(missing.values()))
+        return self._merge(keys, vectors, missing, new_vectors)
+
+    # 질문 임베딩은 매번 다르므로 캐시하지 않음
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.embeddings.aembed_query(text)
+
+    # 여러 질문을 한 번에 (batching.QueryBatcher), 역시 캐시하지 않음
+    def embed_queries(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+
+_shared_cache = None
+
+
+# 앱들이 공통으로 쓰는 OpenAI 임베딩 + 디스크 캐시 (프로세스당 캐시 연결 하나)
+# 캐시에 없는 청크는 배치/동시성 제한/백오프가 있는 비동기 클라이언트로 임베딩
+def cached_openai_embeddings(model="text-embedding-3-small"):
+    from async_embeddings import AsyncBatchEmbeddings
+
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = EmbeddingCache()
+    return CachedEmbeddings(AsyncBatchEmbeddings(model=model), model, _shared_cache)
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# 다른 프로세스의 빌드가 끝나기를 기다리는 최대 시간 (초)
+DEFAULT_LOCK_TIMEOUT = float(os.environ.get("INDEX_BUILD_TIMEOUT", 3600))
+
+
+# 인덱스 폴더 옆의 잠금 파일 (폴더는 빌드 결과로 통째로 바뀔 수 있어서 안에 두지 않음)
+def lock_path(index_dir):
+    return os.path.normpath(index_dir) + ".lock"
+
+
+# 지금 잡고 있는 잠금 파일 fd
+_held_fds = set()
+
+
+# fork된 자식(빌드 중에 만든 PDF 추출 프로세스 풀 등)은 잠금 fd를 물려받지 않도록 닫음
+# (안 닫으면 빌드하던 프로세스가 죽어도 남은 자식이 잠금을 계속 잡고 있음)
+def _close_held_fds():
+    for fd in _held_fds:
+        os.close(fd)
+    _held_fds.clear()
+
+
+# fork가 없는 Windows에서는 자식 프로세스가 fd를 물려받지 않음 (os.open은 상속 불가 fd)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_close_held_fds)
+
+
+# 잠금을 바로 잡으면 True, 다른 프로세스가 잡고 있으면 False
+# Windows(msvcrt)에는 공유 잠금이 없으므로 항상 단독 잠금 (로드하는 쪽끼리도 차례로 잡음)
+def _try_lock(fd, shared):
+    if fcntl is None:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _unlock(fd):
+    # flock은 fd를 닫으면 풀리고, msvcrt는 닫기 전에 직접 풀어야 함
+    if fcntl is None:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+# flock 파일 잠금 (shared: 로드하는 쪽끼리는 같이 잡음, 빌드하는 쪽은 혼자)
+# 프로세스가 죽으면 OS가 잠금을 풀어주므로 남은 잠금 파일을 지울 필요 없음
+@contextmanager
+def file_lock(path, shared=False, timeout=DEFAULT_LOCK_TIMEOUT):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    deadline = time.monotonic() + timeout
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    _held_fds.add(fd)
+    locked = False
+    try:
+        while not _try_lock(fd, shared):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"timed out waiting for {path}")
+            time.sleep(0.1)
+        locked = True
+        yield
+    finally:
+        if locked:
+            _unlock(fd)
+        _held_fds.discard(fd)
+        os.close(fd)
+
+
+class BuildCoordinator:
+    # 같은 인덱스 폴더의 빌드를 한 번만 실행 (single-flight)
+    #   프로세스 안: 먼저 온 요청(leader)이 로드/빌드하고, 같은 폴더를 기다리던 요청은 leader의 결과를 그대로 받음
+    #   프로세스 사이: 잠금 파일을 혼자 잡은 쪽만 빌드하고, 나머지는 끝날 때까지 기다렸다가 저장된 인덱스를 로드
+    # load(): 저장된 인덱스가 유효하면 vectorstore, 아니면 None (공유 잠금 안에서 호출)
+    # build(): 빌드/증분 업데이트 후 vectorstore (단독 잠금 안에서 호출)
+    def __init__(self, timeout=DEFAULT_LOCK_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = {"loads": 0, "builds": 0, "waited": 0}
+
+    def run(self, index_dir, load, build):
+        key = os.path.abspath(index_dir)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            with self._lock:
+                self.stats["waited"] += 1
+            return future.result()
+        try:
+            result = self._run(index_dir, load, build)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _run(self, index_dir, load, build):
+        path = lock_path(index_dir)
+        with file_lock(path, shared=True, timeout=self.timeout):
+            result = load()
+        if result is None:
+            with file_lock(path, timeout=self.timeout):
+                # 잠금을 기다리는 동안 다른 프로세스가 빌드를 끝냈으면 그 결과를 로드
+                result = load()
+                if result is None:
+                    started = time.perf_counter()
+                    result = build()
+                    with self._lock:
+                        self.stats["builds"] += 1
+                    logger.info("built %s in %.2fs (holding %s)", index_dir, time.perf_counter() - started, path)
+                    return result
+        with self._lock:
+            self.stats["loads"] += 1
+        return result
+
+
+# 프로세스 안에서 공유하는 기본 coordinator
+build_coordinator = BuildCoordinator()
@@ -0,0 +1,360 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from ann_index import (
+    FULL_VECTORS_FILE, INDEX_CONFIG_FILE, apply_search_params, convert_vector_store, index_config, load_index_config,
+    merge_search_params, same_build_config, save_index_config, supports_update,
+)
+from async_embeddings import run_sync, aembed_batches
+from chunk_store import has_chunk_store, load_vector_store, save_vector_store, to_mutable
+from index_lock import build_coordinator
+from ingest import IngestStats, file_sha256, iter_cached_pdf_pages, iter_chunk_batches
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+# 2: 파일/페이지 키를 절대 경로로 저장
+MANIFEST_VERSION = 2
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# manifest의 파일 키: 절대 경로
+# rag.py는 "who.pdf", streamlit_ui는 절대 경로로 같은 인덱스 폴더를 쓰므로 경로 표기가 달라도 같은 파일로 비교
+def source_key(source):
+    return os.path.abspath(source) if source else ""
+
+
+# 페이지 식별자: "파일 절대경로#페이지번호"
+def page_key(doc):
+    return f"{source_key(doc.metadata.get('source', ''))}#{doc.metadata.get('page', 0)}"
+
+
+# 청크 분할 설정이 바뀌면 모든 청크가 달라지므로 manifest에 같이 저장해서 비교
+def splitter_config(text_splitter):
+    config = {
+        "class": type(text_splitter).__name__,
+        "chunk_size": getattr(text_splitter, "_chunk_size", None),
+        "chunk_overlap": getattr(text_splitter, "_chunk_overlap", None),
+    }
+    # 구조 기반 splitter처럼 추가 설정이 있으면 같이 기록
+    if hasattr(text_splitter, "manifest_config"):
+        config.update(text_splitter.manifest_config())
+    return config
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(index_dir, manifest):
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+# 빌드 중인 인덱스를 쓰는 임시 폴더 (index_dir 옆, 같은 파일시스템이라 rename 가능)
+def staging_dir(index_dir):
+    return f"{os.path.normpath(index_dir)}.{os.getpid()}.tmp"
+
+
+# 죽은 빌드가 남긴 임시 폴더 정리 (빌드 잠금을 잡은 상태에서만 호출)
+def remove_stale_staging(index_dir):
+    parent, name = os.path.split(os.path.normpath(index_dir))
+    if not os.path.isdir(parent or "."):
+        return
+    pattern = re.compile(re.escape(name) + r"\.\d+\.tmp")
+    for entry in os.listdir(parent or "."):
+        if pattern.fullmatch(entry):
+            logger.info("removing stale staging dir %s", os.path.join(parent, entry))
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+# 임시 폴더에 다 쓴 인덱스를 index_dir로 옮김
+# index_dir가 없거나 비었으면 폴더째 rename, 아니면 항목마다 os.replace
+#   (index_dir 안의 샤드 폴더, relevance.json 등 다른 항목은 그대로 둠)
+# manifest를 먼저 지우고 마지막에 넣으므로, 도중에 죽어도 manifest 없는 폴더 -> 다음 실행에서 다시 빌드
+def publish_index(tmp_dir, index_dir):
+    try:
+        os.replace(tmp_dir, index_dir)
+        return
+    except OSError:
+        if not os.path.isdir(index_dir):
+            raise
+    manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    # 새 인덱스가 압축 인덱스가 아니면 이전 원본 벡터는 지움
+    full_path = os.path.join(index_dir, FULL_VECTORS_FILE)
+    if not os.path.exists(os.path.join(tmp_dir, FULL_VECTORS_FILE)) and os.path.exists(full_path):
+        os.remove(full_path)
+    for name in os.listdir(tmp_dir):
+        if name == MANIFEST_NAME:
+            continue
+        source, target = os.path.join(tmp_dir, name), os.path.join(index_dir, name)
+        if os.path.isdir(source) and os.path.exists(target):
+            old = target + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(target, old)
+            os.replace(source, target)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(source, target)
+    os.replace(os.path.join(tmp_dir, MANIFEST_NAME), manifest_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# 인덱스 버전: manifest와 인덱스 설정 내용의 해시 (다시 색인되면 바뀜)
+def index_version(index_dir):
+    digest = hashlib.sha256()
+    for name in (MANIFEST_NAME, INDEX_CONFIG_FILE):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# 페이지 하나를 청크로 나누고, 페이지 내용 해시 기반의 고정 ID를 붙임
+def split_page(page, text_splitter):
+    page_hash = text_sha256(page.page_content)
+    chunks = text_splitter.split_documents([page])
+    key = page_key(page)
+    ids = [f"{key}:{page_hash[:12]}:{i}" for i in range(len(chunks))]
+    return chunks, ids, {"hash": page_hash, "chunk_ids": ids}
+
+
+class _FileHashes:
+    # 페이지가 스트림으로 들어오므로 파일 해시는 처음 본 소스에서 한 번만 계산
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, source):
+        key = source_key(source)
+        if key not in self.entries:
+            sha = file_sha256(source) if os.path.exists(source) else None
+            self.entries[key] = {"sha256": sha}
+        return self.entries[key]["sha256"]
+
+
+def empty_vector_store(embeddings):
+    import faiss
+
+    dim = len(embeddings.embed_query("empty index"))
+    return FAISS(embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore(), {})
+
+
+# 전체 빌드: 페이지 스트림을 청크로 나눠 배치 단위로 임베딩하고 인덱스 + manifest 저장
+# 임시 폴더(staging_dir)에 다 쓴 뒤 index_dir로 옮기므로, 빌드 도중에 죽어도 기존 인덱스는 그대로
+def build_vector_store(pages, text_splitter, embeddings, index_dir, batch_size=256, ann_config=None):
+    stats = IngestStats()
+    files = _FileHashes()
+    page_entries = {}
+
+    def split_fn(page):
+        files.get(page.metadata.get("source", ""))
+        chunks, chunk_ids, entry = split_page(page, text_splitter)
+        page_entries[page_key(page)] = entry
+        return chunks, chunk_ids
+
+    # 임베딩이 끝난 배치부터 바로 FAISS 인덱스에 추가
+    async def build():
+        vectorstore = None
+        batches = iter_chunk_batches(pages, split_fn, batch_size, stats)
+        async for docs, ids, vectors in aembed_batches(batches, embeddings):
+            text_embeddings = [(doc.page_content, vector) for doc, vector in zip(docs, vectors)]
+            metadatas = [doc.metadata for doc in docs]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return vectorstore
+
+    vectorstore = run_sync(build())
+    if vectorstore is None:
+        # 페이지가 없으면(텍스트 없는 PDF 등) 빈 flat 인덱스 (이후 페이지가 생기면 증분 업데이트)
+        logger.warning("no chunks to index for %s, saving an empty flat index", index_dir)
+        vectorstore = empty_vector_store(embeddings)
+        ann_config = dict(index_config("flat"), quantizer=None, dim=None)
+    else:
+        # flat 이외의 인덱스 종류면 모은 벡터로 학습해서 교체하고, 학습 파라미터를 같이 저장
+        ann_config = convert_vector_store(vectorstore, ann_config or index_config())
+
+    tmp_dir = staging_dir(index_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_vector_store(vectorstore, tmp_dir)
+    save_index_config(tmp_dir, ann_config)
+    save_manifest(tmp_dir, {
+        "version": MANIFEST_VERSION,
+        "splitter": splitter_config(text_splitter),
+        "files": files.entries,
+        "pages": page_entries,
+    })
+    publish_index(tmp_dir, index_dir)
+    logger.info("index %s built: %s", index_dir, stats.as_dict())
+    return vectorstore
+
+
+# manifest와 현재 페이지를 비교해서 추가/변경/삭제된 페이지만 인덱스에 반영
+# 반환값: 최신 상태의 vectorstore (변경이 있으면 수정 가능한 docstore로 바뀐 새 객체)
+#        제자리 업데이트가 안 되는 인덱스(IVF/HNSW 등)면 pages를 읽지 않고 None -> 전체 재빌드
+#        (pages는 한 번만 읽을 수 있는 스트림이라 재빌드에 그대로 넘길 수 있도록)
+def update_vector_store(vectorstore, pages, text_splitter, index_dir, manifest):
+    # HNSW는 삭제를 지원하지 않고 IVF는 학습한 클러스터가 바뀌므로 다시 빌드 (임베딩은 캐시에서 읽음)
+    if not supports_update(vectorstore.index):
+        return None
+
+    started = time.perf_counter()
+    old_pages = manifest["pages"]
+    files = _FileHashes()
+
+    new_pages = {}
+    to_add_docs, to_add_ids = [], []
+    for page in pages:
+        key = page_key(page)
+        source = page.metadata.get("source", "")
+        # 파일 해시가 그대로인 파일의 페이지는 비교할 필요 없음
+        sha = files.get(source)
+        if sha is not None and key in old_pages and manifest["files"].get(source_key(source), {}).get("sha256") == sha:
+            new_pages[key] = old_pages[key]
+            continue
+        page_hash = text_sha256(page.page_content)
+        if key in old_pages and old_pages[key]["hash"] == page_hash:
+            new_pages[key] = old_pages[key]
+            continue
+        chunks, chunk_ids, entry = split_page(page, text_splitter)
+        to_add_docs.extend(chunks)
+        to_add_ids.extend(chunk_ids)
+        new_pages[key] = entry
+
+    # 없어졌거나 내용이 바뀐 페이지의 예전 청크 삭제
+    to_delete = []
+    for key, entry in old_pages.items():
+        if new_pages.get(key) is not entry:
+            to_delete.extend(entry["chunk_ids"])
+
+    if not to_add_docs and not to_delete:
+        return vectorstore
+
+    vectorstore = to_mutable(vectorstore)
+    # 압축 인덱스면 재계산용 원본 벡터(full_vectors)도 인덱스와 같은 순서로 지우고 붙임
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    if to_delete:
+        deleted = set(to_delete)
+        positions = [i for i, _id in vectorstore.index_to_docstore_id.items() if _id in deleted]
+        vectorstore.delete(to_delete)
+        if full_vectors is not None:
+            full_vectors = np.delete(np.asarray(full_vectors), positions, axis=0)
+    if to_add_docs:
+        vectors = vectorstore.embedding_function.embed_documents([doc.page_content for doc in to_add_docs])
+        vectorstore.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in zip(to_add_docs, vectors)],
+            metadatas=[doc.metadata for doc in to_add_docs], ids=to_add_ids,
+        )
+        if full_vectors is not None:
+            full_vectors = np.vstack([full_vectors, np.asarray(vectors, dtype=np.float32)])
+    vectorstore.full_vectors = full_vectors
+
+    # 인덱스 설정은 그대로이므로 청크/인덱스/manifest만 임시 폴더에 써서 옮김
+    tmp_dir = staging_dir(index_dir)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_vector_store(vectorstore, tmp_dir)
+    manifest = dict(manifest, files=files.entries, pages=new_pages)
+    save_manifest(tmp_dir, manifest)
+    publish_index(tmp_dir, index_dir)
+    logger.info(
+        "index %s updated: +%d chunks, -%d chunks in %.2fs",
+        index_dir, len(to_add_ids), len(to_delete), time.perf_counter() - started,
+    )
+    return vectorstore
+
+
+# 저장된 인덱스를 로드하고 manifest 기준으로 최신 상태로 맞춤
+# manifest가 없거나 청크 설정/인덱스 종류가 바뀐 경우에만 전체 재빌드
+# chunks/ 없이 예전 index.pkl만 있는 폴더도 unpickle하지 않고 다시 빌드
+def load_or_build_vector_store(pages, text_splitter, embeddings, index_dir, ann_config=None):
+    ann_config = ann_config or index_config()
+    saved_config = load_index_config(index_dir)
+    manifest = load_manifest(index_dir)
+    if (
+        not os.path.exists(os.path.join(index_dir, "index.faiss"))
+        or not has_chunk_store(index_dir)
+        or manifest is None
+        or manifest.get("splitter") != splitter_config(text_splitter)
+        or not same_build_config(saved_config, ann_config)
+    ):
+        return build_vector_store(pages, text_splitter, embeddings, index_dir, ann_config=ann_config)
+
+    # pickle 대신 메모리 매핑된 청크 저장소로 로드
+    vectorstore = load_vector_store(index_dir, embeddings)
+    apply_search_params(vectorstore.index, merge_search_params(saved_config, ann_config))
+    updated = update_vector_store(vectorstore, pages, text_splitter, index_dir, manifest)
+    if updated is None:
+        return build_vector_store(pages, text_splitter, embeddings, index_dir, ann_config=ann_config)
+    return updated
+
+
+# PDF 파일 해시/청크 설정/인덱스 종류가 manifest와 그대로면 PDF를 읽지 않고 저장된 인덱스를 로드 (아니면 None)
+def load_saved_vector_store(pdf_paths, text_splitter, embeddings, index_dir, ann_config=None):
+    ann_config = ann_config or index_config()
+    saved_config = load_index_config(index_dir)
+    manifest = load_manifest(index_dir)
+    if (
+        not os.path.exists(os.path.join(index_dir, "index.faiss"))
+        or not has_chunk_store(index_dir)
+        or manifest is None
+        or manifest.get("splitter") != splitter_config(text_splitter)
+        or not same_build_config(saved_config, ann_config)
+        or set(manifest["files"]) != {source_key(path) for path in pdf_paths}
+    ):
+        return None
+    for path in pdf_paths:
+        sha = file_sha256(path) if os.path.exists(path) else None
+        if sha is None or manifest["files"][source_key(path)].get("sha256") != sha:
+            return None
+    vectorstore = load_vector_store(index_dir, embeddings)
+    apply_search_params(vectorstore.index, merge_search_params(saved_config, ann_config))
+    return vectorstore
+
+
+# PDF 경로 목록으로 인덱스 로드/빌드
+# 저장된 인덱스가 그대로면 PDF 파싱 없이 바로 로드하고, 아니면 페이지를 추출해서(파일 해시별 페이지 텍스트 캐시)
+# load_or_build_vector_store로 바뀐 페이지만 반영하거나 다시 빌드
+# 여러 세션/프로세스가 동시에 불러도 빌드는 한 곳에서만 하고 나머지는 그 결과를 기다림 (index_lock)
+def load_or_build_pdf_vector_store(pdf_paths, text_splitter, embeddings, index_dir, ann_config=None):
+    def load():
+        started = time.perf_counter()
+        vectorstore = load_saved_vector_store(pdf_paths, text_splitter, embeddings, index_dir, ann_config)
+        if vectorstore is not None:
+            logger.info("index %s is up to date, loaded without parsing PDFs in %.2fs", index_dir,
+                        time.perf_counter() - started)
+        return vectorstore
+
+    def build():
+        remove_stale_staging(index_dir)
+        return load_or_build_vector_store(
+            iter_cached_pdf_pages(pdf_paths), text_splitter, embeddings, index_dir, ann_config=ann_config
+        )
+
+    return build_coordinator.run(index_dir, load, build)
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.retrievers import BaseRetriever
+
+from ann_index import apply_search_params, index_config, load_index_config
+from chunk_store import load_vector_store
+from index_manifest import build_vector_store, file_sha256, splitter_config
+from ingest import iter_cached_pdf_pages
+from relevance import ascored_search, scored_search
+from tracing import trace_vectorstore
+
+logger = logging.getLogger(__name__)
+
+# 버전별 인덱스 저장 위치: <INDEX_ROOT>/<이름>/versions/<버전>/, 현재 버전은 <INDEX_ROOT>/<이름>/CURRENT
+DEFAULT_INDEX_ROOT = os.environ.get(
+    "RAG_INDEX_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_versions")
+)
+ARTIFACT_FILE = "artifact.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# 체크섬 검증은 activate 할 때 한 번 (CURRENT는 검증을 통과한 버전만 가리킴)
+# 로드할 때마다 모든 파일을 해시하면 메모리 매핑으로 필요한 부분만 읽는 의미가 없으므로 RAG_INDEX_VERIFY=1일 때만
+VERIFY_ON_LOAD = os.environ.get("RAG_INDEX_VERIFY") == "1"
+
+
+def create_splitter(structure="monograph", chunk_size=1000, chunk_overlap=0):
+    if structure == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    from structure_splitter import StructureTextSplitter
+
+    return StructureTextSplitter(structure, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+# 버전 폴더 안의 모든 파일(artifact.json 제외) sha256
+def checksum_dir(version_dir):
+    checksums = {}
+    for base, _, files in os.walk(version_dir):
+        for name in files:
+            path = os.path.join(base, name)
+            relative = os.path.relpath(path, version_dir).replace(os.sep, "/")
+            if relative != ARTIFACT_FILE:
+                checksums[relative] = file_sha256(path)
+    return dict(sorted(checksums.items()))
+
+
+def _atomic_write(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def version_dir(root, version):
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def list_versions(root):
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_root):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_root)
+        if not name.startswith(".") and os.path.exists(os.path.join(versions_root, name, ARTIFACT_FILE))
+    )
+
+
+def read_artifact(root, version):
+    with open(os.path.join(version_dir(root, version), ARTIFACT_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def current_version(root):
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+# 저장된 체크섬과 실제 파일 비교 (빠졌거나, 바뀌었거나, 모르는 파일이 있으면 ValueError)
+def verify_version(root, version):
+    expected = read_artifact(root, version)["checksums"]
+    actual = checksum_dir(version_dir(root, version))
+    if actual != expected:
+        changed = sorted(name for name in expected.keys() | actual.keys() if expected.get(name) != actual.get(name))
+        raise ValueError(f"index version {version} failed checksum verification: {changed}")
+
+
+# CURRENT를 원자적으로 교체 (실행 중인 앱은 IndexHandle이 감지해서 새 버전으로 바꿈)
+def activate_version(root, version):
+    verify_version(root, version)
+    _atomic_write(os.path.join(root, CURRENT_FILE), version + "\n")
+    logger.info("activated index version %s in %s", version, root)
+
+
+# PDF들로 새 버전을 빌드: 임시 폴더에 만들고 체크섬을 기록한 뒤 versions/<버전>으로 rename
+# 임베딩은 디스크 캐시(embedding_cache)를 거치므로 안 바뀐 청크는 다시 임베딩하지 않음
+def build_version(pdf_paths, root, text_splitter, embeddings, ann_config=None, activate=True):
+    started = time.perf_counter()
+    ann_config = ann_config or index_config()
+    sources = {path: file_sha256(path) for path in pdf_paths}
+    digest = hashlib.sha256(json.dumps(
+        [sources, splitter_config(text_splitter), ann_config, getattr(embeddings, "model", None)], sort_keys=True,
+    ).encode("utf-8")).hexdigest()
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:8]}"
+
+    os.makedirs(os.path.join(root, VERSIONS_DIR), exist_ok=True)
+    tmp_dir = os.path.join(root, VERSIONS_DIR, f".{version}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    # 청크 설정만 바뀐 재빌드는 PDF를 다시 파싱하지 않음 (ingest의 페이지 텍스트 캐시)
+    vectorstore = build_vector_store(
+        iter_cached_pdf_pages(pdf_paths), text_splitter, embeddings, tmp_dir, ann_config=ann_config
+    )
+    artifact = {
+        "version": version,
+        "created": time.time(),
+        "sources": sources,
+        "splitter": splitter_config(text_splitter),
+        "index": load_index_config(tmp_dir),
+        "embedding_model": getattr(embeddings, "model", None),
+        "vectors": vectorstore.index.ntotal,
+        "build_seconds": time.perf_counter() - started,
+        "checksums": checksum_dir(tmp_dir),
+    }
+    with open(os.path.join(tmp_dir, ARTIFACT_FILE), "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_dir, version_dir(root, version))
+    logger.info("built index version %s: %d vectors in %.1fs", version, artifact["vectors"], artifact["build_seconds"])
+    if activate:
+        activate_version(root, version)
+    return version
+
+
+# 최신 keep개와 현재 버전만 남기고 삭제
+def prune_versions(root, keep=3):
+    current = current_version(root)
+    versions = list_versions(root)
+    removed = [v for v in versions[:-keep] if v != current] if keep > 0 else [v for v in versions if v != current]
+    for version in removed:
+        shutil.rmtree(version_dir(root, version))
+    return removed
+
+
+def load_version(root, version, embeddings, verify=False):
+    if verify:
+        verify_version(root, version)
+    path = version_dir(root, version)
+    vectorstore = load_vector_store(path, embeddings)
+    apply_search_params(vectorstore.index, load_index_config(path))
+    return vectorstore
+
+
+class IndexHandle:
+    # 실행 중에 교체 가능한 인덱스 참조
+    # version을 주면 그 버전에 고정, 아니면 CURRENT를 따라가며 watch()로 바뀌면 백그라운드에서 로드 후 교체
+    # (교체는 참조 하나를 바꾸는 것이라 진행 중인 검색은 이전 버전으로 끝까지 실행됨)
+    def __init__(self, root, embeddings, version=None, verify=VERIFY_ON_LOAD):
+        self.root = root
+        self.embeddings = embeddings
+        self.verify = verify
+        self.pinned = version is not None
+        self.version = version or current_version(root)
+        if self.version is None:
+            raise FileNotFoundError(f"no index version in {root} (run: python index_versions.py build ...)")
+        self.vectorstore = self._load(self.version)
+        self._failed = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _load(self, version):
+        started = time.perf_counter()
+        # 쿼리 임베딩/검색 시간을 단계별로 기록
+        vectorstore = trace_vectorstore(load_version(self.root, version, self.embeddings, self.verify))
+        logger.info("loaded index version %s in %.0f ms", version, (time.perf_counter() - started) * 1000)
+        return vectorstore
+
+    # CURRENT가 바뀌었으면 새 버전을 로드해서 교체, 교체했으면 True
+    def refresh(self):
+        if self.pinned:
+            return False
+        version = current_version(self.root)
+        if version is None or version in (self.version, self._failed):
+            return False
+        with self._lock:
+            if version == self.version:
+                return False
+            try:
+                vectorstore = self._load(version)
+            except (OSError, ValueError):
+                # 같은 버전은 다시 시도하지 않음 (CURRENT가 다른 버전으로 바뀌면 다시 시도)
+                self._failed = version
+                logger.exception("failed to load index version %s, keeping %s", version, self.version)
+                return False
+            self.vectorstore, self.version = vectorstore, version
+        logger.info("swapped to index version %s", version)
+        return True
+
+    def watch(self, interval=5.0):
+        if self.pinned or self._watcher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+
+        self._watcher = threading.Thread(target=loop, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    # vectorstore.as_retriever()와 같은 모양으로 부를 수 있게 (batching.batched_retriever)
+    # reranker: rerank.MMRReranker (없으면 상위 k개)
+    def as_retriever(self, search_kwargs=None, reranker=None):
+        return HotSwapRetriever(handle=self, k=(search_kwargs or {}).get("k", 4), reranker=reranker)
+
+
+class HotSwapRetriever(BaseRetriever):
+    # 검색할 때마다 IndexHandle의 현재 벡터스토어 사용 (문서마다 관련도를 붙여서 반환, relevance.ScoredRetriever)
+    handle: IndexHandle
+    k: int = 4
+    reranker: object = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return scored_search(self.handle.vectorstore, query, self.k, self.reranker)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return await ascored_search(self.handle.vectorstore, query, self.k, self.reranker)
+
+
+# 앱 시작 시: 빌드된 버전이 있으면 IndexHandle (RAG_INDEX_VERSION으로 버전 고정 가능), 없으면 None
+def open_index(name, embeddings, root=DEFAULT_INDEX_ROOT, watch_interval=5.0):
+    index_root = os.path.join(root, name)
+    version = os.environ.get("RAG_INDEX_VERSION") or None
+    if version is None and current_version(index_root) is None:
+        return None
+    handle = IndexHandle(index_root, embeddings, version)
+    handle.watch(watch_interval)
+    return handle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="versioned FAISS index artifacts")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="PDF -> 새 인덱스 버전")
+    build.add_argument("--name", required=True, help="인덱스 이름 (예: who)")
+    build.add_argument("pdfs", nargs="+")
+    build.add_argument("--structure", default="monograph", choices=["monograph", "constitution", "recursive"])
+    build.add_argument("--chunk-size", type=int, default=1000)
+    build.add_argument("--chunk-overlap", type=int, default=0)
+    build.add_argument("--index-type", default=None, help="flat/ivf/hnsw/ivfpq (기본: FAISS_INDEX_TYPE)")
+    build.add_argument("--quantizer", default=None, choices=["fp16", "int8"], help="스칼라 양자화 (기본: FAISS_QUANTIZER)")
+    build.add_argument("--dim", type=int, default=None, help="앞쪽 dim개 차원만 사용 (기본: FAISS_DIM)")
+    build.add_argument("--no-activate", action="store_true", help="빌드만 하고 CURRENT는 그대로")
+
+    for command in ("list", "verify", "activate", "prune"):
+        sub = commands.add_parser(command)
+        sub.add_argument("--name", required=True)
+        if command in ("verify", "activate"):
+            sub.add_argument("version", nargs="?" if command == "verify" else None)
+        if command == "prune":
+            sub.add_argument("--keep", type=int, default=3)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    root = os.path.join(args.root, args.name)
+
+    if args.command == "build":
+        from embedding_cache import cached_openai_embeddings
+
+        version = build_version(
+            args.pdfs, root, create_splitter(args.structure, args.chunk_size, args.chunk_overlap),
+            cached_openai_embeddings(EMBEDDING_MODEL),
+            ann_config=index_config(args.index_type, quantizer=args.quantizer, dim=args.dim),
+            activate=not args.no_activate,
+        )
+        print(version)
+    elif args.command == "list":
+        current = current_version(root)
+        for version in list_versions(root):
+            artifact = read_artifact(root, version)
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  {artifact['vectors']:>7} vectors  {artifact['index']['type']:<6}"
+                  f"  {artifact['splitter'].get('structure', artifact['splitter']['class'])}")
+    elif args.command == "verify":
+        version = args.version or current_version(root)
+        verify_version(root, version)
+        print(f"{version}: ok")
+    elif args.command == "activate":
+        activate_version(root, args.version)
+    else:
+        for version in prune_versions(root, args.keep):
+            print(f"removed {version}")
+
+
+if __name__ == "__main__":
+    main()
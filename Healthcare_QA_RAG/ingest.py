@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+PAGES_PER_TASK = 16
+# 추출한 페이지 텍스트 캐시 폴더 (PDF 파일 해시별 파일 하나, 빈 문자열이면 캐시 안 함)
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", os.path.join(".cache", "pages"))
+PAGE_CACHE_VERSION = 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# 워커 프로세스에서 실행: PDF의 [start, stop) 페이지 텍스트 추출
+def _extract_pages(path, start, stop):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    return [
+        Document(
+            page_content=reader.pages[i].extract_text(),
+            metadata={"source": path, "page": i, "total_pages": total},
+        )
+        for i in range(start, min(stop, total))
+    ]
+
+
+def _page_count(path):
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def peak_rss_mb():
+    # 리눅스에서 ru_maxrss 단위는 KB (macOS는 바이트), 워커 프로세스(children)까지 포함
+    # resource 모듈이 없는 Windows에서는 None
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.chunks = 0
+
+    def pages_per_sec(self):
+        elapsed = time.perf_counter() - self.started
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        rss = peak_rss_mb()
+        return {
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "seconds": round(time.perf_counter() - self.started, 3),
+            "pages_per_sec": round(self.pages_per_sec(), 1),
+            "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        }
+
+
+# 여러 PDF의 페이지를 프로세스 풀에서 추출해서 순서대로 하나씩 흘려보냄
+# 동시에 처리 중인 작업 수를 제한해서 전체 코퍼스를 메모리에 올리지 않음
+def iter_pdf_pages(pdf_paths, workers=None, pages_per_task=PAGES_PER_TASK):
+    workers = workers or os.cpu_count() or 1
+    tasks = (
+        (path, start, start + pages_per_task)
+        for path in pdf_paths
+        for start in range(0, _page_count(path), pages_per_task)
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_extract_pages, *task))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _page_cache_path(cache_dir, sha):
+    return os.path.join(cache_dir, f"{sha}.json.gz")
+
+
+# 캐시된 페이지 텍스트 -> Document 목록 (없으면 None), metadata는 _extract_pages와 같음
+def load_cached_pages(path, sha, cache_dir=PAGE_CACHE_DIR):
+    cache_path = _page_cache_path(cache_dir, sha)
+    if not os.path.exists(cache_path):
+        return None
+    with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+        cached = json.load(f)
+    if cached.get("version") != PAGE_CACHE_VERSION:
+        return None
+    texts = cached["pages"]
+    return [
+        Document(page_content=text, metadata={"source": path, "page": i, "total_pages": len(texts)})
+        for i, text in enumerate(texts)
+    ]
+
+
+def save_cached_pages(sha, texts, cache_dir=PAGE_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = _page_cache_path(cache_dir, sha)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": PAGE_CACHE_VERSION, "pages": texts}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+
+# iter_pdf_pages와 같지만 PDF 파일 해시별로 추출한 페이지 텍스트를 gzip JSON으로 캐시
+# 청크 설정만 바뀌어서 다시 빌드할 때나 같은 PDF를 다른 경로로 읽을 때는 PDF를 파싱하지 않음
+# (캐시는 PDF 하나를 끝까지 읽었을 때만 저장)
+def iter_cached_pdf_pages(pdf_paths, cache_dir=PAGE_CACHE_DIR, workers=None, pages_per_task=PAGES_PER_TASK):
+    if not cache_dir:
+        yield from iter_pdf_pages(pdf_paths, workers, pages_per_task)
+        return
+    for path in pdf_paths:
+        sha = file_sha256(path)
+        pages = load_cached_pages(path, sha, cache_dir)
+        if pages is not None:
+            logger.info("page cache hit for %s (%d pages)", path, len(pages))
+            yield from pages
+            continue
+        started = time.perf_counter()
+        texts = []
+        for page in iter_pdf_pages([path], workers, pages_per_task):
+            texts.append(page.page_content)
+            yield page
+        save_cached_pages(sha, texts, cache_dir)
+        logger.info("extracted %d pages of %s in %.2fs", len(texts), path, time.perf_counter() - started)
+
+
+# 페이지 스트림 -> 청크 분할 -> 임베딩 배치 단위로 묶어서 흘려보냄
+# split_fn(page)은 (청크 리스트, 청크 ID 리스트)를 반환
+def iter_chunk_batches(pages, split_fn, batch_size=256, stats=None):
+    docs, ids = [], []
+    for page in pages:
+        if stats is not None:
+            stats.pages += 1
+        chunks, chunk_ids = split_fn(page)
+        docs.extend(chunks)
+        ids.extend(chunk_ids)
+        if len(docs) >= batch_size:
+            if stats is not None:
+                stats.chunks += len(docs)
+            yield docs, ids
+            docs, ids = [], []
+    if docs:
+        if stats is not None:
+            stats.chunks += len(docs)
+        yield docs, ids
@@ -0,0 +1,299 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableBranch, RunnableLambda
+
+from relevance import SCORE_KEY
+
+logger = logging.getLogger(__name__)
+
+# 법령 PDF 페이지 머리글 (법제처 ... 국가법령정보센터 / 법령 이름)
+_HEADER = re.compile(r"^\s*법제처\s+\d+\s+국가법령정보센터\s*$")
+_CHAPTER = re.compile(r"^\s*(제\d+장\s*\S.*?)\s*$")
+_SECTION = re.compile(r"^\s*제\d+[절관]\s*\S")
+_ARTICLE = re.compile(r"^제(\d+)조(?:의(\d+))?(?:\(([^)]*)\))?\s*")
+_PARAGRAPH = re.compile(r"([①-⑳])")
+ARTICLES_VERSION = 1
+
+# 질문 안의 조문 번호: "제10조", "제 37조 2항", "37조의2 제1항"
+# "제" 없이 쓴 번호는 뒤에 공백/의/항이 올 때만 조문으로 봄 ("예산 1조 원", "1조 2천억" 제외)
+_REFERENCE = re.compile(
+    r"(?:제\s*(\d+)\s*조|(?<![\d.])(\d+)\s*조(?=\s|의|항|$)(?!\s*(?:원|\d+\s*[천만억])))"
+    r"(?:\s*의\s*(\d+))?(?:\s*(?:제\s*)?(\d+)\s*항)?"
+)
+# 벡터 검색 청크의 조문 번호: "[제1장 총강]\n제1조 ...", "[부칙] 제1조\n①..."
+_CHUNK_ARTICLE = re.compile(r"^(?:\[([^\]]*)\]\s*)?제(\d+)조(?:의(\d+))?", re.M)
+
+# 긴 것부터 떼어냄 (조사/어미)
+_SUFFIXES = sorted([
+    "에서는", "에게서", "으로서", "으로써", "이라는", "에서", "에게", "으로", "부터", "까지", "이며", "이고",
+    "하는", "한다", "된다", "하여", "에는", "과의", "와의", "라는",
+    "은", "는", "이", "가", "을", "를", "의", "에", "와", "과", "도", "만", "로", "며",
+], key=len, reverse=True)
+_STOPWORDS = {
+    "무엇", "무엇인가요", "뭐야", "뭔가요", "내용", "내용은", "알려줘", "알려주세요", "어떻게", "대해", "대해서",
+    "관해", "관한", "몇", "있나요", "인가요", "설명", "설명해줘", "헌법", "조항",
+}
+
+
+def _stem(word):
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[:-len(suffix)]
+    return word
+
+
+# 한국어 토큰화: 어절에서 조사/어미를 떼고, 복합명사 부분 일치를 위해 음절 bigram도 추가
+def tokenize(text, with_bigrams=True):
+    tokens = []
+    for word in re.findall(r"[가-힣]+|[a-z]+|\d+", text.lower()):
+        if word in _STOPWORDS:
+            continue
+        stem = _stem(word) if "가" <= word[0] <= "힣" else word
+        tokens.append(stem)
+        if with_bigrams and "가" <= stem[0] <= "힣" and len(stem) > 2:
+            tokens.extend(stem[i:i + 2] for i in range(len(stem) - 1))
+    return tokens
+
+
+def find_references(text):
+    # [(조 번호 문자열, 항 번호 또는 None), ...]  예: "37조의2 1항" -> [("37의2", 1)]
+    refs = []
+    for prefixed, bare, sub, paragraph in _REFERENCE.findall(text):
+        article = prefixed or bare
+        key = f"{int(article)}의{int(sub)}" if sub else str(int(article))
+        refs.append((key, int(paragraph) if paragraph else None))
+    return refs
+
+
+class LexicalIndex:
+    # 조문 단위 BM25 역색인 + 조/항 번호 조회 표
+    def __init__(self, articles, k1=1.5, b=0.75):
+        self.articles = articles  # {"10": {"title", "chapter", "text", "paragraphs": {1: text}, "source", "page"}}
+        self.keys = list(articles)
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = []
+        for i, key in enumerate(self.keys):
+            counts = Counter(tokenize(articles[key]["text"]))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term][i] = tf
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.stats = {"article_lookups": 0, "lexical_only": 0, "hybrid": 0}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def document(self, key, paragraph=None):
+        article = self.articles[key]
+        text = article["text"]
+        if paragraph is not None and paragraph in article["paragraphs"]:
+            text = f"{article['title']} {chr(0x2460 + paragraph - 1)}{article['paragraphs'][paragraph]}"
+        metadata = {"source": article["source"], "page": article["page"], "article": key, "chapter": article["chapter"]}
+        if paragraph is not None:
+            metadata["paragraph"] = paragraph
+        return Document(page_content=text, metadata=metadata)
+
+    def has_reference(self, query):
+        return any(key in self.articles for key, _ in find_references(query))
+
+    # 질문에 조문 번호가 있으면 해당 조/항 Document 목록, 없으면 빈 리스트
+    def lookup(self, query):
+        docs = [self.document(key, paragraph) for key, paragraph in find_references(query) if key in self.articles]
+        if docs:
+            self.stats["article_lookups"] += 1
+        return docs
+
+    def search(self, query, k=4):
+        scores = defaultdict(float)
+        count = len(self.keys)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.document(self.keys[i]), score) for i, score in ranked]
+
+    # 짧고 모든 단어가 색인에 있는 키워드형 질문이면 임베딩 없이 BM25만으로 충분
+    def is_keyword_query(self, query, max_terms=3):
+        terms = tokenize(query, with_bigrams=False)
+        return 0 < len(terms) <= max_terms and all(term in self.postings for term in terms)
+
+
+# 페이지 Document 목록에서 장/조/항 구조를 읽어 조문 표 생성
+# 부칙의 조문(제1조~)은 본문 조문 번호와 겹치므로 "부칙1" 같은 키로 따로 저장
+# leading에 리스트를 넘기면 첫 조문 앞의 줄(전문, 앞 페이지에서 이어지는 항 등)을 모아줌
+def parse_articles(pages, leading=None):
+    articles = {}
+    chapter = None
+    current = None
+    prefix = ""
+    for page in pages:
+        for line in page.page_content.splitlines():
+            if _HEADER.match(line):
+                continue
+            stripped = line.strip()
+            if stripped.startswith("부칙"):
+                chapter, current, prefix = "부칙", None, "부칙"
+                continue
+            match = _CHAPTER.match(line)
+            if match and not _ARTICLE.match(stripped):
+                chapter = match.group(1)
+                current = None
+                continue
+            if _SECTION.match(line) and not _ARTICLE.match(stripped):
+                current = None
+                continue
+            match = _ARTICLE.match(stripped)
+            if match:
+                key = prefix + match.group(1) + (f"의{match.group(2)}" if match.group(2) else "")
+                current = {
+                    "title": stripped[:match.end()].strip(),
+                    "chapter": chapter,
+                    "lines": [stripped[match.end():]],
+                    "source": page.metadata.get("source"),
+                    "page": page.metadata.get("page"),
+                }
+                articles[key] = current
+            elif current is not None and stripped and stripped != "대한민국헌법":
+                current["lines"].append(stripped)
+            elif current is None and leading is not None and stripped and stripped != "대한민국헌법":
+                leading.append(stripped)
+
+    for article in articles.values():
+        # PDF 줄바꿈은 문장 중간에서도 일어나므로 이어붙임
+        body = "".join(article.pop("lines")).strip()
+        parts = _PARAGRAPH.split(body)
+        article["paragraphs"] = {
+            ord(marker) - 0x2460 + 1: text.strip() for marker, text in zip(parts[1::2], parts[2::2])
+        }
+        article["text"] = f"{article['title']} {body}"
+    return articles
+
+
+def build_lexical_index(pages=None, articles=None):
+    started = time.perf_counter()
+    index = LexicalIndex(articles if articles is not None else parse_articles(pages))
+    logger.info("lexical index: %d articles, %d terms in %.1f ms",
+                len(index), len(index.postings), (time.perf_counter() - started) * 1000)
+    return index
+
+
+# 조문 표 파일 (FAISS 인덱스 폴더 옆, 폴더는 빌드 결과로 통째로 바뀔 수 있어서 안에 두지 않음)
+def articles_path(index_dir):
+    return os.path.normpath(index_dir) + ".articles.json"
+
+
+# files: {PDF 경로: sha256}, 저장할 때와 다르면 None
+def load_articles(path, files):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("version") != ARTICLES_VERSION or saved.get("files") != files:
+        return None
+    articles = saved["articles"]
+    # JSON 키는 문자열이므로 항 번호를 다시 int로
+    for article in articles.values():
+        article["paragraphs"] = {int(number): text for number, text in article["paragraphs"].items()}
+    return articles
+
+
+def save_articles(path, articles, files):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": ARTICLES_VERSION, "files": files, "articles": articles}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# PDF 해시가 저장된 조문 표와 같으면 PDF 파싱 없이 조문 표로 색인을 만들고,
+# 아니면 (캐시된) 페이지 텍스트로 조문 표를 다시 만들어 index_dir 옆에 저장
+def load_or_build_lexical_index(pdf_paths, index_dir):
+    from ingest import file_sha256, iter_cached_pdf_pages
+
+    files = {path: file_sha256(path) for path in pdf_paths}
+    path = articles_path(index_dir)
+    articles = load_articles(path, files)
+    if articles is None:
+        articles = parse_articles(iter_cached_pdf_pages(pdf_paths))
+        save_articles(path, articles, files)
+        logger.info("saved %d articles to %s", len(articles), path)
+    return build_lexical_index(articles=articles)
+
+
+# 같은 조문이면 같은 키 (BM25 결과는 metadata["article"], 벡터 검색 청크는 본문 앞의 조 제목)
+def article_key(doc):
+    if "article" in doc.metadata:
+        return doc.metadata["article"]
+    match = _CHUNK_ARTICLE.search(doc.page_content)
+    if match is None:
+        return doc.page_content
+    chapter, article, sub = match.groups()
+    return ("부칙" if chapter == "부칙" else "") + article + (f"의{sub}" if sub else "")
+
+
+# Reciprocal Rank Fusion: 여러 검색 결과의 순위만으로 합침 (점수 척도가 달라도 됨)
+# 같은 조문은 한 번만 (먼저 나온 결과 목록의 문서를 씀, HybridRetriever는 BM25의 조문 전체)
+# 합친 문서에는 같은 조문의 벡터 검색 관련도 중 가장 높은 값을 붙임 (RelevanceGate가 BM25 문서로 가려진 점수도 보도록)
+def rrf_fuse(result_lists, k=60, limit=4):
+    scores = defaultdict(float)
+    docs = {}
+    relevance = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = article_key(doc)
+            scores[key] += 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+            if SCORE_KEY in doc.metadata:
+                relevance[key] = max(relevance.get(key, doc.metadata[SCORE_KEY]), doc.metadata[SCORE_KEY])
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    fused = []
+    for key in ranked:
+        doc = docs[key]
+        if key in relevance and doc.metadata.get(SCORE_KEY) != relevance[key]:
+            doc = doc.model_copy(update={"metadata": {**doc.metadata, SCORE_KEY: relevance[key]}})
+        fused.append(doc)
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    # 조문 번호 -> 조회 표, 키워드형 질문 -> BM25만, 나머지 -> BM25 + 벡터 검색 RRF
+    lexical_index: LexicalIndex
+    vector_retriever: BaseRetriever
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        docs = self.lexical_index.lookup(query)
+        if docs:
+            return docs
+        lexical = [doc for doc, _ in self.lexical_index.search(query, self.k)]
+        if lexical and self.lexical_index.is_keyword_query(query):
+            self.lexical_index.stats["lexical_only"] += 1
+            return lexical
+        self.lexical_index.stats["hybrid"] += 1
+        vector = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()} if run_manager else None)
+        return rrf_fuse([lexical, vector], limit=self.k)
+
+
+# 질문에 조문 번호가 있으면 질문 재작성(LLM)과 임베딩 없이 바로 조문을 반환하는 분기
+# default: 보통 create_history_aware_retriever(...) 결과
+def article_fast_path(lexical_index, default):
+    return RunnableBranch(
+        (lambda x: lexical_index.has_reference(x["input"]), RunnableLambda(lambda x: lexical_index.lookup(x["input"]))),
+        default,
+    ).with_config(run_name="article_fast_path")
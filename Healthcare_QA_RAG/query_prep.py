@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import threading
+import time
+from operator import itemgetter
+
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from tracing import trace_config
+
+logger = logging.getLogger(__name__)
+
+QUERY_PREP_SYSTEM_PROMPT = """
+아래 한국어 의학 질문을 영어 검색 질문으로 바꿔주세요.
+
+다음 규칙을 반드시 따르세요:
+
+1. **의학 용어**는 WHO 또는 국제적으로 공인된 **표준 의학 용어**로 번역할 것
+-> **일반적으로 쓰이는 용어가 아닌 전문적인 의학 용어로 번역하시오.**
+2. **공식 영어 용어가 2가지 이상 예측될 경우**, 가능성이 높은 순으로 3개로 리스트에 넣어 나열할 것 (예: "[ liver cirrhosis , hepatic cirrhosis ]")
+3. **공식 약어가 있는 경우**, 전체 용어를 먼저 쓰고 괄호 안에 약어를 함께 표기할 것 (예: "chronic obstructive pulmonary disease (COPD)")
+4. **리스트에 넣을 단어의 개수는 3개이다.(확률 높은 순)** (예: "what is [ coryza , upper respiratory infection , cold ]?")
+5. 이전 대화가 있으면 질문 속 지시어("그 약", "이것", "부작용은?")를 이전 대화의 약품/질병 이름으로 바꿔 **대화 없이도 이해되는 질문**으로 만들 것
+6. 질문에 답하지 말고, 결과는 **영어 한 문장**으로만 출력하며, **한국어는 포함하지 말 것**
+"""
+QUERY_PREP_HUMAN_TEMPLATE = "질문:\n{input}"
+
+
+def create_query_prep_chain(llm):
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", QUERY_PREP_SYSTEM_PROMPT),
+        MessagesPlaceholder("history"),
+        ("human", QUERY_PREP_HUMAN_TEMPLATE),
+    ])
+    return (prompt | llm | StrOutputParser()).with_config(run_name="query_prep")
+
+
+# 프롬프트/모델 버전: 바뀌면 번역 메모(TranslationMemo)의 이전 결과를 쓰지 않음
+def query_prep_version(llm):
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    source = f"{model}\x00{QUERY_PREP_SYSTEM_PROMPT}\x00{QUERY_PREP_HUMAN_TEMPLATE}"
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+class QueryPreparer:
+    # 검색 전 LLM 호출을 한 번으로: 번역 + 이전 대화 반영(지시어 해소) + 동의어 확장
+    # 이전 대화가 없으면 재작성할 것이 없으므로 번역만 하고, 결과는 memo(TranslationMemo)에 재사용
+    # 이전 대화가 있으면 같은 질문도 뜻이 달라지므로 memo를 쓰지 않음
+    def __init__(self, llm, memo=None, max_history=4, max_message_chars=500):
+        self.chain = create_query_prep_chain(llm)
+        self.version = query_prep_version(llm)
+        self.memo = memo
+        self.max_history = max_history
+        self.max_message_chars = max_message_chars
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "with_history": 0, "llm_calls": 0, "llm_ms": 0.0}
+
+    # 최근 max_history개 메시지만, 긴 답변은 앞부분만 (약품/질병 이름은 보통 앞에 나옴)
+    # 맨 앞의 이전 대화 요약(chat_store, SystemMessage)은 항상 남김
+    def _trim(self, history):
+        history = list(history)
+        summary = history[:1] if history and history[0].type == "system" else []
+        return [
+            message.model_copy(update={"content": str(message.content)[:self.max_message_chars]})
+            for message in summary + history[len(summary):][-self.max_history:]
+        ]
+
+    def _invoke(self, question, history):
+        started = time.perf_counter()
+        query = self.chain.invoke({"input": question, "history": history}, config=trace_config()).strip()
+        with self._lock:
+            self.stats["llm_calls"] += 1
+            self.stats["llm_ms"] += (time.perf_counter() - started) * 1000
+        return query
+
+    def prepare(self, question, history=()):
+        history = self._trim(history) if self.max_history else []
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["with_history"] += bool(history)
+        if history:
+            query = self._invoke(question, history)
+        elif self.memo is not None:
+            query = self.memo.translate(question, lambda text: self._invoke(text, []), self.version)
+        else:
+            query = self._invoke(question, [])
+        logger.info("prepared query (%d history messages): %s", len(history), query)
+        return query
+
+
+# create_history_aware_retriever 대신 쓰는 검색 단계: {"input", "history"} -> QueryPreparer로 준비한 질문으로 검색
+# 대화가 없으면 번역만 (메모에 있으면 LLM 호출 없음), 있으면 번역 + 지시어 해소를 LLM 한 번으로
+def query_prep_retriever(preparer, retriever):
+    return (
+        RunnableLambda(lambda x: preparer.prepare(x["input"], x.get("history") or ())) | retriever
+    ).with_config(run_name="retrieve_with_query_prep")
+
+
+# 이미 준비된(번역/재작성된) 질문으로 바로 검색하는 create_retrieval_chain용 검색 단계
+# create_history_aware_retriever와 달리 LLM을 다시 부르지 않음
+def prepared_query_retriever(retriever):
+    return (RunnableLambda(itemgetter("input")) | retriever).with_config(run_name="retrieve_prepared")
@@ -1,68 +1,62 @@
 import os
+import logging
+import uuid
 import streamlit as st
 
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
+
+from ann_index import index_config
+from batching import batched_retriever
+from chat_store import ChatStore, SQLiteChatMessageHistory, create_summarizer
+from context_packer import ContextPacker
+from embedding_cache import cached_openai_embeddings
+from index_manifest import load_or_build_pdf_vector_store
+from index_versions import open_index
+from query_prep import QueryPreparer, query_prep_retriever
+from relevance import RelevanceGate, create_gated_retrieval_chain, load_threshold
+from rerank import mmr_reranker
+from streaming import AnswerStream
+from structure_splitter import StructureTextSplitter
+from tracing import trace_request, trace_vectorstore
+from translation_memo import TranslationMemo
 
 from dotenv import load_dotenv
 load_dotenv()  # .env 파일에서 환경변수 로드
 
-#cache_resource로 한번 실행한 결과 캐싱해두기
-@st.cache_resource
-def load_pdf(file_path):
-    loader = PyPDFLoader(file_path)
-    return loader.load()
-
-#텍스트 청크들을 Chroma 안에 임베딩 벡터로 저장
-@st.cache_resource
-def create_vector_store(_docs):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = text_splitter.split_documents(_docs)
-
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-
-    # 저장
-    # FAISS 자체 저장 방식 사용
-    vectorstore.save_local("faiss_index")
-    return vectorstore
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
+#cache_resource로 한번 실행한 결과 캐싱해두기
 #만약 기존에 저장해둔 ChromaDB가 있는 경우, 이를 로드
 @st.cache_resource
-def get_vectorstore(_docs):
-    if os.path.exists("faiss_index/index.faiss"):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        return FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    else:
-        return create_vector_store(_docs)
+def get_vectorstore(pdf_path, quantizer=None, dim=None):
+    # 저장된 인덱스의 PDF 해시/설정이 그대로면 PDF 파싱 없이 바로 로드
+    # 아니면 (캐시된) 페이지 텍스트를 manifest와 비교해서 바뀐 페이지만 다시 임베딩
+    # 약품별 소제목 단위로 자르고 겹침 없음
+    text_splitter = StructureTextSplitter("monograph", chunk_size=1000)
+    embeddings = cached_openai_embeddings("text-embedding-3-small")
+    # quantizer: "fp16"/"int8", dim: 앞쪽 dim개 차원만 (None이면 FAISS_QUANTIZER/FAISS_DIM, 없으면 압축 안 함)
+    # 압축하면 검색 후보는 디스크의 원본 벡터로 다시 계산 (FAISS_RESCORE)
+    ann_config = index_config(quantizer=quantizer, dim=dim)
+    return load_or_build_pdf_vector_store([pdf_path], text_splitter, embeddings, "faiss_index", ann_config=ann_config)
     
 # PDF 문서 로드-벡터 DB 저장-검색기-히스토리 모두 합친 Chain 구축
 @st.cache_resource
 def initialize_components(selected_model):
     file_path = "who.pdf"
-    pages = load_pdf(file_path)
-    vectorstore = get_vectorstore(pages)
-    retriever = vectorstore.as_retriever()
-
-    # 채팅 히스토리 요약 시스템 프롬프트
-    contextualize_q_system_prompt = """Given a chat history and the latest user question \
-    which might reference context in the chat history, formulate a standalone question \
-    which can be understood without the chat history. Do NOT answer the question, \
-    just reformulate it if needed and otherwise return it as is."""
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", contextualize_q_system_prompt),
-            MessagesPlaceholder("history"),
-            ("human", "{input}"),
-        ]
-    )
+    # index_versions.py build로 미리 만든 버전이 있으면 PDF 파싱/임베딩 없이 로드하고, CURRENT가 바뀌면 교체
+    vectorstore = open_index("who", cached_openai_embeddings("text-embedding-3-small"))
+    # 관련 문서가 없는 질문(가장 높은 관련도가 인덱스별 threshold 미만)은 LLM 호출 없이 템플릿 답변
+    relevance_gate = RelevanceGate(load_threshold(vectorstore.root if vectorstore is not None else "faiss_index"))
+    if vectorstore is None:
+        # 쿼리 임베딩/검색 시간을 단계별로 기록
+        vectorstore = trace_vectorstore(get_vectorstore(file_path))
+    # 동시에 들어온 질문은 QUERY_BATCH_WINDOW_MS 동안 모아서 임베딩/FAISS 검색을 한 번에 (0이면 끔)
+    # 상위 MMR_FETCH_K개를 가져와서 거의 같은 청크는 빼고 MMR_K개만 남김 (MMR_FETCH_K <= MMR_K이면 상위 k개)
+    retriever = batched_retriever(vectorstore, reranker=mmr_reranker())
 
     # 질문-답변 시스템 프롬프트
     qa_system_prompt = """You are an assistant for question-answering tasks. \
@@ -80,48 +74,74 @@ def initialize_components(selected_model):
         ]
     )
 
-    llm = ChatOpenAI(model=selected_model)
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+    llm = ChatOpenAI(model=selected_model, stream_usage=True)
+    # 검색 질문은 streamlit_ui.py와 같은 QueryPreparer로 준비 (번역 + 이전 대화 반영을 LLM 한 번으로)
+    # 이전 대화가 없으면 번역 결과를 sqlite 메모에서 재사용하므로 같은 질문은 LLM 호출 없이 검색
+    query_preparer = QueryPreparer(llm, memo=TranslationMemo())
+    prepared_retriever = query_prep_retriever(query_preparer, retriever)
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # 같은 페이지의 겹치거나 이어지는 청크는 합치고, 토큰 예산(CONTEXT_TOKEN_BUDGET) 안에서 관련도 순으로 채움
+    retrieve_documents = prepared_retriever | relevance_gate.as_runnable() | ContextPacker().as_runnable()
+    rag_chain = create_gated_retrieval_chain(retrieve_documents, question_answer_chain, relevance_gate)
     return rag_chain
 
-# Streamlit UI
-st.header("의약품 및 질병 Q&A 챗봇 💬 🩺")
-option = st.selectbox("Select GPT Model", ("gpt-4o-mini", "gpt-3.5-turbo-0125"))
-rag_chain = initialize_components(option)
-chat_history = StreamlitChatMessageHistory(key="chat_messages")
-
-conversational_rag_chain = RunnableWithMessageHistory(
-    rag_chain,
-    lambda session_id: chat_history,
-    input_messages_key="input",
-    history_messages_key="history",
-    output_messages_key="answer",
-)
+def show_sources(context):
+    if not context:
+        return
+    with st.expander("참고 문서 확인"):
+        for doc in context:
+            preview = doc.page_content.strip().replace("\n", " ")[:500]
+            source = doc.metadata.get("display_source", doc.metadata.get("source", "알 수 없음"))
+            st.markdown(f"📄 **{source}**\n\n{preview}...")
 
+# 대화 기록은 sqlite에 저장 (streamlit_ui.py의 채팅 목록과 섞이지 않도록 다른 파일)
+@st.cache_resource
+def get_chat_store():
+    return ChatStore(os.path.join(".cache", "rag_chats.sqlite"))
 
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [{"role": "assistant", 
-                                    "content": "의약품 및 질병에 대해 무엇이든 물어보세요!"}]
+@st.cache_resource
+def get_summarizer():
+    return create_summarizer(ChatOpenAI(model="gpt-4o-mini"))
+
+# 브라우저 세션마다 채팅 하나, 프롬프트에는 최근 CHAT_HISTORY_TOKENS 토큰 안의 대화 + 그 이전 대화의 요약만 들어감
+def get_chat_history():
+    if "chat_id" not in st.session_state:
+        st.session_state["chat_id"] = uuid.uuid4().hex
+    return SQLiteChatMessageHistory(get_chat_store(), st.session_state["chat_id"], summarizer=get_summarizer())
+
+# Streamlit UI (streamlit run rag.py) - server.py처럼 import만 할 때는 실행되지 않음
+def main():
+    st.header("의약품 및 질병 Q&A 챗봇 💬 🩺")
+    option = st.selectbox("Select GPT Model", ("gpt-4o-mini", "gpt-3.5-turbo-0125"))
+    rag_chain = initialize_components(option)
+    chat_history = get_chat_history()
+
+    conversational_rag_chain = RunnableWithMessageHistory(
+        rag_chain,
+        lambda session_id: chat_history,
+        input_messages_key="input",
+        history_messages_key="history",
+        output_messages_key="answer",
+    )
 
-for msg in chat_history.messages:
-    st.chat_message(msg.type).write(msg.content)
+    if "messages" not in st.session_state:
+        st.session_state["messages"] = [{"role": "assistant", 
+                                        "content": "의약품 및 질병에 대해 무엇이든 물어보세요!"}]
 
+    # 화면에는 요약된 대화까지 전체 기록을 표시
+    for msg in chat_history.all_messages():
+        st.chat_message(msg.type).write(msg.content)
 
-if prompt_message := st.chat_input("Your question"):
-    st.chat_message("human").write(prompt_message)
-    with st.chat_message("ai"):
-        with st.spinner("Thinking..."):
+    if prompt_message := st.chat_input("Your question"):
+        st.chat_message("human").write(prompt_message)
+        with st.chat_message("ai"):
             config = {"configurable": {"session_id": "any"}}
-            response = conversational_rag_chain.invoke(
-                {"input": prompt_message},
-                config)
-            
-            answer = response['answer']
-            st.write(answer)
-            with st.expander("참고 문서 확인"):
-                for doc in response['context']:
-                        preview = doc.page_content.strip().replace("\n", " ")[:500]
-                        source = doc.metadata.get("display_source", doc.metadata.get("source", "알 수 없음"))
-                        st.markdown(f"📄 **{source}**\n\n{preview}...")
+            # 답변은 토큰 단위로 바로 출력하고, 참고 문서는 검색이 끝나는 즉시 답변 아래에 표시
+            answer_box = st.container()
+            with trace_request("who"):
+                response = AnswerStream(conversational_rag_chain, {"input": prompt_message}, config, on_context=show_sources)
+                answer_box.write_stream(response)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,44 @@
-import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
+import logging
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain_core.runnables.history import RunnableWithMessageHistory
 
-def load_pdf(file_path):
-    loader = PyPDFLoader(file_path)
-    return loader.load()
+from ann_index import index_config
+from context_packer import ContextPacker
+from embedding_cache import cached_openai_embeddings
+from query_prep import QueryPreparer, query_prep_retriever
+from relevance import RelevanceGate, create_gated_retrieval_chain, load_threshold
+from rerank import mmr_reranker
+from shards import ShardRegistry, ShardedRetriever
+from structure_splitter import StructureTextSplitter
+from translation_memo import TranslationMemo
 
-def create_vector_store(_docs, index_name):  # index_name 인자 추가
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = text_splitter.split_documents(_docs)
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-    vectorstore.save_local(f"faiss_index/{index_name}")  # 인덱스를 PDF 이름 기반으로 저장
-    return vectorstore
+logger = logging.getLogger(__name__)
 
-def get_vectorstore(_docs, index_name):
-    path = f"faiss_index/{index_name}/index.faiss"
-    if os.path.exists(path):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        return FAISS.load_local(f"faiss_index/{index_name}", embeddings, allow_dangerous_deserialization=True)
-    else:
-        return create_vector_store(_docs, index_name)
+# 약품별 소제목 단위로 자르고 겹침 없음 (구조가 없는 페이지는 1000자 단위)
+def create_text_splitter():
+    return StructureTextSplitter("monograph", chunk_size=1000)
 
-def initialize_rag_chain(*pdf_paths):
-    all_pages = []
-    for path in pdf_paths:
-        pages = load_pdf(path)
-        all_pages.extend(pages)  # 문서 리스트를 병합
+# PDF별 샤드 레지스트리 (index_type마다 하나, 프로세스 안에서 공유)
+_shard_registries = {}
 
-    # PDF 파일명을 합쳐 인덱스 이름 생성 (순서 고려)
-    index_name = "_".join([
-        os.path.splitext(os.path.basename(path))[0] for path in pdf_paths
-    ])
-
-    vectorstore = get_vectorstore(all_pages, index_name)
-    retriever = vectorstore.as_retriever()
-
-
-    contextualize_q_system_prompt = """Given a chat history and the latest user question \
-    which might reference context in the chat history, formulate a standalone question \
-    which can be understood without the chat history. Do NOT answer the question, \
-    just reformulate it if needed and otherwise return it as is."""
+def get_shard_registry(index_type=None):
+    key = index_type or ""
+    if key not in _shard_registries:
+        _shard_registries[key] = ShardRegistry(
+            create_text_splitter(), cached_openai_embeddings("text-embedding-3-small"), ann_config=index_config(index_type)
+        )
+    return _shard_registries[key]
 
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("history"),
-        ("human", "{input}")
-    ])
+def initialize_rag_chain(*pdf_paths, index_type=None):
+    # PDF마다 faiss_index/shards/<파일명> 샤드 하나 (PDF 조합/순서가 달라도 같은 샤드를 공유)
+    # 필요한 샤드만 로드해서 모두 검색한 뒤 상위 k개로 합침
+    # 쿼리 임베딩/검색 시간은 단계별로 기록 (tracing.trace_request 안에서 실행할 때)
+    registry = get_shard_registry(index_type)
+    # 샤드들에서 상위 MMR_FETCH_K개를 모아 거의 같은 청크는 빼고 MMR_K개만 남김
+    retriever = ShardedRetriever(registry=registry, sources=list(pdf_paths), reranker=mmr_reranker())
+    # 관련 문서가 없는 질문(가장 높은 관련도가 threshold 미만)은 LLM 호출 없이 템플릿 답변
+    relevance_gate = RelevanceGate(load_threshold(registry.root))
 
     qa_system_prompt = """You are an assistant for question-answering tasks. \
     Use the following pieces of retrieved context to answer the question. \
@@ -68,9 +54,14 @@ def initialize_rag_chain(*pdf_paths):
         ("human", "{input}")
     ])
 
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+    llm = ChatOpenAI(model="gpt-4o-mini", stream_usage=True)
+    # 검색 질문은 rag.py와 같은 QueryPreparer로 준비 ({"input", "history"} -> 번역 + 이전 대화 반영을 LLM 한 번으로)
+    # create_history_aware_retriever는 "chat_history" 키가 없으면 재작성을 건너뛰므로 쓰지 않음
+    query_preparer = QueryPreparer(llm, memo=TranslationMemo())
+    prepared_retriever = query_prep_retriever(query_preparer, retriever)
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # 같은 페이지의 겹치거나 이어지는 청크는 합치고, 토큰 예산(CONTEXT_TOKEN_BUDGET) 안에서 관련도 순으로 채움
+    retrieve_documents = prepared_retriever | relevance_gate.as_runnable() | ContextPacker().as_runnable()
+    rag_chain = create_gated_retrieval_chain(retrieve_documents, question_answer_chain, relevance_gate)
 
     return rag_chain
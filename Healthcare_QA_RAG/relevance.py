@@ -0,0 +1,261 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+
+from ann_index import search_vectors
+from tracing import current_trace, trace_store
+
+logger = logging.getLogger(__name__)
+
+# 검색된 문서 metadata에 들어가는 관련도 (질문과의 코사인 유사도)
+SCORE_KEY = "relevance_score"
+CALIBRATION_FILE = "relevance.json"
+# 보정 파일도 환경변수도 없을 때의 기본값 (관련 없는 질문만 걸러지도록 낮게)
+DEFAULT_THRESHOLD = 0.2
+NOT_FOUND_ANSWER = (
+    "죄송합니다. 제공된 문서에서 질문과 관련된 내용을 찾지 못했습니다. (자료에 따르면 제공되지 않음)\n\n"
+    "약품명이나 질병명을 포함해서 다시 질문해 주세요."
+)
+
+# 보정용 질문 (번역/재작성을 거친 뒤의 영어 질문 기준)
+IN_DOMAIN_QUESTIONS = [
+    "What are the side effects of morphine?",
+    "What is the recommended dose of amoxicillin for children?",
+    "What are the contraindications of aspirin?",
+    "How is paracetamol used for fever and pain?",
+    "What drugs are used to treat malaria?",
+    "What are the precautions for using insulin?",
+    "How should metformin be taken for type 2 diabetes?",
+    "What are the adverse effects of ibuprofen?",
+    "Which antibiotics are used for tuberculosis?",
+    "What is the use of oral rehydration salts?",
+    "What are the interactions of warfarin?",
+    "How is hypertension treated with medicines?",
+]
+OFF_TOPIC_QUESTIONS = [
+    "What is the capital of France?",
+    "How do I bake a chocolate cake?",
+    "Who won the football world cup in 2018?",
+    "How do I reset my router password?",
+    "What is the best programming language for web development?",
+    "Recommend a good movie to watch tonight.",
+    "How many planets are in the solar system?",
+    "What is the exchange rate between dollars and euros?",
+    "How do I change a flat tire?",
+    "Write a poem about the ocean.",
+    "What time is sunset in Seoul today?",
+    "How do I learn to play the guitar?",
+]
+
+
+# FAISS 거리 -> 코사인 유사도 (OpenAI 임베딩은 길이가 1이라 L2 제곱 거리 d에 대해 1 - d/2)
+def relevance_scores(vectorstore, distances):
+    distances = np.asarray(distances, dtype=np.float32)
+    if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return distances
+    return 1.0 - distances / 2.0
+
+
+# [(문서, 거리)] -> 관련도를 metadata에 넣은 문서 복사본 (docstore의 문서는 여러 요청이 공유하므로 복사)
+def scored_documents(vectorstore, docs_and_distances):
+    if not docs_and_distances:
+        return []
+    scores = relevance_scores(vectorstore, [distance for _, distance in docs_and_distances])
+    return [
+        doc.model_copy(update={"metadata": {**doc.metadata, SCORE_KEY: float(score)}})
+        for (doc, _), score in zip(docs_and_distances, scores)
+    ]
+
+
+def top_score(docs):
+    scores = [doc.metadata[SCORE_KEY] for doc in docs if SCORE_KEY in doc.metadata]
+    return max(scores) if scores else None
+
+
+# 질문 벡터로 상위 k개 [(문서, 거리)] (FAISS.similarity_search_with_score_by_vector와 같은 모양)
+# 압축 인덱스면 원본 벡터로 다시 계산한 거리 (ann_index.search_vectors)
+def vector_search(vectorstore, vector, k=4):
+    distances, indices = search_vectors(vectorstore, [vector], k)
+    return [
+        (vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]), float(distance))
+        for i, distance in zip(indices[0], distances[0]) if i != -1
+    ]
+
+
+def _search(vectorstore, vector, k, reranker):
+    if reranker is None:
+        return scored_documents(vectorstore, vector_search(vectorstore, vector, k))
+    return scored_documents(vectorstore, reranker.search(vectorstore, vector))
+
+
+# 상위 k개 검색 + 관련도 (reranker: rerank.MMRReranker를 주면 fetch_k개를 가져와서 MMR로 reranker.k개)
+def scored_search(vectorstore, query, k=4, reranker=None):
+    return _search(vectorstore, vectorstore.embedding_function.embed_query(query), k, reranker)
+
+
+async def ascored_search(vectorstore, query, k=4, reranker=None):
+    return _search(vectorstore, await vectorstore.embedding_function.aembed_query(query), k, reranker)
+
+
+class ScoredRetriever(BaseRetriever):
+    # vectorstore.as_retriever()와 같지만 문서마다 관련도(metadata["relevance_score"])를 붙여서 반환
+    vectorstore: object
+    k: int = 4
+    reranker: object = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return scored_search(self.vectorstore, query, self.k, self.reranker)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return await ascored_search(self.vectorstore, query, self.k, self.reranker)
+
+
+def _embed_questions(vectorstore, questions):
+    embeddings = vectorstore.embedding_function
+    # CachedEmbeddings.embed_queries: 질문 벡터는 디스크 캐시에 넣지 않음
+    embed = getattr(embeddings, "embed_queries", None) or embeddings.embed_documents
+    return np.asarray(embed(questions), dtype=np.float32)
+
+
+# 질문마다 가장 관련도 높은 청크의 점수
+def question_top_scores(vectorstore, questions):
+    distances, _ = search_vectors(vectorstore, _embed_questions(vectorstore, questions), 1)
+    return [float(score) for score in relevance_scores(vectorstore, distances[:, 0])]
+
+
+# 문서 관련 질문은 최대한 남기고 관련 없는 질문은 최대한 거르는 threshold
+# (남긴 관련 질문 수 - 남긴 무관 질문 수)가 가장 큰 값 중 가장 낮은 값을 고르고,
+# 그 아래의 가장 높은 무관 질문 점수와의 중간으로 내림
+def choose_threshold(in_scores, off_scores):
+    best, best_gain = min(in_scores), None
+    for candidate in sorted(in_scores):
+        gain = sum(s >= candidate for s in in_scores) - sum(s >= candidate for s in off_scores)
+        if best_gain is None or gain > best_gain:
+            best, best_gain = candidate, gain
+    below = [s for s in off_scores if s < best]
+    return (best + max(below)) / 2 if below else best
+
+
+def calibrate(vectorstore, index_dir, in_domain=IN_DOMAIN_QUESTIONS, off_topic=OFF_TOPIC_QUESTIONS):
+    in_scores = question_top_scores(vectorstore, list(in_domain))
+    off_scores = question_top_scores(vectorstore, list(off_topic))
+    threshold = choose_threshold(in_scores, off_scores)
+    calibration = {
+        "threshold": threshold,
+        "created": time.time(),
+        "in_domain": {"count": len(in_scores), "min": min(in_scores), "mean": float(np.mean(in_scores)),
+                      "kept": sum(s >= threshold for s in in_scores)},
+        "off_topic": {"count": len(off_scores), "max": max(off_scores), "mean": float(np.mean(off_scores)),
+                      "kept": sum(s >= threshold for s in off_scores)},
+    }
+    with open(os.path.join(index_dir, CALIBRATION_FILE), "w", encoding="utf-8") as f:
+        json.dump(calibration, f, indent=1)
+    logger.info("calibrated relevance threshold for %s: %.3f", index_dir, threshold)
+    return calibration
+
+
+# RELEVANCE_THRESHOLD 환경변수 > 인덱스 폴더의 보정 결과(relevance.json) > DEFAULT_THRESHOLD
+def load_threshold(index_dir):
+    if os.environ.get("RELEVANCE_THRESHOLD"):
+        return float(os.environ["RELEVANCE_THRESHOLD"])
+    path = os.path.join(index_dir, CALIBRATION_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["threshold"]
+    return DEFAULT_THRESHOLD
+
+
+class RelevanceGate:
+    # 가장 관련도 높은 문서도 threshold 미만이면 검색 결과를 비워서 LLM 호출 없이 answer(템플릿 답변)로 응답
+    # 관련도가 없는 문서(점수를 안 주는 검색기)는 그대로 통과
+    # stats의 saved_ms: 건너뛴 답변 생성 시간 추정치 (최근 요청들의 generate 단계 평균)
+    def __init__(self, threshold=DEFAULT_THRESHOLD, answer=NOT_FOUND_ANSWER):
+        self.threshold = threshold
+        self.answer = answer
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "skipped": 0, "saved_ms": 0.0}
+
+    def filter(self, docs):
+        score = top_score(docs)
+        with self._lock:
+            self.stats["checked"] += 1
+        if score is None or score >= self.threshold:
+            return docs
+        logger.info("no relevant documents (top score %.3f < %.3f), skipping generation", score, self.threshold)
+        return []
+
+    def _respond(self, inputs):
+        saved_ms = trace_store.percentiles().get("generate", {}).get("mean", 0.0)
+        with self._lock:
+            self.stats["skipped"] += 1
+            self.stats["saved_ms"] += saved_ms
+        trace = current_trace()
+        if trace is not None:
+            trace.record("gate", 0.0, skipped=1, saved_ms=saved_ms)
+        return self.answer
+
+    # 검색기 뒤에 붙이는 Runnable: retriever | gate.as_runnable() | packer.as_runnable()
+    def as_runnable(self):
+        return RunnableLambda(self.filter).with_config(run_name="relevance_gate")
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["skip_rate"] = stats["skipped"] / stats["checked"] if stats["checked"] else 0.0
+        return stats
+
+
+# create_retrieval_chain과 같은 입출력 ({"input", ...} -> {..., "context", "answer"})
+# context가 비었으면(gate가 걸렀으면) combine_docs_chain 대신 gate의 템플릿 답변
+def create_gated_retrieval_chain(retriever, combine_docs_chain, gate):
+    if isinstance(retriever, BaseRetriever):
+        retrieval_docs = (lambda x: x["input"]) | retriever
+    else:
+        retrieval_docs = retriever
+    answer = RunnableBranch(
+        (lambda x: not x["context"], RunnableLambda(gate._respond).with_config(run_name="not_found_answer")),
+        combine_docs_chain,
+    )
+    return (
+        RunnablePassthrough.assign(context=retrieval_docs.with_config(run_name="retrieve_documents"))
+        .assign(answer=answer)
+        .with_config(run_name="retrieval_chain")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="calibrate the relevance threshold of a saved FAISS index")
+    parser.add_argument("index_dir", help="저장된 인덱스 폴더 (예: faiss_index)")
+    parser.add_argument("--output-dir", default=None, help="relevance.json 저장 위치 (기본: index_dir)")
+    parser.add_argument("--in-domain", default=None, help="문서 관련 질문 파일 (한 줄에 하나, 영어)")
+    parser.add_argument("--off-topic", default=None, help="관련 없는 질문 파일 (한 줄에 하나, 영어)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from chunk_store import load_vector_store
+    from embedding_cache import cached_openai_embeddings
+
+    def read_questions(path, default):
+        if path is None:
+            return default
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    vectorstore = load_vector_store(args.index_dir, cached_openai_embeddings("text-embedding-3-small"))
+    calibration = calibrate(
+        vectorstore, args.output_dir or args.index_dir,
+        read_questions(args.in_domain, IN_DOMAIN_QUESTIONS), read_questions(args.off_topic, OFF_TOPIC_QUESTIONS),
+    )
+    print(json.dumps(calibration, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from ann_index import search_vectors, stored_vectors
+from tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+# FAISS에서 MMR_FETCH_K개를 먼저 가져와서 그중 MMR_K개를 고름 (MMR_FETCH_K <= MMR_K이면 재정렬 안 함)
+DEFAULT_K = int(os.environ.get("MMR_K", 4))
+DEFAULT_FETCH_K = int(os.environ.get("MMR_FETCH_K", 20))
+# 1이면 관련도만, 0이면 다양성만
+DEFAULT_LAMBDA = float(os.environ.get("MMR_LAMBDA", 0.5))
+
+
+# maximal marginal relevance: 질문과 가깝고 이미 고른 문서와는 먼 순서로 k개 (후보 위치 목록 반환)
+# 후보끼리의 유사도 행렬을 한 번에 계산하고, 고를 때마다 "고른 문서와의 최대 유사도" 벡터만 갱신
+def mmr_select(query_vector, vectors, k, lambda_mult=DEFAULT_LAMBDA):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    chosen = np.zeros(len(vectors), dtype=bool)
+    chosen[selected[0]] = True
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def _document(vectorstore, i):
+    return vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+
+
+class MMRReranker:
+    # 검색을 fetch_k개로 넓힌 뒤, 저장된 벡터(ann_index.stored_vectors)로 MMR을 해서 k개만 남김
+    # (같은 페이지의 거의 같은 청크가 상위 k개를 채우지 않도록)
+    def __init__(self, k=DEFAULT_K, fetch_k=DEFAULT_FETCH_K, lambda_mult=DEFAULT_LAMBDA):
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "candidates": 0, "selected": 0, "ms": 0.0}
+
+    # 후보 벡터 중 고른 위치 (질문 벡터는 검색에 쓴 것 그대로)
+    def select(self, query_vector, vectors, k=None):
+        started = time.perf_counter()
+        selected = mmr_select(query_vector, vectors, k or self.k, self.lambda_mult)
+        ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["candidates"] += len(vectors)
+            self.stats["selected"] += len(selected)
+            self.stats["ms"] += ms
+        trace = current_trace()
+        if trace is not None:
+            trace.record("mmr", ms, candidates=len(vectors), selected=len(selected))
+        return selected
+
+    # 질문 벡터 하나로 검색 + 재정렬, 반환값: [(문서, 거리)] (FAISS similarity_search_with_score와 같은 모양)
+    def search(self, vectorstore, query_vector, k=None):
+        distances, indices = search_vectors(vectorstore, [query_vector], max(self.fetch_k, k or self.k))
+        candidates = [(int(i), float(d)) for i, d in zip(indices[0], distances[0]) if i != -1]
+        if not candidates:
+            return []
+        vectors = stored_vectors(vectorstore, [i for i, _ in candidates])
+        return [
+            (_document(vectorstore, candidates[p][0]), candidates[p][1])
+            for p in self.select(query_vector, vectors, k)
+        ]
+
+
+# MMR_FETCH_K가 k보다 크지 않으면 None (재정렬 없이 상위 k개)
+def mmr_reranker(k=DEFAULT_K, fetch_k=DEFAULT_FETCH_K, lambda_mult=DEFAULT_LAMBDA):
+    if fetch_k <= k:
+        return None
+    return MMRReranker(k, fetch_k, lambda_mult)
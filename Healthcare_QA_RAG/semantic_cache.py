@@ -0,0 +1,160 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 질문 형식/물어보는 항목을 나타내는 단어 (나머지 단어 = 약품/질병 이름, 용량 숫자, 대상 등)
+GENERIC_TERMS = {
+    # 한국어 (lexical_index.tokenize로 조사를 뗀 형태)
+    "뭔가", "무엇인가", "어떤", "있어", "있어요", "되나요", "하나요", "알려주세요", "주세요", "궁금해요", "대한",
+    "부작용", "이상반응", "용량", "용법", "복용", "복용법", "투여", "투여량", "금기", "금기증", "주의", "주의사항",
+    "효과", "효능", "치료", "치료법", "치료제", "증상", "원인", "사용", "사용법", "상호작용", "방법", "경우", "약물",
+    # 영어 (대화가 있을 때는 재작성된 영어 질문으로 조회)
+    "what", "which", "how", "is", "are", "the", "a", "an", "of", "for", "in", "to", "and", "or", "with", "about",
+    "does", "do", "can", "should", "be", "tell", "me", "please", "side", "effects", "effect", "adverse", "dose",
+    "dosage", "recommended", "use", "uses", "used", "treat", "treatment", "treated", "contraindications",
+    "precautions", "interactions",
+}
+
+
+def normalize_question(text):
+    # 전각/반각, 공백, 문장부호, 대소문자 차이는 같은 질문으로 봄
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"[\s\?\!\.,~·…\"'“”‘’]+", " ", text).strip().lower()
+
+
+# 답변을 가르는 단어 집합: 임베딩이 비슷해도("모르핀 부작용" / "옥시코돈 부작용") 이 집합이 다르면 다른 질문
+def key_terms(question):
+    return frozenset(term for term in tokenize(normalize_question(question), with_bigrams=False)
+                     if term not in GENERIC_TERMS)
+
+
+class _Entry:
+    def __init__(self, question, vector, answer, context):
+        self.question = question
+        self.terms = key_terms(question)
+        self.vector = vector
+        self.answer = answer
+        self.context = context
+        self.created = time.time()
+
+
+class SemanticCache:
+    # 질문 임베딩의 코사인 유사도가 threshold 이상이고 핵심 단어(key_terms)가 같으면 저장된 답변/참고 문서를 그대로 반환
+    # 참고 문서가 없는 답변(relevance gate의 템플릿 답변 등)은 저장하지 않음
+    # ttl(초)이 지난 항목은 버리고, max_entries를 넘으면 가장 오래 안 쓴 항목부터 삭제 (LRU)
+    # 인덱스 버전이 바뀌면(문서가 다시 색인되면) 전체 무효화
+    def __init__(self, embeddings, threshold=0.93, ttl=24 * 3600, max_entries=1000, index_version=None):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_version = index_version
+        self._entries = OrderedDict()
+        self._exact = {}
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self.stats = {"hits": 0, "exact_hits": 0, "misses": 0, "term_mismatches": 0, "skipped_stores": 0,
+                      "evictions": 0, "invalidations": 0, "lookup_ms": 0.0}
+
+    def set_index_version(self, version):
+        with self._lock:
+            if version != self.index_version:
+                if self._entries:
+                    self.stats["invalidations"] += 1
+                    logger.info("semantic cache invalidated: index version %s -> %s", self.index_version, version)
+                self._entries.clear()
+                self._exact.clear()
+                self._matrix = None
+                self.index_version = version
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.ttl]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        if self._exact.get(normalize_question(entry.question)) == key:
+            del self._exact[normalize_question(entry.question)]
+        self._matrix = None
+
+    # 반환값: (entry 또는 None, 질문 벡터) - 미스일 때 store()에 벡터를 다시 넘기면 임베딩을 한 번만 함
+    def lookup(self, question):
+        started = time.perf_counter()
+        with self._lock:
+            self._expire()
+            # 완전히 같은 질문이면 임베딩 호출도 생략
+            key = self._exact.get(normalize_question(question))
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["exact_hits"] += 1
+                self.stats["lookup_ms"] += (time.perf_counter() - started) * 1000
+                return self._entries[key], None
+
+        vector = self._embed(question)
+        started = time.perf_counter()
+        with self._lock:
+            entry = None
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[k].vector for k in self._keys])
+                scores = self._matrix @ vector
+                terms = key_terms(question)
+                # threshold 이상인 항목 중 핵심 단어가 같은 가장 비슷한 항목
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    if self._entries[self._keys[i]].terms != terms:
+                        self.stats["term_mismatches"] += 1
+                        continue
+                    key = self._keys[i]
+                    self._entries.move_to_end(key)
+                    entry = self._entries[key]
+                    break
+            self.stats["hits" if entry else "misses"] += 1
+            self.stats["lookup_ms"] += (time.perf_counter() - started) * 1000
+        return entry, vector
+
+    def store(self, question, answer, context, vector=None):
+        if not context or not answer.strip():
+            with self._lock:
+                self.stats["skipped_stores"] += 1
+            return
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = _Entry(question, vector, answer, context)
+            self._exact[normalize_question(question)] = key
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def metrics(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(
+            self.stats,
+            entries=len(self._entries),
+            hit_rate=self.stats["hits"] / lookups if lookups else 0.0,
+            avg_lookup_ms=self.stats["lookup_ms"] / lookups if lookups else 0.0,
+        )
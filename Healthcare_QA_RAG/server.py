@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from aiohttp import web
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from chat_store import DEFAULT_HISTORY_TOKENS, ChatStore, SQLiteChatMessageHistory
+from tracing import trace_config, trace_request, trace_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.environ.get("RAG_MODEL", "gpt-4o-mini")
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("RAG_MAX_CONCURRENCY", 8))
+DEFAULT_MAX_SESSIONS = int(os.environ.get("RAG_MAX_SESSIONS", 1000))
+DEFAULT_SESSION_STORE_PATH = os.environ.get("RAG_SESSION_STORE_PATH", os.path.join(".cache", "server_chats.sqlite"))
+
+
+class SessionHistories:
+    # session_id -> 대화 기록 (chat_store의 sqlite), 세션이 max_sessions개를 넘으면 가장 오래 안 쓴 세션부터 삭제
+    # 프롬프트에는 최근 CHAT_HISTORY_TOKENS 토큰 안의 대화 + 그 이전 대화의 요약만 들어감 (summarizer가 없으면 버림)
+    def __init__(self, max_sessions=DEFAULT_MAX_SESSIONS, store=None, summarizer=None, max_tokens=DEFAULT_HISTORY_TOKENS):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.store = store if store is not None else ChatStore(DEFAULT_SESSION_STORE_PATH)
+        self.summarizer = summarizer
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.store.count_chats()
+
+    def _history(self, session_id):
+        return SQLiteChatMessageHistory(self.store, session_id, max_tokens=self.max_tokens, summarizer=self.summarizer)
+
+    def get(self, session_id):
+        with self._lock:
+            if not self.store.has_chat(session_id):
+                self.store.create_chat(chat_id=session_id)
+                self.store.prune(self.max_sessions)
+        return self._history(session_id)
+
+    def find(self, session_id):
+        return self._history(session_id) if self.store.has_chat(session_id) else None
+
+    def pop(self, session_id):
+        with self._lock:
+            if not self.store.has_chat(session_id):
+                return None
+            history = self._history(session_id)
+            self.store.delete_chat(session_id)
+            return history
+
+
+# 동시 실행 수 제한 + /health용 대기/실행 카운트
+# 대기 중에 클라이언트가 끊겨 취소되어도 waiting이 남지 않도록 acquire를 try/finally로 감쌈
+@contextlib.asynccontextmanager
+async def _admitted(app):
+    stats = app["stats"]
+    stats["waiting"] += 1
+    try:
+        await app["semaphore"].acquire()
+    finally:
+        stats["waiting"] -= 1
+    stats["active"] += 1
+    try:
+        yield
+    finally:
+        stats["active"] -= 1
+        stats["requests"] += 1
+        app["semaphore"].release()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _source(doc):
+    return {
+        "source": doc.metadata.get("display_source", doc.metadata.get("source")),
+        "page": doc.metadata.get("page"),
+        "preview": doc.page_content.strip().replace("\n", " ")[:500],
+    }
+
+
+# POST /chat {"question": "...", "session_id": "..."(선택)}
+# 응답은 server-sent events: session -> context(참고 문서) -> token(답변 조각)... -> done (실패하면 error)
+async def chat(request):
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="request body must be JSON")
+    question = str(payload.get("question") or "").strip()
+    if not question:
+        raise web.HTTPBadRequest(text="question is required")
+    session_id = str(payload.get("session_id") or uuid.uuid4().hex)
+
+    app = request.app
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Session-Id": session_id,
+    })
+    await response.prepare(request)
+    await response.write(_sse("session", {"session_id": session_id}))
+
+    async with _admitted(app):
+        answer = ""
+        try:
+            with trace_request("server") as trace:
+                config = trace_config({"configurable": {"session_id": session_id}})
+                async for chunk in app["chain"].astream({"input": question}, config):
+                    if "context" in chunk:
+                        await response.write(_sse("context", [_source(doc) for doc in chunk["context"]]))
+                    token = chunk.get("answer")
+                    if token:
+                        trace.first_token()
+                        answer += token
+                        await response.write(_sse("token", {"text": token}))
+            await response.write(_sse("done", {
+                "answer": answer, "request_id": trace.request_id, "ttft_ms": trace.ttft_ms, "total_ms": trace.total_ms,
+            }))
+        except ConnectionResetError:
+            logger.info("client disconnected (session %s)", session_id)
+            return response
+        except Exception as e:
+            logger.exception("chat request failed (session %s)", session_id)
+            await response.write(_sse("error", {"message": str(e)}))
+    await response.write_eof()
+    return response
+
+
+async def get_session(request):
+    history = request.app["histories"].find(request.match_info["session_id"])
+    if history is None:
+        raise web.HTTPNotFound(text="unknown session")
+    return web.json_response(
+        {"messages": [{"role": message.type, "content": message.content} for message in history.all_messages()]}
+    )
+
+
+async def delete_session(request):
+    if request.app["histories"].pop(request.match_info["session_id"]) is None:
+        raise web.HTTPNotFound(text="unknown session")
+    return web.json_response({"deleted": True})
+
+
+async def health(request):
+    app = request.app
+    return web.json_response({
+        "status": "ok",
+        "sessions": len(app["histories"]),
+        "max_concurrency": app["max_concurrency"],
+        **app["stats"],
+    })
+
+
+async def stats(request):
+    return web.json_response(trace_store.percentiles())
+
+
+# rag_chain: create_retrieval_chain 체인 (없으면 시작할 때 rag.initialize_components(model)로 한 번만 로드)
+# 모든 연결이 같은 체인/인덱스를 쓰고, 동시에 실행하는 체인은 max_concurrency개까지 (나머지는 대기)
+# histories: 테스트 등에서 다른 SessionHistories(임시 sqlite 파일)를 넘길 때
+def create_app(rag_chain=None, model=DEFAULT_MODEL, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+               max_sessions=DEFAULT_MAX_SESSIONS, histories=None):
+    app = web.Application()
+    app["histories"] = histories if histories is not None else SessionHistories(max_sessions)
+    app["max_concurrency"] = max_concurrency
+    app["stats"] = {"active": 0, "waiting": 0, "requests": 0}
+
+    async def load_chain(app):
+        app["semaphore"] = asyncio.Semaphore(max_concurrency)
+        chain = rag_chain
+        if chain is None:
+            from rag import initialize_components
+
+            started = time.perf_counter()
+            chain = await asyncio.get_running_loop().run_in_executor(None, initialize_components, model)
+            logger.info("loaded rag chain (%s) in %.1f s", model, time.perf_counter() - started)
+            if app["histories"].summarizer is None:
+                from chat_store import create_summarizer
+                from langchain_openai import ChatOpenAI
+
+                # 오래된 대화는 요약해서 프롬프트에 넣음
+                app["histories"].summarizer = create_summarizer(ChatOpenAI(model=model))
+        app["chain"] = RunnableWithMessageHistory(
+            chain,
+            app["histories"].get,
+            input_messages_key="input",
+            history_messages_key="history",
+            output_messages_key="answer",
+        )
+
+    app.on_startup.append(load_chain)
+    app.add_routes([
+        web.post("/chat", chat),
+        web.get("/sessions/{session_id}", get_session),
+        web.delete("/sessions/{session_id}", delete_session),
+        web.get("/health", health),
+        web.get("/stats", stats),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG QA HTTP server (SSE streaming, per-session history)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(
+        create_app(model=args.model, max_concurrency=args.max_concurrency, max_sessions=args.max_sessions),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
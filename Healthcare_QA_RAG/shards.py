@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.retrievers import BaseRetriever
+
+from ann_index import index_config, index_memory_bytes, search_vectors, stored_vectors
+from chunk_store import chunk_store_bytes
+from index_manifest import load_or_build_pdf_vector_store
+from relevance import scored_documents, vector_search
+from tracing import trace_vectorstore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_ROOT = os.path.join("faiss_index", "shards")
+DEFAULT_MEMORY_BUDGET_MB = float(os.environ.get("SHARD_MEMORY_BUDGET_MB", 512))
+
+
+# 문서 하나 = 샤드 하나 (폴더 이름은 "PDF 파일 이름-절대 경로 해시")
+# 다른 폴더의 같은 이름 PDF가 같은 샤드를 덮어쓰지 않도록 경로 해시를 붙임
+def shard_name(pdf_path):
+    digest = hashlib.sha256(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(pdf_path))[0]}-{digest}"
+
+
+# 샤드가 차지하는 메모리: 인덱스 + 원본 벡터(압축 인덱스) + 청크 저장소(메모리 매핑)
+def shard_memory_bytes(vectorstore, shard_dir):
+    full_vectors = getattr(vectorstore, "full_vectors", None)
+    size = index_memory_bytes(vectorstore.index) + chunk_store_bytes(shard_dir)
+    return size + (full_vectors.nbytes if full_vectors is not None else 0)
+
+
+class ShardRegistry:
+    # PDF별 인덱스 샤드를 필요할 때 로드하고, 로드된 샤드의 인덱스 메모리 합이 memory_budget_mb를 넘으면
+    # 가장 오래 안 쓴 샤드부터 내림 (지금 검색에 쓰는 샤드는 내리지 않음)
+    # PDF 조합이 달라도 샤드는 공유하므로 조합마다 인덱스를 따로 만들지 않음
+    def __init__(self, text_splitter, embeddings, root=DEFAULT_SHARD_ROOT, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                 ann_config=None):
+        self.text_splitter = text_splitter
+        self.embeddings = embeddings
+        self.root = root
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.ann_config = ann_config or index_config()
+        self._loaded = OrderedDict()  # pdf_path -> (vectorstore, bytes)
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="shard-search")
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def shard_dir(self, pdf_path):
+        return os.path.join(self.root, shard_name(pdf_path))
+
+    def _load(self, pdf_path):
+        started = time.perf_counter()
+        # manifest 기준으로 PDF/청크 설정/인덱스 종류가 그대로면 PDF를 읽지 않고 바로 로드
+        # 새 문서이거나 바뀐 문서면 바뀐 페이지만 다시 임베딩 (index_manifest)
+        vectorstore = load_or_build_pdf_vector_store(
+            [pdf_path], self.text_splitter, self.embeddings, self.shard_dir(pdf_path), ann_config=self.ann_config
+        )
+        # 쿼리 임베딩/검색 시간을 단계별로 기록
+        vectorstore = trace_vectorstore(vectorstore)
+        size = shard_memory_bytes(vectorstore, self.shard_dir(pdf_path))
+        logger.info("loaded shard %s: %d vectors, %.1f MB in %.2fs",
+                    shard_name(pdf_path), vectorstore.index.ntotal, size / 1024 / 1024, time.perf_counter() - started)
+        return vectorstore, size
+
+    def _evict(self, keep):
+        while sum(size for _, size in self._loaded.values()) > self.memory_budget:
+            victim = next((path for path in self._loaded if path not in keep), None)
+            if victim is None:
+                break
+            self._loaded.pop(victim)
+            self.stats["evictions"] += 1
+            logger.info("evicted shard %s (memory budget %.0f MB)", shard_name(victim), self.memory_budget / 1024 / 1024)
+
+    def get(self, pdf_path, keep=()):
+        with self._lock:
+            if pdf_path in self._loaded:
+                self._loaded.move_to_end(pdf_path)
+                self.stats["hits"] += 1
+                return self._loaded[pdf_path][0]
+            # 같은 샤드를 여러 요청이 동시에 로드하지 않도록 샤드별 잠금
+            loading = self._loading.setdefault(pdf_path, threading.Lock())
+        with loading:
+            with self._lock:
+                if pdf_path in self._loaded:
+                    self._loaded.move_to_end(pdf_path)
+                    return self._loaded[pdf_path][0]
+            vectorstore, size = self._load(pdf_path)
+            with self._lock:
+                self._loaded[pdf_path] = (vectorstore, size)
+                self.stats["loads"] += 1
+                self._evict(set(keep) | {pdf_path})
+                self._loading.pop(pdf_path, None)
+        return vectorstore
+
+    def loaded(self):
+        with self._lock:
+            return {shard_name(path): size for path, (_, size) in self._loaded.items()}
+
+    def _map(self, search, shards):
+        if len(shards) == 1:
+            return [search(shards[0])]
+        return list(self._pool.map(search, shards))
+
+    # 샤드마다 fetch_k개 -> 거리 기준으로 합쳐서 fetch_k개 -> 샤드별로 벡터를 복원해서 MMR로 reranker.k개
+    def _mmr_search(self, shards, vector, reranker, reverse):
+        fetch_k = reranker.fetch_k
+        candidates = []
+        for shard, (distances, indices) in zip(shards, self._map(lambda vs: search_vectors(vs, [vector], fetch_k), shards)):
+            candidates += [(shard, int(i), float(d)) for i, d in zip(indices[0], distances[0]) if i != -1]
+        candidates.sort(key=lambda item: item[2], reverse=reverse)
+        candidates = candidates[:fetch_k]
+        if not candidates:
+            return []
+        vectors = np.empty((len(candidates), len(vector)), dtype=np.float32)
+        for shard in shards:
+            positions = [p for p, (owner, _, _) in enumerate(candidates) if owner is shard]
+            if positions:
+                vectors[positions] = stored_vectors(shard, [candidates[p][1] for p in positions])
+        selected = [candidates[p] for p in reranker.select(vector, vectors)]
+        return scored_documents(shards[0], [
+            (shard.docstore.search(shard.index_to_docstore_id[i]), distance) for shard, i, distance in selected
+        ])
+
+    # 질문 임베딩은 한 번만 하고, 샤드마다 상위 k개를 찾아 거리 기준으로 합쳐서 상위 k개 (관련도를 붙여서 반환)
+    # reranker(rerank.MMRReranker)를 주면 후보를 fetch_k개로 넓혀서 MMR로 reranker.k개
+    def search(self, pdf_paths, query, k=4, reranker=None):
+        shards = [self.get(path, keep=pdf_paths) for path in pdf_paths]
+        vector = shards[0].embedding_function.embed_query(query)
+        # L2 거리는 작을수록, 내적은 클수록 가까움 (샤드는 같은 임베딩 모델/거리 방식)
+        reverse = shards[0].distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+        if reranker is not None:
+            return self._mmr_search(shards, vector, reranker, reverse)
+        results = self._map(lambda vs: vector_search(vs, vector, k), shards)
+        merged = [item for result in results for item in result]
+        merged.sort(key=lambda item: item[1], reverse=reverse)
+        return scored_documents(shards[0], merged[:k])
+
+
+class ShardedRetriever(BaseRetriever):
+    # 여러 PDF 샤드를 한 번에 검색하는 검색기 (sources: PDF 경로 목록)
+    registry: ShardRegistry
+    sources: list
+    k: int = 4
+    reranker: object = None
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.registry.search(self.sources, query, self.k, self.reranker)
@@ -0,0 +1,47 @@
+import logging
+import time
+
+from tracing import current_trace, trace_config
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerStream:
+    # create_retrieval_chain 체인을 stream()으로 실행해서 답변 토큰만 하나씩 내보내는 이터레이터
+    # (st.write_stream에 그대로 넘길 수 있음)
+    # 검색이 끝나 context가 도착하면 on_context(docs)를 바로 호출하고,
+    # 첫 토큰까지 걸린 시간(TTFT)과 검색/전체 시간을 기록
+    # trace_request() 안에서 실행하면 단계별 시간도 현재 요청 trace에 기록됨
+    def __init__(self, chain, inputs, config=None, on_context=None):
+        self.chain = chain
+        self.inputs = inputs
+        self.config = config
+        self.on_context = on_context
+        self.answer = ""
+        self.context = []
+        self.retrieval_ms = None
+        self.ttft_ms = None
+        self.total_ms = None
+
+    def __iter__(self):
+        started = time.perf_counter()
+        trace = current_trace()
+        for chunk in self.chain.stream(self.inputs, trace_config(self.config)):
+            if "context" in chunk:
+                self.context = chunk["context"]
+                self.retrieval_ms = (time.perf_counter() - started) * 1000
+                if self.on_context is not None:
+                    self.on_context(self.context)
+            token = chunk.get("answer")
+            if token:
+                if self.ttft_ms is None:
+                    self.ttft_ms = (time.perf_counter() - started) * 1000
+                    if trace is not None:
+                        trace.first_token()
+                self.answer += token
+                yield token
+        self.total_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            "time to first token %.0f ms (retrieval %.0f ms, total %.0f ms, %d chars)",
+            self.ttft_ms or self.total_ms, self.retrieval_ms or 0.0, self.total_ms, len(self.answer),
+        )
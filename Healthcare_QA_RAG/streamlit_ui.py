@@ -1,78 +1,72 @@
 import os
+import logging
+import uuid
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain_core.runnables.history import RunnableWithMessageHistory
-import streamlit as st
-import streamlit.components.v1 as components
-from langchain_core.runnables import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-
-llm = ChatOpenAI(model="gpt-4o-mini")
-
-def create_translation_chain(llm):
-    translation_prompt = PromptTemplate.from_template("""
-아래 한국어 의학 질문을 영어로 번역해주세요.
-
-다음 규칙을 반드시 따르세요:
-
-1. **의학 용어**는 WHO 또는 국제적으로 공인된 **표준 의학 용어**로 번역할 것
--> **일반적으로 쓰이는 용어가 아닌 전문적인 의학 용어로 번역하시오.**
-2. **공식 영어 용어가 2가지 이상 예측될 경우**, 가능성이 높은 순으로 3개로 리스트에 넣어 나열할 것 (예: "[ liver cirrhosis , hepatic cirrhosis ]")
-3. **공식 약어가 있는 경우**, 전체 용어를 먼저 쓰고 괄호 안에 약어를 함께 표기할 것 (예: "chronic obstructive pulmonary disease (COPD)")
-4. **리스트에 넣을 단어의 개수는 3개이다.(확률 높은 순)** (예: "what is [ coryza , upper respiratory infection , cold ]?")
-5. 번역 결과는 **영어 한 문장**으로 출력하며, **한국어는 포함하지 말 것**
-
-질문:
-{input}
-""")
-    return LLMChain(llm=llm, prompt=translation_prompt)
 
+from ann_index import index_config
+from chat_store import ChatStore, SQLiteChatMessageHistory, create_summarizer
+from context_packer import ContextPacker
+from embedding_cache import cached_openai_embeddings
+from index_manifest import index_version, load_or_build_pdf_vector_store
+from index_versions import open_index
+from query_prep import QueryPreparer, prepared_query_retriever
+from relevance import RelevanceGate, ScoredRetriever, create_gated_retrieval_chain, load_threshold
+from rerank import mmr_reranker
+from semantic_cache import SemanticCache
+from streaming import AnswerStream
+from structure_splitter import StructureTextSplitter
+from tracing import trace_request, trace_store, trace_vectorstore
+from translation_memo import TranslationMemo
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+llm = ChatOpenAI(model="gpt-4o-mini", stream_usage=True)
+
+# 번역 + 이전 대화 반영을 LLM 한 번으로 처리 (대화가 없을 때의 번역 결과는 sqlite 메모에서 재사용)
 @st.cache_resource
-def load_pdf(file_path):
-    loader = PyPDFLoader(file_path)
-    return loader.load()
+def get_query_preparer():
+    return QueryPreparer(llm, memo=TranslationMemo())
 
 @st.cache_resource
-def create_vector_store(_docs):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = text_splitter.split_documents(_docs)
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-    vectorstore.save_local("faiss_index")
-    return vectorstore
+def get_vectorstore(pdf_path, quantizer=None, dim=None):
+    # 저장된 인덱스의 PDF 해시/설정이 그대로면 PDF 파싱 없이 바로 로드
+    # 아니면 (캐시된) 페이지 텍스트를 manifest와 비교해서 바뀐 페이지만 다시 임베딩
+    # 약품별 소제목 단위로 자르고 겹침 없음
+    text_splitter = StructureTextSplitter("monograph", chunk_size=1000)
+    embeddings = cached_openai_embeddings("text-embedding-3-small")
+    # quantizer: "fp16"/"int8", dim: 앞쪽 dim개 차원만 (None이면 FAISS_QUANTIZER/FAISS_DIM, 없으면 압축 안 함)
+    # 압축하면 검색 후보는 디스크의 원본 벡터로 다시 계산 (FAISS_RESCORE)
+    ann_config = index_config(quantizer=quantizer, dim=dim)
+    return load_or_build_pdf_vector_store([pdf_path], text_splitter, embeddings, "faiss_index", ann_config=ann_config)
+    
+# index_versions.py build로 미리 만든 버전이 있으면 PDF 파싱/임베딩 없이 로드하고, CURRENT가 바뀌면 교체
+@st.cache_resource
+def get_index_handle():
+    return open_index("who", cached_openai_embeddings("text-embedding-3-small"))
 
+# 관련 문서가 없는 질문(가장 높은 관련도가 인덱스별 threshold 미만)은 LLM 호출 없이 템플릿 답변
+# threshold는 python relevance.py faiss_index 로 보정 (index_versions 버전은 --output-dir index_versions/who)
 @st.cache_resource
-def get_vectorstore(_docs):
-    if os.path.exists("faiss_index/index.faiss"):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        return FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    else:
-        return create_vector_store(_docs)
-    
+def get_relevance_gate():
+    index_handle = get_index_handle()
+    return RelevanceGate(load_threshold(index_handle.root if index_handle is not None else "faiss_index"))
+
 @st.cache_resource
 def initialize_rag_chain(pdf_path):
-    pages = load_pdf(pdf_path)
-    vectorstore = get_vectorstore(pages)
-    retriever = vectorstore.as_retriever()
-    
-    contextualize_q_system_prompt = """Given a chat history and the latest user question \
-    which might reference context in the chat history, formulate a standalone question \
-    which can be understood without the chat history. Do NOT answer the question, \
-    just reformulate it if needed and otherwise return it as is."""
-    
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("history"),
-        ("human", "{input}")
-    ])
+    index_handle = get_index_handle()
+    # 상위 MMR_FETCH_K개를 가져와서 거의 같은 청크는 빼고 MMR_K개만 남김 (MMR_FETCH_K <= MMR_K이면 상위 k개)
+    reranker = mmr_reranker()
+    if index_handle is not None:
+        retriever = index_handle.as_retriever(reranker=reranker)
+    else:
+        # 쿼리 임베딩/검색 시간을 단계별로 기록
+        vectorstore = trace_vectorstore(get_vectorstore(pdf_path))
+        # 문서마다 관련도(metadata["relevance_score"])를 붙여서 반환
+        retriever = ScoredRetriever(vectorstore=vectorstore, reranker=reranker)
     
     qa_system_prompt = """당신은 의료 분야에 특화된 질문 응답 도우미입니다.
 
@@ -133,17 +127,95 @@ def initialize_rag_chain(pdf_path):
         ("human", "{input}")
     ])
     
-    history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # 입력은 get_query_preparer()로 이미 번역/재작성된 영어 질문이므로 검색 전에 LLM을 다시 부르지 않음
+    # 같은 페이지의 겹치거나 이어지는 청크는 합치고, 토큰 예산(CONTEXT_TOKEN_BUDGET) 안에서 관련도 순으로 채움
+    # 관련도가 threshold 미만이면 검색 결과를 비우고 답변 생성 대신 템플릿 답변
+    relevance_gate = get_relevance_gate()
+    retrieve_documents = prepared_query_retriever(retriever) | relevance_gate.as_runnable() | ContextPacker().as_runnable()
+    rag_chain = create_gated_retrieval_chain(retrieve_documents, question_answer_chain, relevance_gate)
     
     return rag_chain
 
+# 채팅 목록/대화 기록은 sqlite에 저장 (브라우저를 닫거나 새로고침해도 남음)
+@st.cache_resource
+def get_chat_store():
+    return ChatStore()
+
+@st.cache_resource
+def get_summarizer():
+    return create_summarizer(llm)
+
+# 현재 채팅의 대화 기록 (chat_id가 없으면 새 채팅, 채팅은 첫 질문을 저장할 때 목록에 추가됨)
+# 프롬프트에는 최근 CHAT_HISTORY_TOKENS 토큰 안의 대화 + 그 이전 대화의 요약만 들어감
+def get_chat_history():
+    if "chat_id" not in st.session_state:
+        st.session_state["chat_id"] = uuid.uuid4().hex
+    return SQLiteChatMessageHistory(get_chat_store(), st.session_state["chat_id"], summarizer=get_summarizer())
+
+# 비슷한 질문(임베딩 유사도)이 이미 답변된 적 있으면 번역/검색/생성 없이 저장된 답변 사용
+@st.cache_resource
+def get_answer_cache():
+    return SemanticCache(cached_openai_embeddings("text-embedding-3-small"))
+
+def show_sources(context):
+    if not context:
+        return
+    with st.expander("참고 문서 확인"):
+        for doc in context:
+            preview = doc.page_content.strip().replace("\n", " ")[:500]
+            source = doc.metadata.get("display_source", doc.metadata.get("source", "알 수 없음"))
+            st.markdown(f"📄 **{source}**\n\n{preview}...")
+
+def answer_question(prompt_message, rag_chain, chat_history):
+    answer_cache = get_answer_cache()
+    index_handle = get_index_handle()
+    answer_cache.set_index_version(index_handle.version if index_handle else index_version("faiss_index"))
+
+    query_preparer = get_query_preparer()
+
+    # 번역/임베딩/검색/생성 단계별 시간은 통계 페이지에서 확인
+    with trace_request("who"):
+        with st.chat_message("ai"):
+            with st.spinner("Thinking..."):
+                # 방금 추가한 현재 질문을 뺀 이전 대화 (길어졌으면 여기서 오래된 대화를 요약)
+                history = chat_history.messages[:-1]
+                if history:
+                    # 이전 대화에 기대는 질문("그 약의 부작용은?")은 원문이 같아도 뜻이 다르므로
+                    # 1. 대화를 반영한 독립적인 영어 질문으로 먼저 바꾸고, 그 질문으로 캐시 조회
+                    translated_input = query_preparer.prepare(prompt_message, history)
+                    cache_key = translated_input
+                else:
+                    cache_key = prompt_message
+                cached, query_vector = answer_cache.lookup(cache_key)
+                if cached is None and not history:
+                    # 1. 한국어 질문 → 영어 번역 (메모에 있으면 LLM 호출 생략, 대화 재작성 호출 없음)
+                    translated_input = query_preparer.prepare(prompt_message)  # 영어 질문
+
+            if cached is not None:
+                answer, context = cached.answer, cached.context
+                logger.info("semantic cache hit: %s", answer_cache.metrics())
+                st.write(answer)
+                st.caption("⚡ 이전에 답변한 비슷한 질문의 결과입니다.")
+                show_sources(context)
+            else:
+                # 2. 영어 질문 → 문서 기반 QA 수행 (답변은 한국어로 생성됨)
+                # 답변은 토큰 단위로 바로 출력하고, 참고 문서는 검색이 끝나는 즉시 답변 아래에 표시
+                answer_box = st.container()
+                response = AnswerStream(rag_chain, {"input": translated_input, "history": []}, on_context=show_sources)
+                answer_box.write_stream(response)
+                answer, context = response.answer, response.context
+                answer_cache.store(cache_key, answer, context, query_vector)
+
+            chat_history.add_ai_message(answer)     # 한국어 응답
+
 #####################################################################################################################
 
 if "page" not in st.session_state:
     st.session_state["page"] = "home"
 
+CHAT_PAGE_SIZE = 10
+
 def sidebar_menu():
     with st.sidebar:
         st.markdown("""
@@ -166,52 +238,6 @@ def sidebar_menu():
                 background-color: #e0e0e0;
                 border-color: #999999;
             }
-            .chat-list-item {
-                padding: 0.5rem 0.75rem;
-                border-radius: 8px;
-                cursor: pointer;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-bottom: 4px;
-                transition: background-color 0.2s ease;
-            }
-            .chat-list-item:hover {
-                background-color: #f0f0f5;
-            }
-            .chat-more-button {
-                background: none;
-                border: none;
-                font-size: 18px;
-                cursor: pointer;
-                color: #555;
-            }
-            .chat-context-menu {
-                position: absolute;
-                background: white;
-                border: 1px solid #ccc;
-                border-radius: 8px;
-                box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-                z-index: 1000;
-                padding: 0.5rem;
-                display: none;
-            }
-            .chat-context-menu.show {
-                display: block;
-            }
-            .chat-context-menu-item {
-                padding: 0.4rem 0.8rem;
-                cursor: pointer;
-                transition: background-color 0.2s ease;
-            }
-            .chat-context-menu-item:hover {
-                background-color: #f5f5f5;
-            }
-            .chat-list-container {
-                flex-grow: 1;  /* 유동적으로 늘어남 */
-                overflow-y: auto;
-                margin-bottom: 1rem;
-            }
             .sidebar-bottom {
                 margin-top: auto;
                 text-align: right;
@@ -231,7 +257,7 @@ def sidebar_menu():
 
         if st.button("💬 새 채팅", use_container_width=True):
             st.session_state["page"] = "chat"
-            st.session_state["messages"] = []
+            st.session_state.pop("chat_id", None)
             st.rerun()
 
         st.markdown("<hr style='margin: 0.5rem 0 1.5rem 0;'>", unsafe_allow_html=True)
@@ -239,81 +265,40 @@ def sidebar_menu():
         st.markdown("##### 이전 채팅", unsafe_allow_html=True)
 
         # -------------- 채팅 리스트 ----------------
-        st.markdown("<div class='chat-list-container'>", unsafe_allow_html=True)
-
-        components.html("""
-        <div id="chat_list_container"></div>
-        <script>
-        function loadChatList() {
-            const chats = JSON.parse(localStorage.getItem("chat_list") || "[]");
-            const chatListDiv = document.getElementById("chat_list_container");
-            chatListDiv.innerHTML = "";
-
-            if (chats.length === 0) {
-                chatListDiv.innerHTML = "<p style='color: #999; font-size: 14px; text-align: center; margin-top: 0.5rem;'>저장된 채팅이 없습니다.</p>";
-                return;
-            }
-
-            chats.forEach((chat, i) => {
-                const chat_id = chat.id;
-                const chat_name = chat.name;
-                const menu_id = "menu_" + chat_id;
-
-                const chatItem = document.createElement("div");
-                chatItem.className = "chat-list-item";
-                chatItem.onclick = () => window.parent.postMessage({ type: 'SELECT_CHAT', chat_id: chat_id }, '*');
-
-                const chatNameSpan = document.createElement("span");
-                chatNameSpan.textContent = chat_name;
-
-                const moreButton = document.createElement("button");
-                moreButton.className = "chat-more-button";
-                moreButton.textContent = "⋯";
-                moreButton.onclick = (event) => {
-                    event.stopPropagation();
-                    toggleContextMenu(menu_id);
-                };
-
-                chatItem.appendChild(chatNameSpan);
-                chatItem.appendChild(moreButton);
-
-                const contextMenu = document.createElement("div");
-                contextMenu.id = menu_id;
-                contextMenu.className = "chat-context-menu";
-                contextMenu.innerHTML = `
-                    <div class="chat-context-menu-item" onclick="window.parent.postMessage({ type: 'RENAME_CHAT', chat_id: '${chat_id}' }, '*')">이름 바꾸기</div>
-                    <div class="chat-context-menu-item" onclick="window.parent.postMessage({ type: 'DELETE_CHAT', chat_id: '${chat_id}' }, '*')">삭제</div>
-                `;
-                chatListDiv.appendChild(chatItem);
-                chatListDiv.appendChild(contextMenu);
-            });
-        }
-
-        function toggleContextMenu(id) {
-            var menus = document.querySelectorAll('.chat-context-menu');
-            menus.forEach(menu => {
-                if (menu.id === id) {
-                    menu.classList.toggle('show');
-                } else {
-                    menu.classList.remove('show');
-                }
-            });
-        }
-
-        document.addEventListener('click', function(event) {
-            if (!event.target.matches('.chat-more-button')) {
-                var menus = document.querySelectorAll('.chat-context-menu');
-                menus.forEach(menu => {
-                    menu.classList.remove('show');
-                });
-            }
-        });
-
-        setTimeout(loadChatList, 100);
-        </script>
-        """, height=150)  # 최소 높이만 잡아줌
+        # 서버(sqlite)에 저장된 채팅을 최근 대화 순으로 CHAT_PAGE_SIZE개씩
+        chat_store = get_chat_store()
+        page = st.session_state.get("chat_page", 0)
+        chats, total = chat_store.list_chats(page=page, page_size=CHAT_PAGE_SIZE)
+        if not chats and page > 0:
+            # 마지막 페이지의 채팅을 모두 지운 경우
+            st.session_state["chat_page"] = page - 1
+            st.rerun()
 
-        st.markdown("</div>", unsafe_allow_html=True)  # chat-list-container 끝
+        if not chats:
+            st.markdown("<p style='color: #999; font-size: 14px; text-align: center; margin-top: 0.5rem;'>저장된 채팅이 없습니다.</p>", unsafe_allow_html=True)
+
+        for chat in chats:
+            name_col, delete_col = st.columns([5, 1])
+            if name_col.button(chat["title"], key=f"chat_{chat['id']}", use_container_width=True):
+                st.session_state["chat_id"] = chat["id"]
+                st.session_state["page"] = "chat"
+                st.rerun()
+            if delete_col.button("🗑", key=f"delete_{chat['id']}"):
+                chat_store.delete_chat(chat["id"])
+                if st.session_state.get("chat_id") == chat["id"]:
+                    st.session_state.pop("chat_id")
+                st.rerun()
+
+        pages = (total + CHAT_PAGE_SIZE - 1) // CHAT_PAGE_SIZE
+        if pages > 1:
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            if prev_col.button("◀", disabled=page == 0):
+                st.session_state["chat_page"] = page - 1
+                st.rerun()
+            page_col.markdown(f"<p style='text-align: center; margin-top: 0.5rem;'>{page + 1} / {pages}</p>", unsafe_allow_html=True)
+            if next_col.button("▶", disabled=page >= pages - 1):
+                st.session_state["chat_page"] = page + 1
+                st.rerun()
 
         # -------------- 하단 버튼 ----------------
         st.markdown("<hr style='margin: 0.5rem 0 1.5rem 0;'>", unsafe_allow_html=True)
@@ -321,6 +306,10 @@ def sidebar_menu():
         if st.button("📄 PDF 보기", use_container_width=True):
             st.session_state["page"] = "pdf_view"
             st.rerun()
+
+        if st.button("📊 응답 시간 통계", use_container_width=True):
+            st.session_state["page"] = "stats"
+            st.rerun()
     
 def show_home():
     st.markdown("""
@@ -337,6 +326,7 @@ def show_home():
     if first_question:
         st.session_state["page"] = "chat"
         st.session_state["first_question"] = first_question
+        st.session_state.pop("chat_id", None)
         st.rerun()
     
 
@@ -364,69 +354,22 @@ def show_chat():
     pdf_path = os.path.join(BASE_DIR, "who.pdf")
     rag_chain = initialize_rag_chain(pdf_path)
 
-    chat_history = StreamlitChatMessageHistory(key="chat_messages")
+    chat_history = get_chat_history()
 
-    
-    if "messages" not in st.session_state or st.session_state["messages"] == []:
-        st.session_state["messages"] = [{
-            "role": "assistant",
-            "content": "의약품 및 질병에 대해 무엇이든 물어보세요!"
-        }]
-        if "first_question" in st.session_state:
-            prompt_message = st.session_state.pop("first_question")
-            if prompt_message:
-                # 0. 대화 기록에 "한국어 질문" 수동 저장
-                chat_history.add_user_message(prompt_message)       # 한국어 질문
-                st.chat_message("human").write(prompt_message)
-
-            with st.chat_message("ai"):
-                with st.spinner("Thinking..."):
-                    config = {"configurable": {"session_id": "any"}}
-                    # 1. 한국어 질문 → 영어 번역
-                    translation_chain = create_translation_chain(llm)
-                    translated = translation_chain.invoke({"input": prompt_message})
-                    translated_input = translated['text']  # 영어 질문
-
-                    # 2. 영어 질문 → 문서 기반 QA 수행 (답변은 한국어로 생성됨)
-                    response = rag_chain.invoke({"input": translated_input, "history": [] })
-                    answer = response['answer']
-                    chat_history.add_ai_message(response["answer"])     # 한국어 응답
-                    st.write(answer)
-
-                    with st.expander("참고 문서 확인"):
-                        for doc in response['context']:
-                            preview = doc.page_content.strip().replace("\n", " ")[:500]
-                            source = doc.metadata.get("display_source", doc.metadata.get("source", "알 수 없음"))
-                            st.markdown(f"📄 **{source}**\n\n{preview}...")
-
-    for msg in chat_history.messages[2:]:
+    st.chat_message("ai").write("의약품 및 질병에 대해 무엇이든 물어보세요!")
+    for msg in chat_history.all_messages():
         st.chat_message(msg.type).write(msg.content)
-    
-    prompt_message = st.chat_input("질문을 입력하세요", key="chat_input_chat")
+
+    # 홈 화면에서 입력한 첫 질문
+    first_question = st.session_state.pop("first_question", None)
+    prompt_message = st.chat_input("질문을 입력하세요", key="chat_input_chat") or first_question
     if prompt_message:
-        # 0. 기록
+        # 0. 대화 기록에 "한국어 질문" 저장 (새 채팅이면 첫 질문을 제목으로 목록에 추가)
+        get_chat_store().create_chat(title=prompt_message[:30], chat_id=chat_history.chat_id)
         chat_history.add_user_message(prompt_message)
         st.chat_message("human").write(prompt_message)
 
-        with st.chat_message("ai"):
-            with st.spinner("Thinking..."):
-                config = {"configurable": {"session_id": "any"}}
-                # 1. 한국어 질문 → 영어 번역
-                translation_chain = create_translation_chain(llm)
-                translated = translation_chain.invoke({"input": prompt_message})
-                translated_input = translated['text']  # 영어 질문
-
-                # 2. 영어 질문 → 문서 기반 QA 수행 (답변은 한국어로 생성됨)
-                response = rag_chain.invoke({"input": translated_input, "history": [] })
-                answer = response['answer']
-                chat_history.add_ai_message(response["answer"])     # 한국어 응답
-                st.write(answer)
-
-                with st.expander("참고 문서 확인"):
-                    for doc in response['context']:
-                        preview = doc.page_content.strip().replace("\n", " ")[:500]
-                        source = doc.metadata.get("display_source", doc.metadata.get("source", "알 수 없음"))
-                        st.markdown(f"📄 **{source}**\n\n{preview}...")
+        answer_question(prompt_message, rag_chain, chat_history)
 
 def show_pdf_view():
     st.header("📄 PDF 보기")
@@ -450,6 +393,46 @@ def show_pdf_view():
         st.markdown(f"<h2 style='font-size:1.5rem;'>🔗 <a href='{ref['url']}' target='_blank'>{ref['name']}</a></h2>", unsafe_allow_html=True)
 
 
+def show_stats():
+    # 관리자만 볼 수 있음
+    if not st.session_state.get("logged_in"):
+        st.session_state["page"] = "login"
+        st.rerun()
+
+    st.header("📊 응답 시간 통계")
+    st.markdown("<hr>", unsafe_allow_html=True)
+
+    stats = trace_store.percentiles()
+    if not stats:
+        st.info("아직 기록된 요청이 없습니다.")
+        return
+
+    st.markdown("##### 단계별 지연 시간 (ms, 최근 요청 기준)")
+    st.dataframe(
+        [{"단계": stage, **{k: round(v, 1) for k, v in row.items()}} for stage, row in stats.items()],
+        use_container_width=True,
+    )
+
+    gate = get_relevance_gate().metrics()
+    st.markdown("##### 관련 문서 없음 조기 응답")
+    checked_col, skipped_col, saved_col = st.columns(3)
+    checked_col.metric("검색한 질문", gate["checked"])
+    skipped_col.metric("생략한 답변 생성", gate["skipped"], f"{gate['skip_rate']:.0%}")
+    saved_col.metric("절약한 시간 (추정)", f"{gate['saved_ms'] / 1000:.1f} s")
+    st.caption(f"관련도 threshold: {get_relevance_gate().threshold:.3f}")
+
+    st.markdown("##### 최근 요청")
+    for record in reversed(trace_store.recent(10)):
+        with st.expander(f"{record['request_id']} · {record['app']} · {record['total_ms']:.0f} ms"):
+            st.json(record)
+
+    st.download_button(
+        "JSONL 내보내기",
+        data=trace_store.to_jsonl(),
+        file_name="rag_traces.jsonl",
+        mime="application/jsonl",
+    )
+
 def show_login():
     st.header("🔐 로그인 페이지")
     username = st.text_input("아이디")
@@ -477,6 +460,9 @@ elif st.session_state["page"] == "chat":
 elif st.session_state["page"] == "pdf_view":
     with page_placeholder.container():
         show_pdf_view()
+elif st.session_state["page"] == "stats":
+    with page_placeholder.container():
+        show_stats()
 elif st.session_state["page"] == "login":
     with page_placeholder.container():
         show_login()
\ No newline at end of file
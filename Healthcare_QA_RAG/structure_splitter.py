@@ -0,0 +1,176 @@
+import argparse
+import logging
+import os
+import re
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter
+from langchain_core.documents import Document
+
+from lexical_index import parse_articles
+
+logger = logging.getLogger(__name__)
+
+# WHO Model Formulary 약품 설명(monograph)의 소제목
+MONOGRAPH_SECTIONS = ("Uses", "Contraindications", "Precautions", "Dose", "Adverse effects", "Administration")
+_SECTION_LINE = re.compile(r"^(%s)\s*:\s*(.*)$" % "|".join(MONOGRAPH_SECTIONS))
+# 약품 이름 다음 줄의 제형 표기 ("Tablet: 100 mg.", "Powder for injection: ...")
+_FORM_LINE = re.compile(r"^[A-Z][A-Za-z ]{2,40}:\s")
+_CHAPTER_LINE = re.compile(r"^\d+\.\s+[A-Z].*$")
+_RUNNING_HEADER = re.compile(r"^WHO Model Formulary \d{4}\s+\d+\s*$")
+_PARAGRAPH_MARK = re.compile(r"[①-⑳]")
+
+
+class StructureTextSplitter(TextSplitter):
+    # 문서 구조 단위(헌법: 조/항, WHO formulary: 약품별 소제목)로 자르고
+    # 각 청크 앞에 "장 > 조" / "약품 > 소제목" 머리말을 붙여 청크 하나만 봐도 무엇에 대한 내용인지 알 수 있게 함
+    # 단위가 chunk_size보다 길 때만 줄 단위로 다시 나누므로 겹침(overlap)은 거의 없음
+    # structure: "constitution" 또는 "monograph"
+    def __init__(self, structure, chunk_size=1000, chunk_overlap=0, **kwargs):
+        if structure not in ("constitution", "monograph"):
+            raise ValueError(f"unknown structure {structure!r}, expected 'constitution' or 'monograph'")
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self.structure = structure
+        self._fallback = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    # index_manifest.splitter_config에 들어갈 추가 설정 (바뀌면 인덱스 다시 빌드)
+    def manifest_config(self):
+        return {"structure": self.structure}
+
+    def split_text(self, text):
+        units = self._constitution_units(text) if self.structure == "constitution" else self._monograph_units(text)
+        return self._pack(units)
+
+    def _constitution_units(self, text):
+        leading = []
+        articles = parse_articles([Document(page_content=text)], leading=leading)
+        units = []
+        if leading:
+            units.append(("", "\n".join(leading)))
+        for article in articles.values():
+            header = f"[{article['chapter']}]" if article["chapter"] else ""
+            if self._length_function(article["text"]) + len(header) < self._chunk_size or not article["paragraphs"]:
+                # 항이 없는 긴 조문은 _pack에서 길이 기준으로 나눔
+                units.append((header, article["text"]))
+            else:
+                # 긴 조문은 항 단위로 나누고, 각 항 앞에 조 제목을 붙임
+                # 첫 항(①) 앞의 본문도 버리지 않고 한 단위로 남김
+                prefix = f"{header} {article['title']}".strip()
+                preamble = _PARAGRAPH_MARK.split(article["text"], maxsplit=1)[0].strip()
+                if preamble != article["title"]:
+                    units.append((header, preamble))
+                for number, body in article["paragraphs"].items():
+                    units.append((prefix, f"{chr(0x2460 + number - 1)}{body}"))
+        return units
+
+    def _monograph_units(self, text):
+        lines = [line.strip() for line in text.splitlines()]
+        lines = [line for line in lines if line and not _RUNNING_HEADER.match(line)]
+        chapter = drug = None
+        units = []
+        current = []
+
+        def flush():
+            if current:
+                parts = [p for p in (chapter, drug) if p]
+                units.append((f"[{' > '.join(parts)}]" if parts else "", " ".join(current)))
+                current.clear()
+
+        for i, line in enumerate(lines):
+            if i == 0 and _CHAPTER_LINE.match(line):
+                chapter = line
+                continue
+            next_line = lines[i + 1] if i + 1 < len(lines) else ""
+            match = _SECTION_LINE.match(line)
+            if match:
+                flush()
+                current.append(f"{match.group(1)}: {match.group(2)}".rstrip())
+            elif (len(line) <= 60 and not line.endswith((".", ",", ";", ":"))
+                  and _FORM_LINE.match(next_line) and not _SECTION_LINE.match(next_line)):
+                # 약품 이름: 바로 다음 줄이 제형 표기
+                flush()
+                drug = line
+                current.append(line)
+            else:
+                current.append(line)
+        flush()
+        return units
+
+    # units: (머리말, 본문) 목록
+    # monograph는 연속된 단위를 chunk_size까지 한 청크로 묶고 (머리말이 바뀌는 곳마다 새 머리말 줄을 넣음),
+    # 헌법은 조문마다 한 청크. chunk_size보다 긴 단위만 줄 단위로 다시 나누고 조각마다 머리말을 붙임
+    def _pack(self, units):
+        chunks = []
+        body, size, last_header = [], 0, None
+        for unit_header, text in units:
+            length = self._length_function(text)
+            if length + len(unit_header) >= self._chunk_size:
+                if body:
+                    chunks.append("\n".join(body))
+                body, size, last_header = [], 0, None
+                for piece in self._fallback.split_text(text):
+                    chunks.append(f"{unit_header}\n{piece}" if unit_header else piece)
+                continue
+            added = length + (len(unit_header) + 1 if unit_header != last_header else 0)
+            if body and (self.structure == "constitution" or size + added >= self._chunk_size):
+                chunks.append("\n".join(body))
+                body, size, last_header = [], 0, None
+                added = length + len(unit_header) + 1
+            if unit_header and unit_header != last_header:
+                body.append(unit_header)
+            body.append(text)
+            size += added + 1
+            last_header = unit_header
+        if body:
+            chunks.append("\n".join(body))
+        return chunks
+
+# 청크 설정 전/후 비교: 벡터 수, flat 인덱스 크기, 청크당/컨텍스트(k개) 토큰 수, 원문 대비 중복률
+def split_report(pages, text_splitter, k=4, dim=1536):
+    import tiktoken
+
+    encoding = tiktoken.get_encoding("cl100k_base")
+    chunks = text_splitter.split_documents(pages)
+    tokens = [len(encoding.encode(chunk.page_content)) for chunk in chunks]
+    source_chars = sum(len(page.page_content) for page in pages)
+    avg_tokens = sum(tokens) / len(tokens) if tokens else 0.0
+    return {
+        "vectors": len(chunks),
+        "index_mb": len(chunks) * dim * 4 / 1024 / 1024,
+        "avg_chunk_tokens": avg_tokens,
+        "avg_context_tokens": avg_tokens * k,
+        "duplication": sum(len(chunk.page_content) for chunk in chunks) / source_chars if source_chars else 0.0,
+    }
+
+
+def main():
+    from ingest import iter_cached_pdf_pages
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    # (이름, PDF, 기존 splitter, 새 splitter)
+    targets = [
+        ("who", os.path.join(base_dir, "who.pdf"),
+         RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100), StructureTextSplitter("monograph", 1000)),
+        ("constitution", os.path.join(base_dir, "..", "data", "대한민국헌법(헌법)(제00010호)(19880225).pdf"),
+         RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50), StructureTextSplitter("constitution", 1000)),
+    ]
+    parser = argparse.ArgumentParser(description="compare chunking before/after the structure-aware splitter")
+    parser.add_argument("--targets", nargs="*", default=[t[0] for t in targets])
+    args = parser.parse_args()
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+
+    print(f"{'':<14}{'splitter':<24}{'vectors':>9}{'index MB':>10}{'tok/chunk':>11}{'ctx tok':>9}{'dup':>7}")
+    for name, pdf_path, before, after in targets:
+        if name not in args.targets:
+            continue
+        pages = list(iter_cached_pdf_pages([pdf_path]))
+        for text_splitter in (before, after):
+            report = split_report(pages, text_splitter)
+            label = getattr(text_splitter, "structure", f"recursive {text_splitter._chunk_size}/{text_splitter._chunk_overlap}")
+            print(
+                f"{name:<14}{label:<24}{report['vectors']:>9}{report['index_mb']:>10.1f}"
+                f"{report['avg_chunk_tokens']:>11.1f}{report['avg_context_tokens']:>9.0f}{report['duplication']:>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 텍스트 해시로 만든 결정적 단위 벡터 (같은 텍스트 -> 항상 같은 벡터)
+def fake_vector(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+# OpenAI /v1/embeddings 와 같은 형식으로 응답하는 로컬 stub 서버
+# --latency-ms: 요청당 고정 지연, --max-in-flight: 이보다 많이 동시에 들어오면 429 반환
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    dim = 1536
+    latency_ms = 50.0
+    per_text_ms = 0.05
+    max_in_flight = 16
+    retry_after = "0.2"
+    in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        cls = type(self)
+        with cls.lock:
+            if cls.in_flight >= cls.max_in_flight:
+                self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": cls.retry_after})
+                return
+            cls.in_flight += 1
+        try:
+            texts = payload["input"]
+            if isinstance(texts, str):
+                texts = [texts]
+            time.sleep((cls.latency_ms + cls.per_text_ms * len(texts)) / 1000)
+            data = []
+            for i, text in enumerate(texts):
+                vector = fake_vector(str(text), cls.dim)
+                if payload.get("encoding_format") == "base64":
+                    vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+                data.append({"object": "embedding", "index": i, "embedding": vector})
+            tokens = sum(len(str(text).split()) for text in texts)
+            self._send(200, {
+                "object": "list",
+                "data": data,
+                "model": payload.get("model", "stub"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+def serve(host="127.0.0.1", port=8765, dim=1536, latency_ms=50.0, max_in_flight=16):
+    StubEmbeddingHandler.dim = dim
+    StubEmbeddingHandler.latency_ms = latency_ms
+    StubEmbeddingHandler.max_in_flight = max_in_flight
+    server = ThreadingHTTPServer((host, port), StubEmbeddingHandler)
+    print(f"stub embedding server on http://{host}:{port}/v1 (dim={dim}, latency={latency_ms}ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local stub for the OpenAI embeddings API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.dim, args.latency_ms, args.max_in_flight)
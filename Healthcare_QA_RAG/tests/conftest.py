@@ -0,0 +1,46 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+# 모듈들이 Healthcare_QA_RAG 폴더 기준으로 import하므로 경로에 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubEmbeddings(Embeddings):
+    # 텍스트 해시로 만든 단위 벡터 (같은 텍스트 -> 같은 벡터), 호출 수/임베딩한 텍스트 수를 셈
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        vector = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def embeddings():
+    return StubEmbeddings()
+
+
+# source 파일의 페이지 n개 (changed: {페이지 번호: 새 내용})
+def make_pages(n, source="doc.pdf", changed=None):
+    changed = changed or {}
+    return [
+        Document(page_content=changed.get(i, f"page {i} about drug {i}. " * 10), metadata={"source": source, "page": i})
+        for i in range(n)
+    ]
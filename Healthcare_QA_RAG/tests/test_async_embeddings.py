@@ -0,0 +1,85 @@
+import logging
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import async_embeddings
+from async_embeddings import AsyncBatchEmbeddings
+from stub_embedding_server import StubEmbeddingHandler, fake_vector
+
+
+class WordEncoding:
+    # tiktoken 대신 단어 하나 = 토큰 하나
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def _embedder(**kwargs):
+    embedder = AsyncBatchEmbeddings(api_key="stub", **kwargs)
+    embedder._encoding = WordEncoding()
+    return embedder
+
+
+@pytest.fixture
+def stub_server():
+    # 동시에 2개보다 많이 들어오면 429 + retry-after
+    handler = type("Handler", (StubEmbeddingHandler,), {
+        "dim": 8, "latency_ms": 50.0, "per_text_ms": 0.0, "max_in_flight": 2, "retry_after": "0.6",
+        "in_flight": 0, "lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_batches_respect_token_budget_and_input_count():
+    embedder = _embedder(batch_size=3, max_batch_tokens=10)
+    texts = ["one two three four", "five six", "seven eight nine", "ten", "a b c d e f g h i j k l", "x", "y", "z", "w"]
+    batches = embedder.make_batches(texts)
+    assert [indices for indices, _ in batches] == [[0, 1, 2], [3], [4], [5, 6, 7], [8]]
+    assert [tokens for _, tokens in batches] == [9, 1, 12, 3, 1]
+    # 입력 하나가 예산보다 커도 혼자 한 배치로 보냄
+    assert all(tokens <= 10 or len(indices) == 1 for indices, tokens in batches)
+
+
+def test_aimd_halves_on_rate_limit_and_recovers_slowly():
+    embedder = _embedder(max_concurrency=8)
+    embedder._on_rate_limit()
+    embedder._on_rate_limit()
+    assert embedder.concurrency == 2
+    for _ in range(9):
+        embedder._on_success()
+    assert embedder.concurrency == 2
+    embedder._on_success()
+    assert embedder.concurrency == 3
+    for _ in range(100):
+        embedder._on_success()
+    assert embedder.concurrency == 8
+    for _ in range(5):
+        embedder._on_rate_limit()
+    assert embedder.concurrency == 1
+
+
+def test_rate_limited_requests_back_off_and_retry(stub_server, monkeypatch, caplog):
+    # 지터 없이 가장 짧은 백오프(0.25s) -> retry-after(0.6s)가 더 길면 그만큼 기다려야 함
+    monkeypatch.setattr(async_embeddings.random, "random", lambda: 0.0)
+    embedder = _embedder(batch_size=1, max_concurrency=8, base_url=stub_server)
+    texts = [f"drug {i} dose" for i in range(12)]
+
+    with caplog.at_level(logging.WARNING, logger="async_embeddings"):
+        vectors = embedder.embed_documents(texts)
+
+    np.testing.assert_allclose(vectors, [fake_vector(text, 8) for text in texts], atol=1e-6)
+    assert embedder.stats["rate_limited"] > 0
+    assert embedder.stats["requests"] == len(texts)
+    assert embedder.stats["retries"] >= embedder.stats["rate_limited"]
+    assert embedder.concurrency < 8
+    assert "retry in 0.6s" in caplog.text
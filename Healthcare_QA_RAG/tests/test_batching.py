@@ -0,0 +1,34 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.vectorstores import FAISS
+
+from batching import batched_retriever
+from relevance import SCORE_KEY
+
+
+def test_concurrent_invokes_share_embedding_calls(embeddings):
+    texts = [f"drug {i} dosage and adverse effects" for i in range(40)]
+    vectorstore = FAISS.from_texts(texts, embeddings)
+    retriever = batched_retriever(vectorstore, k=3, window_ms=50, max_batch=32)
+    calls = embeddings.calls
+
+    queries = texts[:16]
+    barrier = threading.Barrier(len(queries))
+
+    def invoke(query):
+        barrier.wait()
+        return retriever.invoke(query)
+
+    with ThreadPoolExecutor(len(queries)) as pool:
+        results = list(pool.map(invoke, queries))
+
+    # 각 요청은 자기 질문의 결과를 받음 (질문 = 문서 텍스트라 1등은 자기 자신)
+    for query, docs in zip(queries, results):
+        assert len(docs) == 3
+        assert docs[0].page_content == query
+        assert [doc.page_content for doc in docs] == [doc.page_content for doc in vectorstore.similarity_search(query, 3)]
+        assert all(SCORE_KEY in doc.metadata for doc in docs)
+    assert embeddings.calls - calls < len(queries)
+    assert retriever.batcher.stats["queries"] == len(queries)
+    assert retriever.batcher.stats["max_batch_size"] > 1
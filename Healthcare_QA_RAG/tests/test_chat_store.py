@@ -0,0 +1,89 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import chat_store
+from chat_store import SUMMARY_PREFIX, ChatStore, SQLiteChatMessageHistory
+
+
+class WordEncoding:
+    # tiktoken 대신 단어 하나 = 토큰 하나
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(chat_store, "_encoding", WordEncoding())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChatStore(str(tmp_path / "chats.sqlite"))
+
+
+def _turn(i):
+    # 질문 + 답변 = 10 토큰
+    return [HumanMessage(content=f"question {i} " + "q " * 3), AIMessage(content=f"answer {i} " + "a " * 3)]
+
+
+def test_history_within_budget_is_returned_whole(store):
+    history = SQLiteChatMessageHistory(store, "chat", max_tokens=100)
+    for i in range(3):
+        history.add_messages(_turn(i))
+    assert history.messages == history.all_messages()
+    assert len(history.messages) == 6
+
+
+def test_old_messages_are_dropped_without_summarizer(store):
+    history = SQLiteChatMessageHistory(store, "chat", max_tokens=20)
+    for i in range(3):
+        history.add_messages(_turn(i))
+    window = history.messages
+    # 20 토큰을 넘으면 최근 10 토큰(max_tokens/2)만 남김
+    assert [m.content.split()[:2] for m in window] == [["question", "2"], ["answer", "2"]]
+    assert len(history.all_messages()) == 6
+
+
+def test_summarizer_runs_only_when_window_fills_again(store):
+    calls = []
+
+    def summarizer(summary, messages):
+        calls.append(len(messages))
+        return f"{summary} +{len(messages)}".strip()
+
+    history = SQLiteChatMessageHistory(store, "chat", max_tokens=20, summarizer=summarizer)
+    for i in range(3):
+        history.add_messages(_turn(i))
+    window = history.messages
+    assert calls == [4]
+    assert window[0].type == "system" and window[0].content == SUMMARY_PREFIX + "+4"
+    assert len(window) == 3
+
+    # 요약 뒤에는 창이 다시 찰 때까지 요약하지 않음
+    history.add_messages([HumanMessage(content="short")])
+    history.messages
+    assert calls == [4]
+    history.add_messages(_turn(3))
+    window = history.messages
+    assert calls == [4, 3]
+    assert window[0].content == SUMMARY_PREFIX + "+4 +3"
+
+
+def test_clear_removes_messages_and_summary(store):
+    history = SQLiteChatMessageHistory(store, "chat", max_tokens=20, summarizer=lambda summary, messages: "요약")
+    for i in range(3):
+        history.add_messages(_turn(i))
+    history.messages
+    history.clear()
+    assert history.messages == []
+    assert store.summary("chat") == ("", 0)
+
+
+def test_prune_keeps_most_recent_chats(store):
+    for i in range(4):
+        store.create_chat(chat_id=f"chat{i}")
+        store.add_message(f"chat{i}", HumanMessage(content=f"hello {i}"))
+    assert store.prune(2) == 2
+    assert store.count_chats() == 2
+    assert [chat["id"] for chat in store.list_chats()[0]] == ["chat3", "chat2"]
+    assert store.messages("chat0") == []
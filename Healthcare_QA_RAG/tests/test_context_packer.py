@@ -0,0 +1,57 @@
+from langchain_core.documents import Document
+
+from context_packer import ContextPacker
+
+
+class WordEncoding:
+    # tiktoken 대신 단어 하나 = 토큰 하나 (테스트 환경에서는 인코딩 파일을 내려받을 수 없음)
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def _packer(max_tokens=1000, min_overlap=5):
+    packer = ContextPacker(max_tokens=max_tokens, min_overlap=min_overlap)
+    packer._encoding = WordEncoding()
+    return packer
+
+
+def _doc(text, page=0, chunk=None, source="who.pdf"):
+    doc_id = f"{source}#{page}:abc:{chunk}" if chunk is not None else None
+    return Document(id=doc_id, page_content=text, metadata={"source": source, "page": page})
+
+
+def test_overlapping_chunks_on_same_page_are_merged():
+    docs = [_doc("alpha beta gamma delta", chunk=0), _doc("gamma delta epsilon zeta", chunk=1)]
+    packed = _packer().pack(docs)
+    assert [doc.page_content for doc in packed] == ["alpha beta gamma delta epsilon zeta"]
+
+
+def test_adjacent_chunks_are_joined_in_chunk_order():
+    docs = [_doc("second part of the page", chunk=3), _doc("first part of the page", chunk=2)]
+    packed = _packer().pack(docs)
+    assert packed[0].page_content == "first part of the page\nsecond part of the page"
+
+
+def test_duplicates_and_contained_chunks_are_dropped():
+    docs = [_doc("morphine dose for adults"), _doc("dose for"), _doc("morphine dose for adults", page=1)]
+    packed = _packer().pack(docs)
+    assert [(doc.page_content, doc.metadata["page"]) for doc in packed] == [
+        ("morphine dose for adults", 0), ("morphine dose for adults", 1),
+    ]
+
+
+def test_budget_keeps_rank_order_and_skips_what_does_not_fit():
+    docs = [_doc("one two three", page=0), _doc("four five six seven", page=1), _doc("eight", page=2)]
+    packer = _packer(max_tokens=5)
+    packed = packer.pack(docs)
+    assert [doc.page_content for doc in packed] == ["one two three", "eight"]
+    assert packer.stats["tokens_in"] == 8
+    assert packer.stats["tokens_out"] == 4
+
+
+def test_first_document_is_truncated_to_budget():
+    packed = _packer(max_tokens=3).pack([_doc("a b c d e f"), _doc("g")])
+    assert [doc.page_content for doc in packed] == ["a b c"]
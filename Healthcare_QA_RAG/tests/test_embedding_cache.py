@@ -0,0 +1,66 @@
+import itertools
+
+import pytest
+
+import embedding_cache
+from conftest import StubEmbeddings
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+DIM = 16
+VECTOR_BYTES = DIM * 4
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # last_used가 같은 시각으로 겹치지 않도록 호출마다 1초씩 증가하는 시계
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return EmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_bytes=10 * VECTOR_BYTES)
+
+
+def test_second_embed_is_served_from_cache(cache):
+    stub = StubEmbeddings(DIM)
+    embeddings = CachedEmbeddings(stub, "model-a", cache)
+    first = embeddings.embed_documents(["aspirin", "ibuprofen", "aspirin"])
+    assert (stub.calls, stub.texts) == (1, 2)
+
+    second = embeddings.embed_documents(["ibuprofen", "aspirin"])
+    assert stub.calls == 1
+    assert second == [first[1], first[0]]
+
+
+def test_model_change_misses_cache(cache):
+    stub = StubEmbeddings(DIM)
+    CachedEmbeddings(stub, "model-a", cache).embed_documents(["aspirin"])
+    CachedEmbeddings(stub, "model-b", cache).embed_documents(["aspirin"])
+    assert (stub.calls, stub.texts) == (2, 2)
+
+
+def test_evict_keeps_size_within_limit_and_drops_least_recently_used(cache):
+    embeddings = CachedEmbeddings(StubEmbeddings(DIM), "model-a", cache)
+    texts = [f"chunk {i}" for i in range(10)]
+    for text in texts:
+        embeddings.embed_documents([text])
+    # chunk 0을 다시 사용해서 가장 최근으로
+    embeddings.embed_documents(texts[:1])
+    embeddings.embed_documents(["chunk 10", "chunk 11"])
+
+    assert cache.bytes_stored() <= cache.max_bytes
+    stub = StubEmbeddings(DIM)
+    CachedEmbeddings(stub, "model-a", cache).embed_documents(["chunk 0", "chunk 1", "chunk 2", "chunk 3"])
+    assert stub.texts == 2  # chunk 1, 2만 삭제됨
+
+
+def test_stats_count_hits_and_misses(cache):
+    embeddings = CachedEmbeddings(StubEmbeddings(DIM), "model-a", cache)
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a", "b", "c"])
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 3)
+    assert stats["hit_rate"] == pytest.approx(2 / 5)
+    assert stats["entries"] == 3
+    assert stats["bytes"] == 3 * VECTOR_BYTES
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import pytest
+
+from ann_index import FULL_VECTORS_FILE
+from index_lock import BuildCoordinator, file_lock, lock_path
+from index_manifest import MANIFEST_NAME, publish_index, remove_stale_staging, staging_dir
+
+
+def test_concurrent_runs_build_once(tmp_path):
+    coordinator = BuildCoordinator(timeout=5)
+    built = []
+    start = threading.Barrier(4)
+
+    def load():
+        return built[0] if built else None
+
+    def build():
+        time.sleep(0.2)
+        built.append(object())
+        return built[0]
+
+    results = []
+
+    def worker():
+        start.wait()
+        results.append(coordinator.run(str(tmp_path / "index"), load, build))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+    assert all(result is built[0] for result in results)
+    assert coordinator.stats["builds"] == 1
+    assert coordinator.stats["waited"] + coordinator.stats["builds"] + coordinator.stats["loads"] == 4
+
+    assert coordinator.run(str(tmp_path / "index"), load, build) is built[0]
+    assert coordinator.stats["loads"] >= 1 and len(built) == 1
+
+
+def test_build_error_reaches_waiters_and_is_not_cached(tmp_path):
+    coordinator = BuildCoordinator(timeout=5)
+    started = threading.Event()
+    errors = []
+
+    def failing_build():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("build failed")
+
+    def waiter():
+        started.wait()
+        try:
+            coordinator.run(str(tmp_path / "index"), lambda: None, failing_build)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        coordinator.run(str(tmp_path / "index"), lambda: None, failing_build)
+    thread.join()
+
+    assert len(errors) == 1
+    # 실패한 빌드는 남지 않으므로 다음 요청은 다시 빌드
+    assert coordinator.run(str(tmp_path / "index"), lambda: None, lambda: "ok") == "ok"
+
+
+def test_exclusive_lock_blocks_other_holders(tmp_path):
+    path = lock_path(str(tmp_path / "index"))
+    assert path == str(tmp_path / "index.lock")
+    with file_lock(path, shared=True):
+        with file_lock(path, shared=True, timeout=0.2):
+            pass
+        with pytest.raises(TimeoutError):
+            with file_lock(path, timeout=0.2):
+                pass
+    with file_lock(path, timeout=0.2):
+        with pytest.raises(TimeoutError):
+            with file_lock(path, shared=True, timeout=0.2):
+                pass
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_publish_to_new_dir_renames_staging(tmp_path):
+    index_dir = str(tmp_path / "index")
+    tmp_dir = staging_dir(index_dir)
+    _write(os.path.join(tmp_dir, "index.faiss"), "new")
+    _write(os.path.join(tmp_dir, MANIFEST_NAME), "{}")
+
+    publish_index(tmp_dir, index_dir)
+
+    assert _read(os.path.join(index_dir, "index.faiss")) == "new"
+    assert not os.path.exists(tmp_dir)
+
+
+def test_publish_over_existing_index_keeps_other_entries(tmp_path):
+    index_dir = str(tmp_path / "index")
+    _write(os.path.join(index_dir, "index.faiss"), "old")
+    _write(os.path.join(index_dir, "chunks", "texts.bin"), "old chunks")
+    _write(os.path.join(index_dir, FULL_VECTORS_FILE), "old vectors")
+    _write(os.path.join(index_dir, MANIFEST_NAME), "old manifest")
+    _write(os.path.join(index_dir, "relevance.json"), "calibration")
+    _write(os.path.join(index_dir, "shards", "a", "index.faiss"), "shard")
+
+    tmp_dir = staging_dir(index_dir)
+    _write(os.path.join(tmp_dir, "index.faiss"), "new")
+    _write(os.path.join(tmp_dir, "chunks", "texts.bin"), "new chunks")
+    _write(os.path.join(tmp_dir, MANIFEST_NAME), "new manifest")
+
+    publish_index(tmp_dir, index_dir)
+
+    assert _read(os.path.join(index_dir, "index.faiss")) == "new"
+    assert _read(os.path.join(index_dir, "chunks", "texts.bin")) == "new chunks"
+    assert _read(os.path.join(index_dir, MANIFEST_NAME)) == "new manifest"
+    # 새 인덱스는 압축 인덱스가 아니므로 이전 원본 벡터는 지움
+    assert not os.path.exists(os.path.join(index_dir, FULL_VECTORS_FILE))
+    assert _read(os.path.join(index_dir, "relevance.json")) == "calibration"
+    assert _read(os.path.join(index_dir, "shards", "a", "index.faiss")) == "shard"
+    assert sorted(os.listdir(tmp_path)) == ["index"]
+
+
+def test_remove_stale_staging_only_removes_staging_dirs(tmp_path):
+    index_dir = str(tmp_path / "index")
+    os.makedirs(index_dir)
+    os.makedirs(str(tmp_path / "index.12345.tmp"))
+    os.makedirs(str(tmp_path / "index2.1.tmp"))
+    remove_stale_staging(index_dir)
+    assert sorted(os.listdir(tmp_path)) == ["index", "index2.1.tmp"]
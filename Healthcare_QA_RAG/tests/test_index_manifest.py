@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ann_index import FULL_VECTORS_FILE, index_config, is_compressed, is_flat, load_index_config, search_vectors
+from chunk_store import load_vector_store
+from conftest import make_pages
+from index_manifest import load_manifest, load_or_build_vector_store, load_saved_vector_store, page_key
+
+
+@pytest.fixture
+def splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0)
+
+
+def _chunk_texts(vectorstore):
+    return sorted(
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+        for i in range(vectorstore.index.ntotal)
+    )
+
+
+def test_unchanged_pages_keep_index(tmp_path, splitter, embeddings):
+    index_dir = str(tmp_path / "index")
+    built = load_or_build_vector_store(iter(make_pages(5)), splitter, embeddings, index_dir)
+    calls = embeddings.calls
+    loaded = load_or_build_vector_store(iter(make_pages(5)), splitter, embeddings, index_dir)
+    assert embeddings.calls == calls
+    assert _chunk_texts(loaded) == _chunk_texts(built)
+
+
+def test_flat_index_updates_changed_page_only(tmp_path, splitter, embeddings):
+    index_dir = str(tmp_path / "index")
+    load_or_build_vector_store(iter(make_pages(5)), splitter, embeddings, index_dir)
+    old_manifest = load_manifest(index_dir)
+
+    changed = make_pages(5, changed={2: "new text for page two"})
+    updated = load_or_build_vector_store(iter(changed), splitter, embeddings, index_dir)
+
+    manifest = load_manifest(index_dir)
+    assert manifest["pages"][page_key(changed[2])] != old_manifest["pages"][page_key(changed[2])]
+    assert manifest["pages"][page_key(changed[0])] == old_manifest["pages"][page_key(changed[0])]
+    assert "new text for page two" in _chunk_texts(updated)
+    rebuilt = load_or_build_vector_store(iter(changed), splitter, embeddings, str(tmp_path / "fresh"))
+    assert _chunk_texts(updated) == _chunk_texts(rebuilt)
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf"])
+def test_ann_index_rebuilds_on_changed_page(tmp_path, splitter, embeddings, index_type):
+    index_dir = str(tmp_path / "index")
+    config = index_config(index_type, nlist=2) if index_type == "ivf" else index_config(index_type)
+    load_or_build_vector_store(iter(make_pages(40)), splitter, embeddings, index_dir, config)
+
+    changed = make_pages(40, changed={3: "changed page three"})
+    vectorstore = load_or_build_vector_store(iter(changed), splitter, embeddings, index_dir, config)
+
+    assert not is_flat(vectorstore.index)
+    assert "changed page three" in _chunk_texts(vectorstore)
+    assert vectorstore.index.ntotal == len(_chunk_texts(vectorstore))
+
+
+def test_no_pages_builds_empty_index(tmp_path, splitter, embeddings):
+    index_dir = str(tmp_path / "index")
+    vectorstore = load_or_build_vector_store(iter([]), splitter, embeddings, index_dir, index_config("hnsw"))
+    assert vectorstore.index.ntotal == 0
+    assert os.path.exists(os.path.join(index_dir, "index.faiss"))
+
+    vectorstore = load_or_build_vector_store(iter(make_pages(3)), splitter, embeddings, index_dir, index_config("hnsw"))
+    assert vectorstore.index.ntotal > 0
+
+
+@pytest.mark.parametrize("quantizer, dim", [("fp16", None), ("int8", None), (None, 8), ("int8", 8)])
+def test_compressed_index_updates_changed_page(tmp_path, splitter, embeddings, quantizer, dim):
+    index_dir = str(tmp_path / "index")
+    config = index_config("flat", quantizer=quantizer, dim=dim)
+    load_or_build_vector_store(iter(make_pages(10)), splitter, embeddings, index_dir, config)
+
+    embedded = embeddings.texts
+    changed = make_pages(10, changed={4: "changed page four"})
+    vectorstore = load_or_build_vector_store(iter(changed), splitter, embeddings, index_dir, config)
+    # 다시 빌드하지 않고 바뀐 페이지의 청크만 임베딩
+    assert embeddings.texts - embedded == 1
+
+    # 증분 업데이트 후에도 원본 벡터가 인덱스와 같은 순서로 맞아야 재계산 거리가 정확
+    texts = [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+        for i in range(vectorstore.index.ntotal)
+    ]
+    assert vectorstore.full_vectors.shape[0] == vectorstore.index.ntotal
+    np.testing.assert_allclose(vectorstore.full_vectors, embeddings.embed_documents(texts), atol=1e-6)
+
+    reloaded = load_vector_store(index_dir, embeddings)
+    distances, indices = search_vectors(reloaded, [embeddings.embed_query("changed page four")], 1)
+    found = reloaded.docstore.search(reloaded.index_to_docstore_id[int(indices[0][0])])
+    assert found.page_content == "changed page four"
+    assert distances[0][0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_relative_and_absolute_paths_share_index(tmp_path, monkeypatch, splitter, embeddings):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "doc.pdf").write_bytes(b"%PDF-1.4 stub")
+    index_dir = str(tmp_path / "index")
+    load_or_build_vector_store(iter(make_pages(5, source="doc.pdf")), splitter, embeddings, index_dir)
+    calls = embeddings.calls
+
+    # rag.py(상대 경로)가 만든 인덱스를 streamlit_ui(절대 경로)가 PDF 파싱/임베딩 없이 그대로 로드
+    absolute = str(tmp_path / "doc.pdf")
+    assert load_saved_vector_store([absolute], splitter, embeddings, index_dir) is not None
+    loaded = load_or_build_vector_store(iter(make_pages(5, source=absolute)), splitter, embeddings, index_dir)
+    assert embeddings.calls == calls
+    assert loaded.index.ntotal == len(_chunk_texts(loaded))
+
+
+def test_legacy_pickle_index_is_rebuilt_not_unpickled(tmp_path, monkeypatch, splitter, embeddings):
+    import pickle
+    import shutil
+
+    index_dir = str(tmp_path / "index")
+    load_or_build_vector_store(iter(make_pages(3)), splitter, embeddings, index_dir)
+    # 예전 FAISS.save_local 폴더처럼 chunks/ 없이 index.pkl만 남김
+    shutil.rmtree(os.path.join(index_dir, "chunks"))
+    with open(os.path.join(index_dir, "index.pkl"), "wb") as f:
+        f.write(b"not trusted")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("index.pkl must not be unpickled")
+
+    monkeypatch.setattr(pickle, "load", fail)
+    with pytest.raises(FileNotFoundError, match="convert"):
+        load_vector_store(index_dir, embeddings)
+    vectorstore = load_or_build_vector_store(iter(make_pages(3)), splitter, embeddings, index_dir)
+    assert vectorstore.index.ntotal == len(_chunk_texts(vectorstore)) > 0
+    assert load_vector_store(index_dir, embeddings).index.ntotal == vectorstore.index.ntotal
+
+
+def test_dim_not_below_embedding_size_is_not_compressed(tmp_path, splitter, embeddings):
+    index_dir = str(tmp_path / "index")
+    config = index_config("flat", dim=embeddings.dim * 2)
+    vectorstore = load_or_build_vector_store(iter(make_pages(5)), splitter, embeddings, index_dir, config)
+
+    assert is_flat(vectorstore.index)
+    assert getattr(vectorstore, "full_vectors", None) is None
+    assert not os.path.exists(os.path.join(index_dir, FULL_VECTORS_FILE))
+    saved = load_index_config(index_dir)
+    assert saved["dim"] is None and not is_compressed(saved)
+
+    # 같은 설정으로 다시 부르면 재빌드 없이 그대로 사용
+    calls = embeddings.calls
+    load_or_build_vector_store(iter(make_pages(5)), splitter, embeddings, index_dir, config)
+    assert embeddings.calls == calls
@@ -0,0 +1,94 @@
+import itertools
+import json
+import os
+import time
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import index_versions
+from conftest import make_pages
+from index_versions import (
+    ARTIFACT_FILE, IndexHandle, activate_version, build_version, current_version, list_versions, prune_versions,
+    verify_version, version_dir,
+)
+
+
+@pytest.fixture
+def build(tmp_path, monkeypatch, embeddings):
+    # PDF 파싱 대신 페이지 텍스트를 바로 넘기고, 버전 이름의 시각은 빌드할 때마다 1초씩 증가
+    pages = {}
+    monkeypatch.setattr(index_versions, "iter_cached_pdf_pages", lambda paths: iter(pages[paths[0]]))
+    ticks = itertools.count()
+    monkeypatch.setattr(index_versions.time, "strftime", lambda fmt: f"20260101-{next(ticks):06d}")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0)
+    root = str(tmp_path / "who")
+
+    def build(text, activate=True):
+        path = str(tmp_path / "who.pdf")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        pages[path] = make_pages(3, source=path, changed={0: text})
+        return build_version([path], root, splitter, embeddings, activate=activate)
+
+    build.root = root
+    return build
+
+
+def test_build_records_checksums_and_verify_detects_changes(build):
+    version = build("first edition")
+    root = build.root
+    assert current_version(root) == version
+    verify_version(root, version)
+
+    with open(os.path.join(version_dir(root, version), "index.faiss"), "ab") as f:
+        f.write(b"corrupt")
+    with pytest.raises(ValueError, match="index.faiss"):
+        verify_version(root, version)
+
+    # 검증에 실패한 버전은 CURRENT가 되지 않음
+    broken = build("second edition", activate=False)
+    os.remove(os.path.join(version_dir(root, broken), "index.faiss"))
+    with pytest.raises(ValueError):
+        activate_version(root, broken)
+    assert current_version(root) == version
+
+
+def test_prune_keeps_latest_and_current(build):
+    versions = [build(f"edition {i}", activate=i == 0) for i in range(4)]
+    assert list_versions(build.root) == versions
+
+    removed = prune_versions(build.root, keep=2)
+    assert removed == versions[1:2]
+    assert list_versions(build.root) == [versions[0], *versions[2:]]
+    assert not os.path.exists(version_dir(build.root, versions[1]))
+
+
+def test_load_skips_checksums_unless_requested(build, embeddings):
+    version = build("first edition")
+    artifact_path = os.path.join(version_dir(build.root, version), ARTIFACT_FILE)
+    with open(artifact_path, encoding="utf-8") as f:
+        artifact = json.load(f)
+    artifact["checksums"]["index.faiss"] = "0" * 64
+    with open(artifact_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f)
+
+    assert IndexHandle(build.root, embeddings).version == version
+    with pytest.raises(ValueError):
+        IndexHandle(build.root, embeddings, verify=True)
+
+
+def test_watcher_swaps_to_new_current_version(build, embeddings):
+    build("first edition")
+    handle = IndexHandle(build.root, embeddings)
+    retriever = handle.as_retriever(search_kwargs={"k": 1})
+    assert retriever.invoke("first edition")[0].page_content == "first edition"
+
+    handle.watch(interval=0.02)
+    second = build("second edition")
+    deadline = time.monotonic() + 5
+    while handle.version != second and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    assert handle.version == second
+    assert retriever.invoke("second edition")[0].page_content == "second edition"
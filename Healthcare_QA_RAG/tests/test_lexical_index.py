@@ -0,0 +1,131 @@
+import pytest
+from langchain_core.documents import Document
+
+import ingest
+from lexical_index import (
+    LexicalIndex, articles_path, find_references, load_or_build_lexical_index, parse_articles, rrf_fuse,
+)
+from relevance import SCORE_KEY, RelevanceGate
+
+CONSTITUTION = """제1장 총강
+제1조 ①대한민국은 민주공화국이다.
+②대한민국의 주권은 국민에게 있고, 모든 권력은 국민으로부터 나온다.
+제2조 ①대한민국의 국민이 되는 요건은 법률로 정한다.
+"""
+
+PAGES = [
+    Document(page_content="""법제처 1 국가법령정보센터
+대한민국헌법
+유구한 역사와 전통에 빛나는 우리 대한국민은
+제1장 총강
+제1조 ①대한민국은 민주공화국이다.
+②대한민국의 주권은 국민에게 있고, 모든 권력은
+""", metadata={"source": "constitution.pdf", "page": 0}),
+    Document(page_content="""법제처 2 국가법령정보센터
+국민으로부터 나온다.
+제2장 국민의 권리와 의무
+제10조 모든 국민은 인간으로서의 존엄과 가치를 가지며, 행복을 추구할 권리를 가진다.
+제37조의2(예시) ①부칙과 번호가 겹치지 않는 조문.
+부칙
+제1조 이 헌법은 1988년 2월 25일부터 시행한다.
+""", metadata={"source": "constitution.pdf", "page": 1}),
+]
+
+
+def test_saved_articles_load_without_reading_pages(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "constitution.pdf"
+    pdf_path.write_bytes(b"%PDF v1")
+    index_dir = str(tmp_path / "faiss_index")
+    reads = []
+
+    def fake_pages(pdf_paths):
+        reads.append(list(pdf_paths))
+        return iter([Document(page_content=CONSTITUTION, metadata={"source": str(pdf_path), "page": 0})])
+
+    monkeypatch.setattr(ingest, "iter_cached_pdf_pages", fake_pages)
+    built = load_or_build_lexical_index([str(pdf_path)], index_dir)
+    loaded = load_or_build_lexical_index([str(pdf_path)], index_dir)
+
+    assert len(reads) == 1
+    assert loaded.articles == built.articles
+    assert loaded.lookup("제1조 2항")[0].page_content.startswith("제1조 ②대한민국의 주권은")
+
+    # PDF가 바뀌면 조문 표를 다시 만듦
+    pdf_path.write_bytes(b"%PDF v2")
+    load_or_build_lexical_index([str(pdf_path)], index_dir)
+    assert len(reads) == 2
+    assert (tmp_path / "faiss_index.articles.json").exists()
+    assert articles_path(index_dir + "/") == str(tmp_path / "faiss_index.articles.json")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("제10조", [("10", None)]),
+    ("제 37조 2항은?", [("37", 2)]),
+    ("37조의2 제1항 내용", [("37의2", 1)]),
+    ("10조 알려줘", [("10", None)]),
+    ("헌법 10조", [("10", None)]),
+    ("제1조 원문", [("1", None)]),
+    ("예산 1조 원", []),
+    ("예산 1조원", []),
+    ("1조 2천억 규모", []),
+    ("3조에서", []),
+])
+def test_find_references(text, expected):
+    assert find_references(text) == expected
+
+
+def test_parse_articles_joins_pages_and_splits_paragraphs():
+    leading = []
+    articles = parse_articles(PAGES, leading=leading)
+
+    assert leading == ["유구한 역사와 전통에 빛나는 우리 대한국민은"]
+    assert list(articles) == ["1", "10", "37의2", "부칙1"]
+    first = articles["1"]
+    assert first["chapter"] == "제1장 총강"
+    # 다음 페이지로 이어지는 항도 같은 조문에 붙음 (머리글 줄은 버림)
+    assert first["paragraphs"] == {1: "대한민국은 민주공화국이다.", 2: "대한민국의 주권은 국민에게 있고, 모든 권력은국민으로부터 나온다."}
+    assert articles["10"]["chapter"] == "제2장 국민의 권리와 의무"
+    assert articles["10"]["paragraphs"] == {}
+    assert articles["10"]["page"] == 1
+    assert articles["37의2"]["title"] == "제37조의2(예시)"
+    assert articles["부칙1"]["chapter"] == "부칙"
+
+
+def test_lookup_returns_paragraph_and_skips_unknown_articles():
+    index = LexicalIndex(parse_articles(PAGES))
+    docs = index.lookup("제1조 제2항이랑 제99조")
+    assert len(docs) == 1
+    assert docs[0].page_content.startswith("제1조 ②대한민국의 주권은")
+    assert docs[0].metadata["paragraph"] == 2
+    assert not index.has_reference("예산 1조 원이면")
+
+
+def test_rrf_fuse_dedupes_by_article():
+    index = LexicalIndex(parse_articles(PAGES))
+    lexical = [index.document("10"), index.document("1")]
+    vector = [
+        Document(page_content="[제1장 총강] 제1조\n②대한민국의 주권은 국민에게 있고", metadata={"page": 0}),
+        Document(page_content="[부칙]\n제1조 이 헌법은 1988년 2월 25일부터 시행한다.", metadata={"page": 1}),
+        Document(page_content="[제2장 국민의 권리와 의무]\n제10조 모든 국민은 인간으로서의", metadata={"page": 1}),
+    ]
+    fused = rrf_fuse([lexical, vector], limit=4)
+
+    assert [doc.page_content[:4] for doc in fused] == ["제1조 ", "제10조", "[부칙]"]
+    # 같은 조문은 BM25 쪽 조문 전체를 씀
+    assert fused[0].metadata["article"] == "1"
+
+
+def test_rrf_fuse_keeps_vector_score_of_article_also_found_by_bm25():
+    index = LexicalIndex(parse_articles(PAGES))
+    lexical = [index.document("10")]
+    vector = [
+        Document(page_content="[제2장 국민의 권리와 의무]\n제10조 모든 국민은", metadata={SCORE_KEY: 0.62}),
+        Document(page_content="[부칙]\n제1조 이 헌법은", metadata={SCORE_KEY: 0.15}),
+    ]
+    fused = rrf_fuse([lexical, vector], limit=4)
+
+    assert fused[0].metadata["article"] == "10"
+    assert fused[0].metadata[SCORE_KEY] == 0.62
+    # 관련 있는 질문인데도 gate가 모두 거르지 않아야 함
+    assert RelevanceGate(threshold=0.3).filter(fused) == fused
+    assert SCORE_KEY not in index.document("10").metadata
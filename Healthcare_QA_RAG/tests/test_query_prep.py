@@ -0,0 +1,22 @@
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from query_prep import QueryPreparer, query_prep_retriever
+
+
+def test_retriever_searches_with_prepared_query():
+    preparer = QueryPreparer(FakeListChatModel(responses=["morphine side effects", "What is the dose of morphine?"]))
+    searched = []
+    retriever = RunnableLambda(lambda query: searched.append(query) or [Document(page_content=query)])
+    chain = query_prep_retriever(preparer, retriever)
+
+    assert chain.invoke({"input": "모르핀 부작용은?", "history": []})[0].page_content == "morphine side effects"
+    history = [HumanMessage(content="모르핀 부작용은?"), AIMessage(content="메스꺼움")]
+    chain.invoke({"input": "용량은?", "history": history})
+
+    assert searched == ["morphine side effects", "What is the dose of morphine?"]
+    # 대화가 있어도 검색 전 LLM 호출은 한 번
+    assert preparer.stats["llm_calls"] == 2
+    assert preparer.stats["with_history"] == 1
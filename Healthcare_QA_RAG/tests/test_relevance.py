@@ -0,0 +1,54 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from relevance import SCORE_KEY, RelevanceGate, choose_threshold, create_gated_retrieval_chain
+
+
+def _doc(text, score=None):
+    return Document(page_content=text, metadata={SCORE_KEY: score} if score is not None else {})
+
+
+def test_choose_threshold_separates_scores():
+    threshold = choose_threshold([0.5, 0.6, 0.7], [0.1, 0.2, 0.3])
+    assert threshold == pytest.approx((0.5 + 0.3) / 2)
+
+
+def test_choose_threshold_prefers_lowest_of_best_candidates():
+    # 0.4에서 자르면 관련 질문 3개 + 무관 질문 1개 (gain 2), 0.55에서 자르면 2개 + 0개 (gain 2) -> 낮은 쪽
+    threshold = choose_threshold([0.4, 0.55, 0.6], [0.1, 0.45])
+    assert 0.1 < threshold < 0.4
+    assert threshold == pytest.approx((0.4 + 0.1) / 2)
+
+
+def test_choose_threshold_without_lower_off_topic_score():
+    assert choose_threshold([0.3, 0.8], [0.9]) == 0.3
+
+
+def test_gate_filters_low_scores_and_passes_unscored():
+    gate = RelevanceGate(threshold=0.5)
+    assert gate.filter([_doc("a", 0.2), _doc("b", 0.4)]) == []
+    kept = [_doc("a", 0.2), _doc("b", 0.6)]
+    assert gate.filter(kept) == kept
+    unscored = [_doc("article")]
+    assert gate.filter(unscored) == unscored
+    # 점수 없는 BM25 문서가 섞여 있으면 FAISS 문서의 점수로 판단
+    assert gate.filter([_doc("article"), _doc("b", 0.1)]) == []
+    assert gate.stats["checked"] == 4
+
+
+def test_gated_chain_skips_generation_when_context_is_empty():
+    gate = RelevanceGate(threshold=0.5, answer="not found")
+    generated = []
+
+    def generate(inputs):
+        generated.append(inputs["input"])
+        return "generated"
+
+    retrieve = RunnableLambda(lambda x: [_doc(x["input"], 0.9 if "drug" in x["input"] else 0.1)]) | gate.as_runnable()
+    chain = create_gated_retrieval_chain(retrieve, RunnableLambda(generate), gate)
+
+    assert chain.invoke({"input": "weather today"})["answer"] == "not found"
+    assert chain.invoke({"input": "drug dose"})["answer"] == "generated"
+    assert generated == ["drug dose"]
+    assert gate.metrics()["skipped"] == 1
@@ -0,0 +1,47 @@
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from rerank import MMRReranker, mmr_reranker, mmr_select
+
+
+def test_mmr_skips_near_duplicates():
+    query = [1.0, 0.0, 0.0]
+    vectors = [
+        [0.9, 0.1, 0.0],
+        [0.9, 0.1, 0.001],  # 첫 번째와 거의 같음
+        [0.7, 0.0, 0.7],
+    ]
+    assert mmr_select(query, vectors, 2) == [0, 2]
+
+
+def test_mmr_with_lambda_one_is_relevance_order():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(10, 8))
+    query = rng.normal(size=8)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5])
+    assert mmr_select(query, vectors, 5, lambda_mult=1.0) == expected
+
+
+def test_mmr_handles_small_candidate_sets():
+    assert mmr_select([1.0, 0.0], [], 4) == []
+    assert sorted(mmr_select([1.0, 0.0], [[1.0, 0.0], [0.0, 1.0]], 4)) == [0, 1]
+
+
+def test_reranker_search_returns_diverse_documents(embeddings):
+    texts = ["morphine dose"] * 3 + ["morphine adverse effects", "paracetamol dose"]
+    vectorstore = FAISS.from_texts(texts, embeddings, ids=[str(i) for i in range(len(texts))])
+    reranker = MMRReranker(k=3, fetch_k=5, lambda_mult=0.5)
+
+    results = reranker.search(vectorstore, embeddings.embed_query("morphine dose"))
+
+    contents = [doc.page_content for doc, _ in results]
+    assert contents[0] == "morphine dose"
+    assert contents.count("morphine dose") == 1
+    assert len(contents) == 3
+    assert reranker.stats["candidates"] == 5
+
+
+def test_mmr_reranker_disabled_when_fetch_k_not_larger():
+    assert mmr_reranker(k=4, fetch_k=4) is None
+    assert isinstance(mmr_reranker(k=4, fetch_k=20), MMRReranker)
@@ -0,0 +1,60 @@
+from langchain_core.documents import Document
+
+from semantic_cache import SemanticCache, key_terms
+
+CONTEXT = [Document(page_content="Morphine: adverse effects include nausea.")]
+
+
+class SameVectorEmbeddings:
+    # 모든 질문이 같은 벡터 (임베딩만으로는 구분할 수 없는 비슷한 질문)
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, 0.0, 0.0]
+
+
+def test_key_terms_ignore_question_form():
+    assert key_terms("모르핀의 부작용은 무엇인가요?") == key_terms("모르핀 부작용 알려줘") == {"모르핀"}
+    assert key_terms("What are the side effects of morphine?") == {"morphine"}
+    assert key_terms("아이에게 아목시실린 용량은?") != key_terms("아목시실린 용량은?")
+
+
+def test_similar_question_hits_only_with_same_key_terms():
+    cache = SemanticCache(SameVectorEmbeddings())
+    cache.store("모르핀의 부작용은 무엇인가요?", "메스꺼움 등", CONTEXT)
+
+    entry, _ = cache.lookup("모르핀 부작용 알려줘")
+    assert entry is not None and entry.answer == "메스꺼움 등"
+
+    entry, vector = cache.lookup("옥시코돈의 부작용은 무엇인가요?")
+    assert entry is None and vector is not None
+    assert cache.stats["term_mismatches"] == 1
+
+
+def test_exact_question_skips_embedding():
+    embeddings = SameVectorEmbeddings()
+    cache = SemanticCache(embeddings)
+    cache.store("모르핀 부작용", "답변", CONTEXT)
+    calls = embeddings.calls
+    entry, vector = cache.lookup("  모르핀   부작용?? ")
+    assert entry is not None and vector is None
+    assert embeddings.calls == calls
+
+
+def test_answers_without_context_are_not_cached():
+    cache = SemanticCache(SameVectorEmbeddings())
+    cache.store("프랑스의 수도는?", "죄송합니다. 제공된 문서에서 찾지 못했습니다.", [])
+    cache.store("모르핀 부작용", "   ", CONTEXT)
+    assert cache.metrics()["entries"] == 0
+    assert cache.stats["skipped_stores"] == 2
+    assert cache.lookup("프랑스의 수도는?")[0] is None
+
+
+def test_index_version_change_invalidates():
+    cache = SemanticCache(SameVectorEmbeddings(), index_version="v1")
+    cache.store("모르핀 부작용", "답변", CONTEXT)
+    cache.set_index_version("v2")
+    assert cache.lookup("모르핀 부작용")[0] is None
+    assert cache.stats["invalidations"] == 1
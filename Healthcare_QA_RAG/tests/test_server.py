@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+import chat_store
+from chat_store import ChatStore
+from server import SessionHistories, create_app
+
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(chat_store, "_encoding", WordEncoding())
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_session_history_is_windowed_in_prompt(tmp_path):
+    seen = []
+
+    def chain(inputs):
+        seen.append(list(inputs["history"]))
+        return {"answer": "answer " + "word " * 8}
+
+    histories = SessionHistories(max_sessions=10, store=ChatStore(str(tmp_path / "sessions.sqlite")), max_tokens=25)
+
+    async def run():
+        app = create_app(rag_chain=RunnableLambda(chain), histories=histories)
+        async with TestClient(TestServer(app)) as client:
+            for i in range(5):
+                response = await client.post("/chat", json={"question": f"question {i}", "session_id": "s1"})
+                events = _events(await response.text())
+                assert events[-1][0] == "done"
+            session = await (await client.get("/sessions/s1")).json()
+            health = await (await client.get("/health")).json()
+            deleted = await client.delete("/sessions/s1")
+            missing = await client.get("/sessions/s1")
+            return session, health, deleted.status, missing.status
+
+    session, health, deleted, missing = asyncio.run(run())
+
+    # 화면/세션 API는 전체 기록, 프롬프트는 최근 대화만
+    assert len(session["messages"]) == 10
+    assert [len(history) for history in seen] == [0, 2, 4, 2, 4]
+    assert health["sessions"] == 1 and health["waiting"] == 0
+    assert (deleted, missing) == (200, 404)
+
+
+def test_session_histories_evict_oldest_sessions(tmp_path):
+    histories = SessionHistories(max_sessions=2, store=ChatStore(str(tmp_path / "sessions.sqlite")))
+    for i in range(3):
+        histories.get(f"s{i}").add_messages([HumanMessage(content=f"hello {i}")])
+    assert len(histories) == 2
+    assert histories.find("s0") is None
+    assert histories.find("s2").all_messages()[0].content == "hello 2"
+
+
+def test_cancelled_while_queued_does_not_leak_waiting():
+    from server import _admitted
+
+    async def run():
+        app = {"stats": {"active": 0, "waiting": 0, "requests": 0}, "semaphore": asyncio.Semaphore(1)}
+        async with _admitted(app):
+            # 자리가 없어서 대기 중인 요청이 클라이언트 연결 끊김으로 취소됨
+            queued = asyncio.ensure_future(_admitted(app).__aenter__())
+            await asyncio.sleep(0)
+            assert app["stats"]["waiting"] == 1
+            queued.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+        return app
+
+    app = asyncio.run(run())
+    assert app["stats"] == {"active": 0, "waiting": 0, "requests": 1}
+    assert not app["semaphore"].locked()
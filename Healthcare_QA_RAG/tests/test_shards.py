@@ -0,0 +1,30 @@
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ann_index import index_config, index_memory_bytes
+from chunk_store import chunk_store_bytes
+from conftest import make_pages
+from index_manifest import load_or_build_vector_store
+from shards import shard_memory_bytes, shard_name
+
+
+def test_same_file_name_in_different_folders_gets_own_shard(tmp_path, monkeypatch):
+    first, second = str(tmp_path / "a" / "who.pdf"), str(tmp_path / "b" / "who.pdf")
+    assert shard_name(first) != shard_name(second)
+    assert shard_name(first).startswith("who-")
+    # 상대 경로와 절대 경로는 같은 샤드
+    (tmp_path / "a").mkdir()
+    monkeypatch.chdir(tmp_path / "a")
+    assert shard_name("who.pdf") == shard_name(first)
+
+
+def test_shard_memory_counts_chunks_and_full_vectors(tmp_path, embeddings):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0)
+    index_dir = str(tmp_path / "shard")
+    config = index_config("flat", quantizer="int8", dim=8)
+    vectorstore = load_or_build_vector_store(iter(make_pages(10)), splitter, embeddings, index_dir, config)
+
+    size = shard_memory_bytes(vectorstore, index_dir)
+    index_bytes = index_memory_bytes(vectorstore.index)
+    assert index_bytes == vectorstore.index.ntotal * 8
+    assert chunk_store_bytes(index_dir) > 0
+    assert size == index_bytes + chunk_store_bytes(index_dir) + vectorstore.full_vectors.nbytes
@@ -0,0 +1,71 @@
+import pytest
+
+from structure_splitter import StructureTextSplitter
+
+CONSTITUTION = """대한민국헌법
+유구한 역사와 전통에 빛나는 우리 대한국민은 이 헌법을 제정한다.
+제1장 총강
+제1조 ①대한민국은 민주공화국이다.
+②대한민국의 주권은 국민에게 있고, 모든 권력은 국민으로부터 나온다.
+제2조 ①대한민국의 국민이 되는 요건은 법률로 정한다.
+제3조 대한민국의 영토는 한반도와 그 부속도서로 한다.
+"""
+
+MONOGRAPH = """12. Cardiovascular medicines
+Atenolol
+Tablet: 50 mg; 100 mg.
+Uses: hypertension; angina.
+Contraindications: asthma; heart block.
+Dose: Hypertension, by mouth, ADULT 25-50 mg daily.
+WHO Model Formulary 2008 215
+Digoxin
+Tablet: 62.5 micrograms; 250 micrograms.
+Uses: heart failure; atrial fibrillation.
+Adverse effects: nausea; arrhythmias.
+"""
+
+
+def test_constitution_one_chunk_per_article_with_chapter():
+    chunks = StructureTextSplitter("constitution", chunk_size=200).split_text(CONSTITUTION)
+    assert chunks[0] == "유구한 역사와 전통에 빛나는 우리 대한국민은 이 헌법을 제정한다."
+    assert chunks[1].startswith("[제1장 총강]\n제1조 ①대한민국은 민주공화국이다.②")
+    assert chunks[3] == "[제1장 총강]\n제3조 대한민국의 영토는 한반도와 그 부속도서로 한다."
+    assert len(chunks) == 4
+
+
+def test_long_article_split_by_paragraph_keeps_preamble():
+    text = "제1장 총강\n제5조 국군은 국가의 안전보장을 사명으로 한다." + "가" * 40 + "\n①첫째 항." + "나" * 40 + "\n②둘째 항." + "다" * 40
+    chunks = StructureTextSplitter("constitution", chunk_size=100).split_text(text)
+    assert chunks[0].startswith("[제1장 총강]\n제5조 국군은 국가의 안전보장을")
+    assert chunks[1].startswith("[제1장 총강] 제5조\n①첫째 항.")
+    assert chunks[2].startswith("[제1장 총강] 제5조\n②둘째 항.")
+
+
+def test_long_article_without_paragraphs_is_not_dropped():
+    body = "대통령은 법률이 정하는 바에 의하여 사면을 명할 수 있다. " * 10
+    chunks = StructureTextSplitter("constitution", chunk_size=100).split_text(f"제79조 {body}")
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == f"제79조 {body}".replace(" ", "")
+
+
+def test_monograph_units_carry_chapter_and_drug_header():
+    chunks = StructureTextSplitter("monograph", chunk_size=1000).split_text(MONOGRAPH)
+    assert len(chunks) == 1
+    lines = chunks[0].split("\n")
+    assert lines[0] == "[12. Cardiovascular medicines > Atenolol]"
+    assert "[12. Cardiovascular medicines > Digoxin]" in lines
+    assert not any(line.startswith("WHO Model Formulary") for line in lines)
+    assert "Uses: heart failure; atrial fibrillation." in lines
+
+
+def test_monograph_long_section_is_split_with_header():
+    text = "Atenolol\nTablet: 50 mg.\nDose: " + "take with water. " * 20
+    chunks = StructureTextSplitter("monograph", chunk_size=120).split_text(text)
+    assert len(chunks) > 2
+    assert all(chunk.startswith("[Atenolol]\n") for chunk in chunks)
+
+
+def test_unknown_structure_rejected():
+    with pytest.raises(ValueError):
+        StructureTextSplitter("statute")
@@ -0,0 +1,37 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+import query_prep
+from query_prep import QueryPreparer
+from translation_memo import TranslationMemo
+
+
+def _preparer(tmp_path, responses):
+    llm = FakeListChatModel(responses=responses)
+    return QueryPreparer(llm, memo=TranslationMemo(str(tmp_path / "memo.sqlite")))
+
+
+def test_memo_reuses_translation_for_same_question(tmp_path):
+    preparer = _preparer(tmp_path, ["What are the side effects of morphine?", "unused"])
+    assert preparer.prepare("모르핀 부작용은?") == "What are the side effects of morphine?"
+    assert preparer.prepare("모르핀  부작용은") == "What are the side effects of morphine?"
+    assert preparer.stats["llm_calls"] == 1
+    assert preparer.memo.stats()["hits"] == 1
+
+
+def test_memo_ignores_entries_from_another_prompt_version(tmp_path, monkeypatch):
+    _preparer(tmp_path, ["old translation"]).prepare("모르핀 부작용은?")
+
+    monkeypatch.setattr(query_prep, "QUERY_PREP_SYSTEM_PROMPT", query_prep.QUERY_PREP_SYSTEM_PROMPT + "\n7. 새 규칙")
+    preparer = _preparer(tmp_path, ["new translation"])
+    assert preparer.prepare("모르핀 부작용은?") == "new translation"
+    assert preparer.stats["llm_calls"] == 1
+
+
+def test_history_bypasses_memo(tmp_path):
+    preparer = _preparer(tmp_path, ["morphine dose", "What is the dose of morphine?"])
+    preparer.prepare("용량은?")
+    history = [HumanMessage(content="모르핀 부작용은?"), AIMessage(content="메스꺼움")]
+    assert preparer.prepare("용량은?", history) == "What is the dose of morphine?"
+    assert preparer.stats["llm_calls"] == 2
+    assert preparer.stats["with_history"] == 1
@@ -0,0 +1,248 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 체인 run_name -> 단계 이름 (LLM 호출은 가장 가까운 상위 체인의 단계로 기록)
+STAGE_NAMES = {
+    "LLMChain": "translate",
+    "query_prep": "query_prep",
+    "chat_retriever_chain": "rewrite",
+    "stuff_documents_chain": "generate",
+}
+PERCENTILES = (50, 95, 99)
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+def _usage(response):
+    # ChatOpenAI: invoke는 llm_output["token_usage"], stream(stream_usage=True)은 message.usage_metadata
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return 0, 0
+
+
+class RequestTrace(BaseCallbackHandler):
+    # 질문 하나의 단계별 소요 시간/토큰/문서 수 기록
+    # 체인 실행 시 config={"callbacks": [trace]}로 넘기면 LLM/검색기 콜백으로 채워짐
+    def __init__(self, app):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.app = app
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.stages = defaultdict(lambda: {"ms": 0.0, "calls": 0})
+        self.ttft_ms = None
+        self.total_ms = None
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, ms, **fields):
+        with self._lock:
+            entry = self.stages[stage]
+            entry["ms"] += ms
+            entry["calls"] += 1
+            for key, value in fields.items():
+                entry[key] = entry.get(key, 0) + value if isinstance(value, (int, float)) else value
+
+    # 요청 시작부터 첫 답변 토큰까지 (번역/검색 시간 포함)
+    def first_token(self):
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self._t0) * 1000
+
+    def _start(self, run_id, parent_run_id, name):
+        with self._lock:
+            self._runs[run_id] = (parent_run_id, name, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            parent_run_id, name, started = self._runs.pop(run_id, (None, None, None))
+            stage = None
+            # 상위 체인을 따라 올라가며 단계 이름 찾기 (번역 체인 안의 LLM -> translate)
+            while parent_run_id is not None and stage is None:
+                parent_run_id, parent_name, _ = self._runs.get(parent_run_id, (None, None, None))
+                stage = STAGE_NAMES.get(parent_name)
+        if started is None:
+            return None, 0.0
+        return stage, (time.perf_counter() - started) * 1000
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        stage, ms = self._finish(run_id)
+        prompt_tokens, completion_tokens = _usage(response)
+        self.record(stage or "llm", ms, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        _, ms = self._finish(run_id)
+        self.record("retrieve", ms, docs=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def as_dict(self):
+        stages = {stage: dict(entry) for stage, entry in self.stages.items()}
+        # 검색기 시간에서 쿼리 임베딩 시간을 빼면 FAISS 검색 시간
+        if "retrieve" in stages:
+            search_ms = stages["retrieve"]["ms"] - stages.get("embed_query", {}).get("ms", 0.0)
+            stages["search"] = {"ms": max(search_ms, 0.0), "calls": stages["retrieve"]["calls"]}
+        return {
+            "request_id": self.request_id,
+            "app": self.app,
+            "started": self.started,
+            "total_ms": self.total_ms,
+            "ttft_ms": self.ttft_ms,
+            "stages": stages,
+        }
+
+
+class TraceStore:
+    # 최근 window개 요청의 단계별 지연 시간으로 p50/p95/p99 계산
+    # path를 주면 끝난 요청을 JSON lines로 계속 덧붙임
+    def __init__(self, window=1000, path=None):
+        self.traces = deque(maxlen=window)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        record = trace.as_dict()
+        with self._lock:
+            self.traces.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def percentiles(self):
+        with self._lock:
+            traces = list(self.traces)
+        samples = defaultdict(list)
+        for record in traces:
+            for name in ("total_ms", "ttft_ms"):
+                if record[name] is not None:
+                    samples[name[:-3]].append(record[name])
+            for stage, entry in record["stages"].items():
+                samples[stage].append(entry["ms"])
+        result = {}
+        for stage, values in samples.items():
+            values = np.asarray(values)
+            result[stage] = {"count": len(values), "mean": float(values.mean())}
+            for p in PERCENTILES:
+                result[stage][f"p{p}"] = float(np.percentile(values, p))
+        return result
+
+    def recent(self, n=20):
+        with self._lock:
+            return list(self.traces)[-n:]
+
+    def to_jsonl(self):
+        with self._lock:
+            return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self.traces)
+
+    def export_jsonl(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+
+# 프로세스 전체에서 공유하는 저장소 (RAG_TRACE_FILE 환경변수를 주면 JSONL로도 남김)
+trace_store = TraceStore(path=os.environ.get("RAG_TRACE_FILE"))
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+# 현재 요청의 trace를 콜백으로 붙인 체인 config
+def trace_config(config=None):
+    config = dict(config or {})
+    trace = current_trace()
+    if trace is not None:
+        config["callbacks"] = list(config.get("callbacks") or []) + [trace]
+    return config
+
+
+@contextmanager
+def trace_request(app, store=trace_store):
+    trace = RequestTrace(app)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.total_ms = (time.perf_counter() - trace._t0) * 1000
+        store.add(trace)
+        logger.info("trace %s: %s", trace.request_id, json.dumps(trace.as_dict()["stages"]))
+
+
+class TracedEmbeddings(Embeddings):
+    # 검색기 안의 쿼리 임베딩 시간을 현재 요청 trace에 embed_query 단계로 기록
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text):
+        started = time.perf_counter()
+        vector = self.embeddings.embed_query(text)
+        trace = current_trace()
+        if trace is not None:
+            trace.record("embed_query", (time.perf_counter() - started) * 1000)
+        return vector
+
+    async def aembed_query(self, text):
+        started = time.perf_counter()
+        vector = await self.embeddings.aembed_query(text)
+        trace = current_trace()
+        if trace is not None:
+            trace.record("embed_query", (time.perf_counter() - started) * 1000)
+        return vector
+
+    def __getattr__(self, name):
+        return getattr(self.embeddings, name)
+
+
+# 벡터스토어의 쿼리 임베딩을 계측 (캐시된 같은 벡터스토어에 여러 번 불러도 한 번만 감쌈)
+def trace_vectorstore(vectorstore):
+    if not isinstance(vectorstore.embedding_function, TracedEmbeddings):
+        vectorstore.embedding_function = TracedEmbeddings(vectorstore.embedding_function)
+    return vectorstore
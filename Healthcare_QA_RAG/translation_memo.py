@@ -0,0 +1,91 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from semantic_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMO_PATH = os.environ.get("TRANSLATION_MEMO_PATH", ".cache/translations.sqlite")
+
+
+# 번역 프롬프트/모델 버전 + 정규화한 질문 (프롬프트나 모델이 바뀌면 이전 번역은 적중하지 않음)
+def memo_key(text, version=""):
+    return f"{version}\x00{normalize_question(text)}" if version else normalize_question(text)
+
+
+class TranslationMemo:
+    # 한국어 질문(정규화) -> 영어 번역 결과를 sqlite에 영구 저장
+    # 처음 번역할 때 걸린 LLM 시간을 같이 저장해서, 적중할 때마다 절약한 시간을 누적
+    # version: 번역 프롬프트/모델 버전 (query_prep.query_prep_version)
+    def __init__(self, path=DEFAULT_MEMO_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY, source TEXT NOT NULL, translated TEXT NOT NULL,"
+            " latency_ms REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, text, version=""):
+        key = memo_key(text, version)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translated, latency_ms FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE translations SET hits = hits + 1 WHERE key = ?", (key,))
+            self._conn.commit()
+        self.hits += 1
+        self.saved_ms += row[1]
+        return row[0]
+
+    def put(self, text, translated, latency_ms, version=""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, source, translated, latency_ms, hits, created)"
+                " VALUES (?, ?, ?, ?, 0, ?)",
+                (memo_key(text, version), text, translated, latency_ms, time.time()),
+            )
+            self._conn.commit()
+
+    # 메모에 있으면 바로 반환, 없으면 translate_fn(text)로 번역해서 저장
+    def translate(self, text, translate_fn, version=""):
+        cached = self.get(text, version)
+        if cached is not None:
+            logger.info("translation memo hit (saved %.0f ms so far)", self.saved_ms)
+            return cached
+        started = time.perf_counter()
+        translated = translate_fn(text)
+        self.put(text, translated, (time.perf_counter() - started) * 1000, version)
+        return translated
+
+    def stats(self):
+        with self._lock:
+            entries, total_hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM translations"
+            ).fetchone()
+            saved_total = self._conn.execute(
+                "SELECT COALESCE(SUM(hits * latency_ms), 0) FROM translations"
+            ).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_ms": self.saved_ms,
+            "entries": entries,
+            "total_hits": total_hits,
+            "total_saved_ms": saved_total,
+        }
@@ -1,55 +1,67 @@
 import os
+import logging
+import uuid
 import streamlit as st
 
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains import create_history_aware_retriever
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.streamlit import StreamlitChatMessageHistory
+
+# 공용 모듈(Healthcare_QA_RAG 폴더) 사용
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Healthcare_QA_RAG"))
+from chat_store import ChatStore, SQLiteChatMessageHistory, create_summarizer
+from embedding_cache import cached_openai_embeddings
+from index_manifest import load_or_build_pdf_vector_store
+from lexical_index import HybridRetriever, article_fast_path, load_or_build_lexical_index
+from relevance import RelevanceGate, ScoredRetriever, create_gated_retrieval_chain, load_threshold
+from streaming import AnswerStream
+from structure_splitter import StructureTextSplitter
+from tracing import trace_request, trace_vectorstore
 
 from dotenv import load_dotenv
 load_dotenv() # .env 파일에서 환경변수 로드
 
-#cache_resource로 한번 실행한 결과 캐싱해두기
-@st.cache_resource
-def load_pdf(file_path):
-    loader = PyPDFLoader(file_path)
-    return loader.load()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-#텍스트 청크들을 FAISS 안에 임베딩 벡터로 저장
-@st.cache_resource
-def create_vector_store(_docs):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50)
-    split_docs = text_splitter.split_documents(_docs)
-    embeddings = OpenAIEmbeddings(model='text-embedding-3-small')
-    vectorstore = FAISS.from_documents(split_docs, embeddings)
-    
-    # 저장
-    # FAISS 자체 저장 방식 사용
-    vectorstore.save_local("faiss_index")
-    return vectorstore
+NOT_FOUND_ANSWER = (
+    "죄송합니다. 헌법에서 질문과 관련된 내용을 찾지 못했습니다.\n\n"
+    "헌법 조문 번호(예: 제10조)나 관련 용어를 포함해서 다시 질문해 주세요."
+)
 
+#cache_resource로 한번 실행한 결과 캐싱해두기
 #만약 기존에 저장해둔 FAISSDB가 있는 경우, 이를 로드
 @st.cache_resource
-def get_vectorstore(_docs):
-    persist_directory = "faiss_index/index.faiss"
-    if os.path.exists(persist_directory):
-        embeddings = OpenAIEmbeddings(model='text-embedding-3-small')
-        return FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    else:
-        return create_vector_store(_docs)
+def get_vectorstore(file_path):
+    # 저장된 인덱스의 PDF 해시/설정이 그대로면 PDF 파싱 없이 바로 로드
+    # 아니면 (캐시된) 페이지 텍스트를 manifest와 비교해서 바뀐 페이지만 다시 임베딩
+    # 조문 단위로 자르고 겹침 없음 (긴 조문만 항 단위로 나눔)
+    text_splitter = StructureTextSplitter("constitution", chunk_size=1000)
+    embeddings = cached_openai_embeddings("text-embedding-3-small")
+    return load_or_build_pdf_vector_store([file_path], text_splitter, embeddings, "faiss_index")
+
+#조문 단위 BM25 역색인 + 조/항 번호 조회 표 (임베딩 호출 없음)
+#조문 표는 faiss_index 옆에 저장해두고 PDF가 그대로면 PDF 파싱 없이 로드
+@st.cache_resource
+def get_lexical_index(file_path):
+    return load_or_build_lexical_index([file_path], "faiss_index")
     
 # PDF 문서 로드-벡터 DB 저장-검색기-히스토리 모두 합친 Chain 구축
 @st.cache_resource
 def initialize_components(selected_model):
     file_path = r"./data/대한민국헌법(헌법)(제00010호)(19880225).pdf"
-    pages = load_pdf(file_path)
-    vectorstore = get_vectorstore(pages)
-    retriever = vectorstore.as_retriever()
+    # 쿼리 임베딩/검색 시간을 단계별로 기록
+    vectorstore = trace_vectorstore(get_vectorstore(file_path))
+    lexical_index = get_lexical_index(file_path)
+    # 키워드형 질문은 BM25만, 나머지는 BM25 + FAISS 결과를 RRF로 합침
+    # FAISS 결과에는 관련도(metadata["relevance_score"])를 붙여서 gate가 판단할 수 있게 함
+    retriever = HybridRetriever(lexical_index=lexical_index, vector_retriever=ScoredRetriever(vectorstore=vectorstore))
+    # 관련 문서가 없는 질문(FAISS 결과의 가장 높은 관련도가 threshold 미만)은 LLM 호출 없이 템플릿 답변
+    # threshold는 헌법 질문 파일로 보정: python Healthcare_QA_RAG/relevance.py faiss_index --in-domain ... --off-topic ...
+    relevance_gate = RelevanceGate(load_threshold("faiss_index"), answer=NOT_FOUND_ANSWER)
 
     # 채팅 히스토리 요약 시스템 프롬프트
     contextualize_q_system_prompt = """Given a chat history and the latest user question \
@@ -80,17 +92,34 @@ def initialize_components(selected_model):
         ]
     )
 
-    llm = ChatOpenAI(model=selected_model)
+    llm = ChatOpenAI(model=selected_model, stream_usage=True)
     history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    # "제10조", "제 37조 2항"처럼 조문 번호가 있으면 질문 재작성/임베딩 없이 바로 조문 조회 (gate 거치지 않음)
+    retrieve_documents = article_fast_path(lexical_index, history_aware_retriever | relevance_gate.as_runnable())
+    rag_chain = create_gated_retrieval_chain(retrieve_documents, question_answer_chain, relevance_gate)
     return rag_chain
 
+# 대화 기록은 sqlite에 저장하고, 프롬프트에는 최근 CHAT_HISTORY_TOKENS 토큰 안의 대화 + 그 이전 대화의 요약만 넣음
+@st.cache_resource
+def get_chat_store():
+    return ChatStore(os.path.join(".cache", "constitution_chats.sqlite"))
+
+@st.cache_resource
+def get_summarizer():
+    return create_summarizer(ChatOpenAI(model="gpt-4o-mini"), topic="헌법 Q&A 챗봇",
+                             focus="언급된 조문 번호와 주제, 사용자가 궁금해한 점")
+
+def get_chat_history():
+    if "chat_id" not in st.session_state:
+        st.session_state["chat_id"] = uuid.uuid4().hex
+    return SQLiteChatMessageHistory(get_chat_store(), st.session_state["chat_id"], summarizer=get_summarizer())
+
 # Streamlit UI
 st.header("헌법 Q&A 챗봇 💬 📚")
 option = st.selectbox("Select GPT Model", ("gpt-4o-mini", "gpt-3.5-turbo-0125"))
 rag_chain = initialize_components(option)
-chat_history = StreamlitChatMessageHistory(key="chat_messages")
+chat_history = get_chat_history()
 
 conversational_rag_chain = RunnableWithMessageHistory(
     rag_chain,
@@ -105,21 +134,22 @@ if "messages" not in st.session_state:
     st.session_state["messages"] = [{"role": "assistant", 
                                      "content": "헌법에 대해 무엇이든 물어보세요!"}]
 
-for msg in chat_history.messages:
+# 화면에는 요약된 대화까지 전체 기록을 표시
+for msg in chat_history.all_messages():
     st.chat_message(msg.type).write(msg.content)
 
 
+def show_sources(context):
+    with st.expander("참고 문서 확인"):
+        for doc in context:
+            st.markdown(doc.metadata['source'], help=doc.page_content)
+
 if prompt_message := st.chat_input("Your question"):
     st.chat_message("human").write(prompt_message)
     with st.chat_message("ai"):
-        with st.spinner("Thinking..."):
-            config = {"configurable": {"session_id": "any"}}
-            response = conversational_rag_chain.invoke(
-                {"input": prompt_message},
-                config)
-            
-            answer = response['answer']
-            st.write(answer)
-            with st.expander("참고 문서 확인"):
-                for doc in response['context']:
-                    st.markdown(doc.metadata['source'], help=doc.page_content)
+        config = {"configurable": {"session_id": "any"}}
+        # 답변은 토큰 단위로 바로 출력하고, 참고 문서는 검색이 끝나는 즉시 답변 아래에 표시
+        answer_box = st.container()
+        with trace_request("constitution"):
+            response = AnswerStream(conversational_rag_chain, {"input": prompt_message}, config, on_context=show_sources)
+            answer_box.write_stream(response)